@@ -19,8 +19,9 @@ def create_batch_inlists(csv_file):
     # Create batch directory if it doesn't exist
     os.makedirs(batch_dir, exist_ok=True)
     
-    # Ask user about pgstar settings
-    enable_pgstar = input("Do you want to enable pgstar for batch runs? (yes/no): ").lower()
+    # Ask user about pgstar settings; anything but yes keeps it off
+    enable_pgstar = input("Enable pgstar for batch runs? It slows them down; "
+                          "python -m batch.dashboard follows them live instead (yes/[no]): ").strip().lower()
     pgstar_setting = "pgstar_flag = .true." if enable_pgstar.startswith('y') else "pgstar_flag = .false."
     
     # Read CSV file, skipping header
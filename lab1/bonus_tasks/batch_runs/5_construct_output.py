@@ -1,23 +1,20 @@
 import os
+import sys
 import csv
-import glob
+import time
+import argparse
 import re
 import numpy as np
-from mesa_reader import MesaData
-
-def parse_run_name(run_name):
-    parts = run_name[7:].split("_")
-    mass = float(parts[0][1:])
-    z = float(parts[1][1:])
-    if "noovs" in run_name:
-        scheme = "none"
-        fov = 0.0
-        f0 = 0.0
-    else:
-        scheme = parts[2]
-        fov = float(parts[3][3:]) if len(parts) > 3 and parts[3].startswith("fov") else 0.0
-        f0 = float(parts[4][2:]) if len(parts) > 4 and parts[4].startswith("f0") else 0.0
-    return mass, z, scheme, fov, f0
+
+# Shared readers live with the analysis scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python_analysis"))
+from batch.cache import atomic_open, file_fingerprint, load_json, save_json
+from batch.catalog import RunCatalog
+from batch.loader import read_mesa_table, read_last_rows, history_path, final_profile_path
+from batch.overshoot import fit_final_profile
+
+# History columns the summary reads at TAMS
+HISTORY_COLUMNS = ["star_age", "log_Teff", "log_L", "center_h1", "he_core_mass", "conv_mx1_top_r"]
 
 def find_tams_index(history, h1_limit=0.001):
     """Find the model index closest to TAMS based on central H depletion."""
@@ -30,6 +27,21 @@ def find_tams_index(history, h1_limit=0.001):
         return tams_indices[0]  # Return first index where condition is met
     return -1  # Return last index if condition never met
 
+def read_tams_history(hist_file, h1_limit=0.001, tail_rows=8):
+    """
+    Load just enough of a history file to find TAMS.
+
+    With the xa_central_lower_limit stopping condition TAMS is the last row, so first
+    read only the last few rows. They are used if center_h1 crosses h1_limit inside
+    them (i.e. the first of them is still above the limit); otherwise the whole file
+    is parsed.
+    """
+    tail = read_last_rows(hist_file, tail_rows)
+    if hasattr(tail, 'center_h1') and len(tail) > 1:
+        if tail.center_h1[0] > h1_limit and np.any(tail.center_h1 <= h1_limit):
+            return tail
+    return read_mesa_table(hist_file)
+
 def extract_tams_values(history):
     """Return values at TAMS."""
     tams_idx = find_tams_index(history)
@@ -87,81 +99,220 @@ def load_runtime_data(timings_file="run_timings.csv"):
     
     return runtimes
 
-def write_summary_csv(output_csv="../filled_MESA_Lab.csv", base_dir="../runs", timings_file="../run_timings.csv"):
-    # Load runtime data
-    runtimes = load_runtime_data(timings_file)
+FIELDNAMES = [
+    "YOUR NAME", "initial mass  [Msol]", "initial metallicity", 
+    "overshoot scheme", "overshoot parameter (f_ov)", "overshoot f0", 
+    "", "log_Teff [K]", "log_L [Lsol]", "Core mass [Msol]", 
+    "Core radius [Rsol]", "Age [Myr]", "Runtime [s]", "Status",
+    "f_ov fit", "Overshoot extent [Hp]"
+]
+
+# Bump when the values derived per run change, so cached runs are read again
+SUMMARY_VERSION = 3
+
+def extract_run_values(hist_file, run_dir=None):
+    """
+    Values at TAMS for one run, as plain floats that can be stored in the cache.
+    With run_dir, the overshoot measured from its final profile is added (None if absent).
+    """
+    history = read_tams_history(hist_file)
+    if history.discarded_rows:
+        print(f"{hist_file}: dropped {history.discarded_rows} rows superseded by a restart")
+    return run_values(history, fit_final_profile(run_dir) if run_dir else None)
+
+def run_values(history, fit=None):
+    """Values at TAMS from an already loaded history, plus an overshoot fit (see batch.overshoot.fit_values)."""
+    age, log_Teff, log_L, he_core_mass, tams_idx = extract_tams_values(history)
+    core_radius = extract_core_radius(history, tams_idx)
+    values = {
+        "age": float(age),
+        "log_Teff": float(log_Teff),
+        "log_L": float(log_L),
+        "core_mass": float(he_core_mass),
+        "core_radius": None if core_radius == "NA" else float(core_radius)
+    }
     
-    # Use the exact column headers from the spreadsheet plus the new runtime column
-    fieldnames = [
-        "YOUR NAME", "initial mass  [Msol]", "initial metallicity", 
-        "overshoot scheme", "overshoot parameter (f_ov)", "overshoot f0", 
-        "", "log_Teff [K]", "log_L [Lsol]", "Core mass [Msol]", 
-        "Core radius [Rsol]", "Age [Myr]", "Runtime [s]", "Status"
-    ]
+    for key in ("f_ov", "extent_hp"):
+        value = fit[key] if fit else None
+        values[key] = value if value is not None and np.isfinite(value) else None
+    return values
+
+def format_row(params, values, runtime):
+    """One row of the summary CSV."""
+    scheme = params["scheme"]
+    core_radius = values["core_radius"]
     
-    run_dirs = [d for d in glob.glob(os.path.join(base_dir, "*")) if os.path.isdir(d)]
+    def optional(key, digits=4):
+        value = values.get(key)
+        return round(value, digits) if value is not None else ""
     
-    with open(output_csv, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for run_dir in run_dirs:
-            run_name = os.path.basename(run_dir)
-            if not run_name.startswith("inlist_M"):
-                continue
-                
-            logs_dir = os.path.join(run_dir, "LOGS")
-            hist_file = os.path.join(logs_dir, "history.data")
+    return {
+        "YOUR NAME": "",  # Leave blank for manual entry
+        "initial mass  [Msol]": params["mass"],
+        "initial metallicity": params["metallicity"],
+        "overshoot scheme": "no overshooting" if scheme == "none" else scheme,
+        "overshoot parameter (f_ov)": params["fov"],
+        "overshoot f0": params["f0"],
+        "": "",  # Empty column
+        "log_Teff [K]": round(values["log_Teff"], 3),
+        "log_L [Lsol]": round(values["log_L"], 3),
+        "Core mass [Msol]": round(values["core_mass"], 5),
+        "Core radius [Rsol]": round(core_radius, 5) if core_radius is not None else "",
+        "Age [Myr]": round(values["age"], 2),
+        "Runtime [s]": runtime["runtime_seconds"] if runtime else "",
+        "Status": runtime["status"] if runtime else "not_completed",
+        "f_ov fit": optional("f_ov"),
+        "Overshoot extent [Hp]": optional("extent_hp")
+    }
+
+def write_binary_table(rows, names, path, fmt="npz"):
+    """
+    Write the summary as a typed table: .npz, or Parquet if pandas can write it.
+    Missing values become NaN.
+    """
+    def column(field, dtype=float):
+        values = [row[field] if row[field] != "" else np.nan for row in rows]
+        return np.array(values, dtype=dtype)
+
+    columns = {
+        "run_name": np.array(names, dtype=str),
+        "mass": column("initial mass  [Msol]"),
+        "metallicity": column("initial metallicity"),
+        "scheme": np.array([row["overshoot scheme"] for row in rows], dtype=str),
+        "fov": column("overshoot parameter (f_ov)"),
+        "f0": column("overshoot f0"),
+        "log_Teff": column("log_Teff [K]"),
+        "log_L": column("log_L [Lsol]"),
+        "core_mass": column("Core mass [Msol]"),
+        "core_radius": column("Core radius [Rsol]"),
+        "age_myr": column("Age [Myr]"),
+        "runtime_seconds": column("Runtime [s]"),
+        "status": np.array([row["Status"] for row in rows], dtype=str),
+        "f_ov_fit": column("f_ov fit"),
+        "overshoot_extent_hp": column("Overshoot extent [Hp]")
+    }
+
+    if fmt == "parquet":
+        try:
+            import pandas as pd
+            with atomic_open(path, "wb") as f:
+                pd.DataFrame(columns).to_parquet(f)
+            return path
+        except ImportError:
+            print("Warning: Parquet needs pandas with pyarrow or fastparquet, writing .npz instead.")
+            path = os.path.splitext(path)[0] + ".npz"
+
+    with atomic_open(path, "wb") as f:
+        np.savez(f, **columns)
+    return path
+
+def write_summary_csv(output_csv="../filled_MESA_Lab.csv", base_dir="../runs", timings_file="../run_timings.csv",
+                      cache_file=None, binary=None, force=False, values=None):
+    """
+    Bring the summary CSV up to date with the runs directory.
+
+    Values at TAMS are cached per run, keyed on the fingerprints of its history file and
+    final profile, so only runs whose output changed are re-read. Outputs are rewritten (atomically) only
+    when something changed. binary can be "npz" or "parquet" to also write a typed
+    table next to the CSV. values maps run names to values already derived from loaded
+    data (see run_values); those runs are not read again.
+
+    Returns the number of runs that were (re)processed.
+    """
+    if cache_file is None:
+        cache_file = os.path.join(os.path.dirname(output_csv) or ".", ".summary_cache.json")
+    cache = {} if force else load_json(cache_file, {})
+    if cache.get("version") != SUMMARY_VERSION:
+        cache = {}
+    entries = cache.get("runs", {})
+    
+    # Load runtime data, unless the timing file is unchanged since last time
+    timings_fingerprint = file_fingerprint(timings_file)
+    if "runtimes" in cache and cache.get("timings_fingerprint") == timings_fingerprint:
+        runtimes = cache["runtimes"]
+    else:
+        runtimes = load_runtime_data(timings_file)
+    
+    catalog = RunCatalog(base_dir)
+    
+    new_entries = {}
+    rows = []
+    names = []
+    n_processed = 0
+    for run_name, params in catalog.select().items():
+        hist_file = history_path(params["path"])
+        if file_fingerprint(hist_file) is None:
+            continue
+        profile_file = final_profile_path(params["path"])
+        fingerprint = [file_fingerprint(hist_file), file_fingerprint(profile_file) if profile_file else None]
             
-            if not os.path.exists(hist_file):
-                continue
-                
+        entry = entries.get(run_name)
+        if values is not None and run_name in values:
+            if entry is None or entry["fingerprint"] != fingerprint:
+                n_processed += 1
+            entry = {"fingerprint": fingerprint, "values": values[run_name]}
+        elif entry is None or entry["fingerprint"] != fingerprint:
             try:
-                # Load history data
-                history = MesaData(hist_file)
-                
-                # Parse parameters from run name
-                mass, z, scheme, fov, f0 = parse_run_name(run_name)
-                
-                # Extract values at TAMS
-                age, log_Teff, log_L, he_core_mass, tams_idx = extract_tams_values(history)
-                core_radius = extract_core_radius(history, tams_idx)
-                
-                # Get runtime data if available
-                runtime_seconds = ""
-                status = ""
-                if run_name in runtimes:
-                    runtime_seconds = runtimes[run_name]['runtime_seconds']
-                    status = runtimes[run_name]['status']
-                else:
-                    runtime_seconds = ''
-                    status = 'not_completed'
-
-
-                # Format values for output
-                writer.writerow({
-                    "YOUR NAME": "",  # Leave blank for manual entry
-                    "initial mass  [Msol]": mass,
-                    "initial metallicity": z,
-                    "overshoot scheme": "no overshooting" if scheme == "none" else scheme,
-                    "overshoot parameter (f_ov)": fov,
-                    "overshoot f0": f0,
-                    "": "",  # Empty column
-                    "log_Teff [K]": round(log_Teff, 3) if isinstance(log_Teff, float) else "",
-                    "log_L [Lsol]": round(log_L, 3) if isinstance(log_L, float) else "",
-                    "Core mass [Msol]": round(he_core_mass, 5) if isinstance(he_core_mass, float) else "",
-                    "Core radius [Rsol]": round(core_radius, 5) if isinstance(core_radius, (float, int)) and core_radius != "NA" else "",
-                    "Age [Myr]": round(age, 2) if isinstance(age, float) else "",
-                    "Runtime [s]": runtime_seconds,
-                    "Status": status
-                })
-                
+                entry = {"fingerprint": fingerprint, "values": extract_run_values(hist_file, params["path"])}
+                n_processed += 1
                 print(f"Processed: {run_name}")
-                
             except Exception as e:
+                # Remembered until the run's files change, so --watch does not re-read it every time
                 print(f"Error processing {run_name}: {e}")
+                entry = {"fingerprint": fingerprint, "error": f"{type(e).__name__}: {e}"}
+        
+        new_entries[run_name] = entry
+        if "error" in entry:
+            continue
+        names.append(run_name)
+        rows.append(format_row(params, entry["values"], runtimes.get(run_name)))
 
+    new_cache = {
+        "version": SUMMARY_VERSION,
+        "runs": new_entries,
+        "runtimes": runtimes,
+        "timings_fingerprint": timings_fingerprint,
+        "params": {name: {k: catalog[name][k] for k in ("mass", "metallicity", "scheme", "fov", "f0")}
+                   for name in names}
+    }
+    binary_path = os.path.splitext(output_csv)[0] + "." + binary if binary else None
+    up_to_date = new_cache == cache and os.path.exists(output_csv)
+    if up_to_date and (binary_path is None or os.path.exists(binary_path)):
+        return 0
+    
+    with atomic_open(output_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
     print(f"CSV summary saved to: {output_csv}")
+    
+    if binary:
+        path = write_binary_table(rows, names, binary_path, fmt=binary)
+        print(f"Binary summary saved to: {path}")
+    
+    save_json(cache_file, new_cache)
+    return n_processed
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise batch runs at TAMS into a CSV table.")
+    parser.add_argument("--output", default="../filled_MESA_Lab.csv", help="summary CSV to write")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--timings", default="../run_timings.csv", help="runtime CSV written by 3_run_batch")
+    parser.add_argument("--binary", choices=["npz", "parquet"], help="also write a typed table next to the CSV")
+    parser.add_argument("--force", action="store_true", help="ignore the cache and re-read every run")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="keep refreshing the summary at this interval until Ctrl-C")
+    args = parser.parse_args()
+    
+    kwargs = dict(output_csv=args.output, base_dir=args.runs, timings_file=args.timings, binary=args.binary)
+    write_summary_csv(force=args.force, **kwargs)
+    if args.watch:
+        try:
+            while True:
+                time.sleep(args.watch)
+                write_summary_csv(**kwargs)
+        except KeyboardInterrupt:
+            pass
 
 if __name__ == "__main__":
-    write_summary_csv()
\ No newline at end of file
+    main()
@@ -0,0 +1,223 @@
+"""
+align.py - Runs aligned on main-sequence phase, and their differences from no overshooting
+
+Runs of different overshooting have different main-sequence lifetimes, so comparing
+them at the same age mixes up how long the core burns with how it recedes. Here every
+run is mapped onto a common phase axis running from 0 to 1 at TAMS:
+
+    age         tau = t / t_TAMS
+    depletion   1 - X_c / X_c,0, scaled to reach 1 at TAMS (X_c = h1_limit), with
+                X_c,0 the central hydrogen at ZAMS
+
+and resampled at the same phases. The whole grid is stacked into padded arrays (see
+phases.py) and resampled at once with its vectorized search, so aligned
+values are (n_runs, n_points) arrays. Each run is then compared with the noovs run of
+the same mass and metallicity by plain subtraction, and the differences are drawn with
+one panel per (M, Z).
+
+    python -m batch.align --phase depletion --quantity conv_core_fraction
+"""
+
+import os
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
+
+from batch.catalog import RunCatalog
+from batch.loader import load_histories, report_errors
+from batch.phases import stack_runs, detect_phases, interp_rows, positions_at
+from batch.render import show
+
+PHASES = {
+    "age": r"$\tau = t / t_{\rm TAMS}$",
+    "depletion": r"$1 - X_c / X_{c,0}$ (1 at TAMS)",
+}
+
+# name -> (columns, value from the stacked arrays, axis label)
+QUANTITIES = {
+    "core_mass_fraction": (("he_core_mass", "star_mass"), lambda a: a["he_core_mass"] / a["star_mass"],
+                           r"$M_{\rm He\,core} / M_\star$"),
+    "conv_core_fraction": (("mass_conv_core", "star_mass"), lambda a: a["mass_conv_core"] / a["star_mass"],
+                           r"$M_{\rm conv\,core} / M_\star$"),
+    "log_L": (("log_L",), lambda a: a["log_L"], r"$\log(L/L_\odot)$"),
+    "log_Teff": (("log_Teff",), lambda a: a["log_Teff"], r"$\log(T_{\rm eff}/{\rm K})$"),
+}
+
+ALIGN_COLUMNS = ("star_age", "center_h1", "log_Lnuc", "log_L")
+
+
+def phase_coordinate(arrays, phases, phase="age", h1_limit=0.001):
+    """
+    Phase of every row of the stacked histories, (n_runs, n_rows).
+
+    The phase is made non-decreasing (small bumps in center_h1 are flattened) and held
+    at its last value over the padding, as positions_at needs. Depletion is
+    negative before ZAMS. Runs without TAMS are all NaN.
+    """
+    if phase == "age":
+        p = arrays["star_age"] / phases["TAMS"]["star_age"][:, None]
+    elif phase == "depletion":
+        x0 = phases["ZAMS"]["center_h1"]
+        x0 = np.where(np.isfinite(x0), x0, arrays["center_h1"][:, 0])
+        p = (x0[:, None] - arrays["center_h1"]) / (x0 - h1_limit)[:, None]
+    else:
+        raise ValueError(f"Unknown phase {phase!r}, use one of {', '.join(PHASES)}")
+
+    with np.errstate(invalid="ignore"):
+        p = np.fmax.accumulate(p, axis=1)
+    p[~np.isfinite(phases["TAMS"]["star_age"])] = np.nan
+    return p
+
+
+def align_runs(runs_data, quantities=tuple(QUANTITIES), phase="age", n_points=200, h1_limit=0.001):
+    """
+    Resample every run onto n_points phases from 0 to TAMS.
+
+    Returns a dict with
+        run_names   list of run names (rows of every array)
+        phase       (n_points,) common phase axis
+        values      quantity -> (n_runs, n_points) array, NaN for runs that did not reach TAMS
+        complete    (n_runs,) bool, True if the run reached TAMS
+    """
+    quantities = list(quantities)
+    grid = np.linspace(0.0, 1.0, n_points)
+    columns = set(ALIGN_COLUMNS).union(*(QUANTITIES[q][0] for q in quantities))
+    run_names, lengths, arrays = stack_runs(runs_data, columns)
+    if not run_names:
+        return {"run_names": [], "phase": grid, "values": {q: np.empty((0, n_points)) for q in quantities},
+                "complete": np.zeros(0, dtype=bool)}
+
+    phases = detect_phases(runs_data, h1_limit=h1_limit, quantities=("star_age", "center_h1"))
+    p = phase_coordinate(arrays, phases, phase, h1_limit)
+    complete = np.all(np.isfinite(p), axis=1) & (lengths >= 2)
+
+    # One search over all runs finds the fractional row of every (run, phase); the search
+    # needs each run to start at zero
+    start = np.where(complete, p[:, 0], 0.0)[:, None]
+    s = np.where(complete[:, None], p - start, 0.0)
+    targets = np.where(complete[:, None], grid[None, :] - start, np.nan)
+    pos = positions_at(s, lengths, targets)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = {q: interp_rows(QUANTITIES[q][1](arrays), pos) for q in quantities}
+    return {"run_names": run_names, "phase": grid, "values": values, "complete": complete}
+
+
+def baseline_index(run_names, run_params, complete):
+    """Row of the noovs run with the same mass and metallicity as each run, -1 where there is none."""
+    mass = np.array([run_params[name]["mass"] for name in run_names], dtype=float)
+    z = np.array([run_params[name]["metallicity"] for name in run_names], dtype=float)
+    is_baseline = np.array([run_params[name]["scheme"] == "none" for name in run_names])
+
+    match = np.isclose(mass[:, None], mass[None, :], rtol=1e-9, atol=0.0) & \
+        np.isclose(z[:, None], z[None, :], rtol=1e-9, atol=0.0) & (is_baseline & complete)[None, :]
+    return np.where(match.any(axis=1), match.argmax(axis=1), -1)
+
+
+def baseline_differences(aligned, run_params):
+    """
+    Aligned values minus those of the matching noovs run, at every phase.
+
+    Returns (baseline, differences): the baseline row of each run (-1 for noovs runs and
+    runs without a baseline) and quantity -> (n_runs, n_points) array, NaN for those runs.
+    """
+    baseline = baseline_index(aligned["run_names"], run_params, aligned["complete"])
+    baseline[baseline == np.arange(len(baseline))] = -1
+    has_baseline = (baseline >= 0)[:, None]
+    differences = {q: np.where(has_baseline, v - v[np.maximum(baseline, 0)], np.nan)
+                   for q, v in aligned["values"].items()}
+    return baseline, differences
+
+
+def plot_differences(aligned, baseline, differences, run_params, quantity, phase="age", plots_dir="plots"):
+    """One panel per (M, Z) with the difference from noovs of every run, coloured by fov."""
+    os.makedirs(plots_dir, exist_ok=True)
+    run_names = aligned["run_names"]
+    rows = [i for i in range(len(run_names)) if baseline[i] >= 0]
+    if not rows:
+        print("No runs with a complete noovs baseline to compare with")
+        return None
+
+    masses = sorted({run_params[run_names[i]]["mass"] for i in rows})
+    metallicities = sorted({run_params[run_names[i]]["metallicity"] for i in rows})
+    fig, axes = plt.subplots(len(masses), len(metallicities), figsize=(6 * len(metallicities), 4 * len(masses)),
+                             sharex=True, squeeze=False)
+
+    scheme_styles = {"exponential": "-", "step": "--"}
+    fovs = [run_params[run_names[i]]["fov"] for i in rows]
+    norm = Normalize(vmin=min(fovs), vmax=max(fovs) if max(fovs) > min(fovs) else min(fovs) + 1)
+    used = np.zeros(axes.shape, dtype=bool)
+    for i in rows:
+        params = run_params[run_names[i]]
+        r, c = masses.index(params["mass"]), metallicities.index(params["metallicity"])
+        axes[r, c].plot(aligned["phase"], differences[quantity][i], color=plt.cm.viridis(norm(params["fov"])),
+                        linestyle=scheme_styles.get(params["scheme"], ":"), linewidth=1.5)
+        used[r, c] = True
+
+    for (r, c), ax in np.ndenumerate(axes):
+        if not used[r, c]:
+            ax.set_visible(False)
+            continue
+        ax.axhline(0.0, color="black", linewidth=1)
+        ax.set_title(f"M = {masses[r]:g} M$_\\odot$, Z = {metallicities[c]:g}", fontsize=12)
+        ax.grid(alpha=0.3)
+        ax.set_xlim(0, 1)
+        if c == 0:
+            ax.set_ylabel(f"$\\Delta$ {QUANTITIES[quantity][2]}", fontsize=12)
+        if not used[r + 1:, c].any():
+            ax.xaxis.set_tick_params(labelbottom=True)
+            ax.set_xlabel(PHASES[phase], fontsize=12)
+
+    first = axes[used][0]
+    for scheme, style in scheme_styles.items():
+        first.plot([], [], style, color="gray", label=scheme)
+    first.legend(fontsize=9, loc="best")
+    fig.colorbar(ScalarMappable(norm=norm, cmap="viridis"), ax=axes, label="f$_{ov}$")
+    fig.suptitle(f"{QUANTITIES[quantity][2]} minus no overshooting, aligned on MS phase", fontsize=14)
+
+    path = os.path.join(plots_dir, f"{quantity}_minus_noovs_vs_{phase}.png")
+    plt.savefig(path, dpi=200)
+    show()
+    plt.close(fig)
+    print(f"Saved difference plot to {path}")
+    return fig
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Align the runs on MS phase and plot their differences from noovs.")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--plots", default="plots", help="directory to save figures in")
+    parser.add_argument("--phase", choices=list(PHASES), default="age", help="phase axis to align on")
+    parser.add_argument("--quantity", choices=list(QUANTITIES), nargs="+",
+                        default=["conv_core_fraction"], help="quantities to compare")
+    parser.add_argument("--points", type=int, default=200, help="phases sampled between 0 and TAMS")
+    parser.add_argument("--output", help="also write the aligned values and differences to this .npz")
+    parser.add_argument("--workers", type=int, help="worker processes for loading (default: every core)")
+    args = parser.parse_args()
+
+    catalog = RunCatalog(args.runs)
+    run_params = catalog.select()
+    columns = set(ALIGN_COLUMNS).union(*(QUANTITIES[q][0] for q in args.quantity))
+    runs_data, errors = load_histories([p["path"] for p in run_params.values()], columns=columns,
+                                       workers=args.workers)
+    report_errors(errors, "history")
+
+    aligned = align_runs(runs_data, args.quantity, args.phase, args.points)
+    baseline, differences = baseline_differences(aligned, run_params)
+    print(f"Aligned {int(aligned['complete'].sum())}/{len(aligned['run_names'])} runs on {args.phase}, "
+          f"{int((baseline >= 0).sum())} with a noovs baseline")
+
+    if args.output:
+        np.savez(args.output, run_names=np.array(aligned["run_names"]), phase=aligned["phase"],
+                 complete=aligned["complete"], baseline=baseline, **aligned["values"],
+                 **{f"delta_{q}": d for q, d in differences.items()})
+        print(f"Saved aligned arrays to {args.output}")
+    for quantity in args.quantity:
+        plot_differences(aligned, baseline, differences, run_params, quantity, args.phase, args.plots)
+
+
+if __name__ == "__main__":
+    main()
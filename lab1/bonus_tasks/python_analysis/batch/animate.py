@@ -0,0 +1,230 @@
+"""
+animate.py - Render rotating 3D figures as GIF, WebP or MP4 in parallel
+
+FuncAnimation redraws the scene on one core and the Pillow writer keeps every RGBA
+frame in memory. Here each worker process builds the scene once from the (already
+thinned) arrays it is given and then only changes the view, so a frame costs one draw.
+Frames come back in order through a window of at most two per worker, so rendering
+never runs ahead of the encoder:
+
+  .gif   frames are quantised in the workers to one shared palette (no flicker,
+         1 byte per pixel) and appended to the file one at a time
+  .webp  written by Pillow, which needs every frame before it writes, so the whole
+         movie is held in memory (RGB, 3 bytes per pixel per frame); use .gif or
+         .mp4, or fewer frames, for long movies
+  .mp4   streamed to ffmpeg through a pipe, one frame at a time (needs ffmpeg on PATH)
+
+The scene is built by a module-level function build(*args) -> (fig, ax), so it can be
+sent to the workers by name.
+"""
+
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import islice
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image, GifImagePlugin
+
+from batch.render import set_headless
+
+FORMATS = (".gif", ".webp", ".mp4")
+
+# Set in each worker by _init_scene
+_scene = {}
+
+
+def rotation_views(n_frames=360, step=1, elev=30.0, bob=30.0):
+    """(elev, azim) of a full turn, one degree per frame, bobbing up and down twice; every step-th frame."""
+    frames = np.arange(0, n_frames, step)
+    return [(elev + bob * np.sin(np.radians(frame) * 2), frame % 360) for frame in frames]
+
+
+def _init_scene(build, args, dpi, colors):
+    """Build the figure once and, for GIFs, the palette every frame is mapped to."""
+    fig, ax = build(*args)
+    # Draw off screen whatever the backend, so rendering in this process never opens a window
+    FigureCanvasAgg(fig)
+    fig.set_dpi(dpi)
+    _scene.update(fig=fig, ax=ax, palette=None)
+    if colors:
+        # The palette of the first view; later views show the same colours from other angles
+        _scene["palette"] = _draw().quantize(colors=colors, method=Image.Quantize.FASTOCTREE)
+
+
+def _draw(view=None):
+    if view is not None:
+        _scene["ax"].view_init(elev=view[0], azim=view[1])
+    canvas = _scene["fig"].canvas
+    canvas.draw()
+    return Image.fromarray(np.asarray(canvas.buffer_rgba())[..., :3].copy())
+
+
+def _render_view(view):
+    """Worker: one frame, quantised to the shared palette for GIFs."""
+    frame = _draw(view)
+    if _scene["palette"] is not None:
+        frame = frame.quantize(palette=_scene["palette"], dither=Image.Dither.NONE)
+    return frame
+
+
+def _init_pool_worker(initializer, initargs):
+    set_headless()
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def imap_ordered(function, items, workers=None, initializer=None, initargs=()):
+    """
+    Yield function(item) for every item, in order, computed in worker processes.
+
+    At most two items per worker are in flight, so results never pile up ahead of a
+    slow consumer. Workers run headless and call initializer(*initargs) once.
+    workers=1 runs everything in this process (without switching it to headless).
+    """
+    items = list(items)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(items)))
+
+    if workers == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            yield function(item)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker,
+                             initargs=(initializer, initargs)) as pool:
+        items = iter(items)
+        pending = deque(pool.submit(function, item) for item in islice(items, 2 * workers))
+        while pending:
+            result = pending.popleft().result()
+            # Top the window up before handing the result over, so the workers stay busy
+            for item in islice(items, 1):
+                pending.append(pool.submit(function, item))
+            yield result
+
+
+def render_frames(build, args, views, workers=None, dpi=60, colors=0):
+    """
+    Yield the frame of every view, in order, as PIL images.
+
+    Parameters:
+    build: Module-level function build(*args) -> (fig, ax) drawing the scene
+    args (tuple): Its arguments (send arrays, not loaded tables)
+    views (list): (elev, azim) per frame
+    workers (int): Worker processes; None uses every core, 1 renders in this process
+    dpi (int): Frame resolution
+    colors (int): Quantise to a shared palette of this many colours (0: RGB frames)
+    """
+    try:
+        yield from imap_ordered(_render_view, views, workers, _init_scene, (build, args, dpi, colors))
+    finally:
+        # Only set when the frames were drawn in this process
+        if "fig" in _scene:
+            plt.close(_scene["fig"])
+        _scene.clear()
+
+
+def _save_ffmpeg(path, frames, fps):
+    """Pipe RGB frames to ffmpeg as they arrive. Returns the number of frames written."""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise RuntimeError("writing .mp4 needs ffmpeg on PATH")
+    process = None
+    count = 0
+    try:
+        for count, frame in enumerate(frames, 1):
+            if process is None:
+                width, height = frame.size
+                process = subprocess.Popen(
+                    [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                     "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+                     # yuv420p needs even dimensions
+                     "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", "-vcodec", "libx264", path],
+                    stdin=subprocess.PIPE)
+            process.stdin.write(frame.convert("RGB").tobytes())
+    finally:
+        if process is not None:
+            process.stdin.close()
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed writing {path}")
+    return count
+
+
+def _save_gif(path, frames, fps):
+    """
+    Append frames to a looping GIF as they arrive. Returns the number of frames written.
+
+    Frames that are not mode "P" are quantised to the palette of the first one; a frame
+    with a palette of its own gets a local colour table.
+    """
+    duration = int(round(1000 / fps))
+    first = fp = None
+    count = 0
+    finished = False
+    try:
+        for count, frame in enumerate(frames, 1):
+            if first is None:
+                if frame.mode != "P":
+                    frame = frame.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+                header, _ = GifImagePlugin.getheader(frame, info={"loop": 0, "duration": duration, "optimize": False})
+                fp = open(path, "wb")
+                fp.write(b"".join(header))
+                first = frame
+            elif frame.mode != "P":
+                frame = frame.quantize(palette=first, dither=Image.Dither.NONE)
+            own_palette = frame.getpalette() != first.getpalette()
+            fp.write(b"".join(GifImagePlugin.getdata(frame, duration=duration, include_color_table=own_palette)))
+        if fp is not None:
+            fp.write(b";")
+        finished = True
+    finally:
+        if fp is not None:
+            fp.close()
+            # A truncated GIF must not pass for a finished one
+            if not finished:
+                os.remove(path)
+    return count
+
+
+def write_animation(path, frames, fps=20):
+    """
+    Write PIL frames as an animation, the format following the extension of `path`.
+
+    GIF frames should already be quantised (mode "P") to one palette. GIF and MP4
+    frames are written as they arrive; WebP frames are all kept until the end. Returns
+    the number of frames written.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"Unsupported animation format {ext!r}, use one of {', '.join(FORMATS)}")
+    if ext == ".mp4":
+        return _save_ffmpeg(path, frames, fps)
+    if ext == ".gif":
+        return _save_gif(path, frames, fps)
+
+    # Pillow has no incremental WebP writer, so the frames are collected first
+    frames = list(frames)
+    if frames:
+        frames[0].save(path, save_all=True, append_images=frames[1:], duration=int(round(1000 / fps)), loop=0,
+                       quality=80)
+    return len(frames)
+
+
+def save_animation(path, build, args, views, fps=20, workers=None, dpi=60, colors=256):
+    """
+    Render the views of a scene and write them as an animation.
+
+    The format follows the extension of `path` (.gif, .webp or .mp4); `colors` only
+    applies to GIFs. Thin long movies with views (e.g. rotation_views(step=2)); a
+    WebP holds every frame in memory. Returns the number of frames written.
+    """
+    # Frames are rendered lazily, so an unsupported format fails before any are drawn
+    gif = os.path.splitext(path)[1].lower() == ".gif"
+    return write_animation(path, render_frames(build, args, views, workers, dpi, colors if gif else 0), fps)
@@ -0,0 +1,90 @@
+"""
+cache.py - Helpers for caches keyed on the state of input files
+
+A file's fingerprint is its modification time and size, which is enough to notice
+that MESA has written to it without reading it. Cache files are always written to a
+temporary file first and moved into place, so a crashed or concurrent writer never
+leaves a half-written cache behind.
+
+Arrays derived from a MESA output file (decoded columns, resampled profiles) are kept
+in a .column_cache directory beside the file, one .npz per derived quantity, together
+with the fingerprint of the file they were computed from.
+"""
+
+import os
+import json
+from contextlib import contextmanager
+
+import numpy as np
+
+COLUMN_CACHE_DIR = ".column_cache"
+
+
+def file_fingerprint(path):
+    """[mtime_ns, size] of a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+@contextmanager
+def atomic_open(path, mode="w", **kwargs):
+    """Open a temporary file that replaces `path` only if the block finishes without error."""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_json(path, default=None):
+    """Contents of a JSON cache file, or `default` if it is missing or unreadable."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, obj):
+    """Atomically write a JSON cache file. Failure to write a cache is only a warning."""
+    try:
+        with atomic_open(path, "w") as f:
+            json.dump(obj, f, indent=1, sort_keys=True)
+    except OSError as e:
+        print(f"Warning: could not write cache {path}: {e}")
+
+
+def column_cache_path(source, name):
+    """Where arrays derived from `source` are cached: a .column_cache directory beside it."""
+    return os.path.join(os.path.dirname(source), COLUMN_CACHE_DIR, f"{os.path.basename(source)}.{name}.npz")
+
+
+def load_arrays(cache_path, fingerprint):
+    """
+    Arrays saved by save_arrays, as a dict.
+
+    Returns None if the cache is missing, unreadable or was saved for another fingerprint.
+    """
+    try:
+        with np.load(cache_path) as data:
+            if json.loads(str(data["_fingerprint"])) != fingerprint:
+                return None
+            return {name: data[name] for name in data.files if name != "_fingerprint"}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_arrays(cache_path, fingerprint, arrays):
+    """Atomically save a dict of arrays with the fingerprint of what they were derived from."""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with atomic_open(cache_path, "wb") as f:
+            np.savez(f, _fingerprint=json.dumps(fingerprint), **arrays)
+    except OSError as e:
+        print(f"Warning: could not write cache {cache_path}: {e}")
@@ -0,0 +1,232 @@
+"""
+catalog.py - Index of batch runs and their physical parameters
+
+The parameters of a run are read from the inlist_project that 3_run_batch.py copies
+into the run directory, falling back to the run name written by 1_make_batch.py
+(inlist_M<mass>_Z<z>_<scheme>_fov<fov>_f0<f0> or inlist_M<mass>_Z<z>_noovs). Parsed
+parameters are kept in an index file in the runs directory and only re-parsed when an
+inlist changes.
+
+    catalog = RunCatalog("../runs")
+    run_params = catalog.select(mass=5, scheme="step", fov__gt=0.05)
+"""
+
+import os
+import re
+
+import numpy as np
+
+from batch.cache import file_fingerprint, load_json, save_json
+
+INDEX_FILE = ".run_index.json"
+
+PARAMETERS = ("mass", "metallicity", "scheme", "fov", "f0")
+
+_OPERATORS = {
+    "gt": np.greater,
+    "ge": np.greater_equal,
+    "lt": np.less,
+    "le": np.less_equal,
+    "ne": lambda a, b: ~_equal(a, b),
+}
+
+
+def _equal(a, b):
+    if a.dtype.kind == "f":
+        return np.isclose(a, float(b), rtol=1e-9, atol=0.0)
+    return a == b
+
+
+def _fortran_float(text):
+    return float(text.replace("d", "e").replace("D", "E"))
+
+
+def parse_run_name(run_name):
+    """
+    Parameters encoded in a batch run name, or None if the name is not a batch run.
+
+    Accepts the directory name with or without the 'inlist_' prefix and '.inp' suffix.
+    """
+    name = run_name[:-4] if run_name.endswith(".inp") else run_name
+    if name.startswith("inlist_"):
+        name = name[7:]
+    parts = name.split("_")
+    if len(parts) < 2 or not parts[0].startswith("M") or not parts[1].startswith("Z"):
+        return None
+
+    try:
+        mass = float(parts[0][1:])
+        z = float(parts[1][1:])
+        if "noovs" in parts:
+            scheme = "none"
+            fov = 0.0
+            f0 = 0.0
+        else:
+            scheme = parts[2] if len(parts) > 2 else "unknown"
+            fov = float(parts[3][3:]) if len(parts) > 3 and parts[3].startswith("fov") else 0.0
+            f0 = float(parts[4][2:]) if len(parts) > 4 and parts[4].startswith("f0") else 0.0
+    except ValueError:
+        return None
+
+    return {"mass": mass, "metallicity": z, "scheme": scheme, "fov": fov, "f0": f0}
+
+
+def parse_inlist(inlist_file):
+    """
+    Parameters set in an inlist, or None if it does not set both initial_mass and initial_z.
+
+    Commented-out overshoot settings (as written by 1_make_batch.py for noovs runs) mean
+    no overshooting.
+    """
+    with open(inlist_file, "r") as f:
+        content = f.read()
+
+    number = r"([0-9.]+(?:[eEdD][-+]?[0-9]+)?)"
+    mass_match = re.search(r"^\s*initial_mass\s*=\s*" + number, content, re.MULTILINE)
+    z_match = re.search(r"^\s*initial_z\s*=\s*" + number, content, re.MULTILINE)
+    if not mass_match or not z_match:
+        return None
+
+    scheme_match = re.search(r"^\s*overshoot_scheme\s*\(\s*1\s*\)\s*=\s*'([^']+)'", content, re.MULTILINE)
+    f_match = re.search(r"^\s*overshoot_f\s*\(\s*1\s*\)\s*=\s*" + number, content, re.MULTILINE)
+    f0_match = re.search(r"^\s*overshoot_f0\s*\(\s*1\s*\)\s*=\s*" + number, content, re.MULTILINE)
+
+    params = {
+        "mass": _fortran_float(mass_match.group(1)),
+        "metallicity": _fortran_float(z_match.group(1)),
+        "scheme": "none",
+        "fov": 0.0,
+        "f0": 0.0,
+    }
+    if scheme_match:
+        params["scheme"] = scheme_match.group(1)
+        params["fov"] = _fortran_float(f_match.group(1)) if f_match else 0.0
+        params["f0"] = _fortran_float(f0_match.group(1)) if f0_match else 0.0
+    return params
+
+
+def inlist_value(inlist_file, name):
+    """
+    Number set for `name` (e.g. "mixing_length_alpha" or "overshoot_f(1)") in an inlist,
+    or None if the file does not exist or does not set it.
+    """
+    if not os.path.exists(inlist_file):
+        return None
+    with open(inlist_file, "r") as f:
+        content = f.read()
+    pattern = r"\s*".join(re.escape(token) for token in re.findall(r"\w+|\S", name))
+    match = re.search(r"^\s*" + pattern + r"\s*=\s*([0-9.]+(?:[eEdD][-+]?[0-9]+)?)", content, re.MULTILINE)
+    return _fortran_float(match.group(1)) if match else None
+
+
+class RunCatalog:
+    """Batch runs in a directory with their parameters, persisted to an index file."""
+
+    def __init__(self, batch_runs_dir="../runs", use_index=True):
+        self.batch_runs_dir = batch_runs_dir
+        self.index_path = os.path.join(batch_runs_dir, INDEX_FILE)
+        self.use_index = use_index
+        self.runs = {}
+        self._columns = None
+        self.refresh()
+
+    def _load_index(self):
+        if not self.use_index:
+            return {}
+        return load_json(self.index_path, {})
+
+    def _save_index(self, index):
+        if self.use_index:
+            save_json(self.index_path, index)
+
+    def refresh(self):
+        """Rescan the runs directory, re-parsing only runs whose inlist changed."""
+        old_index = self._load_index()
+        index = {}
+
+        names = sorted(os.listdir(self.batch_runs_dir)) if os.path.isdir(self.batch_runs_dir) else []
+        for run_name in names:
+            run_dir = os.path.join(self.batch_runs_dir, run_name)
+            if not run_name.startswith("inlist_M") or not os.path.isdir(run_dir):
+                continue
+
+            inlist_file = os.path.join(run_dir, "inlist_project")
+            fingerprint = file_fingerprint(inlist_file)
+            entry = old_index.get(run_name)
+            if entry is None or entry.get("fingerprint") != fingerprint:
+                params = parse_inlist(inlist_file) if fingerprint is not None else None
+                source = "inlist"
+                if params is None:
+                    params = parse_run_name(run_name)
+                    source = "name"
+                if params is None:
+                    continue
+                entry = {"params": params, "source": source, "fingerprint": fingerprint}
+            index[run_name] = entry
+
+        if index != old_index:
+            self._save_index(index)
+
+        self.runs = {}
+        for run_name, entry in index.items():
+            params = dict(entry["params"])
+            params["path"] = os.path.join(self.batch_runs_dir, run_name)
+            params["source"] = entry["source"]
+            self.runs[run_name] = params
+        self._columns = None
+
+    def __len__(self):
+        return len(self.runs)
+
+    def __iter__(self):
+        return iter(self.runs)
+
+    def __contains__(self, run_name):
+        return run_name in self.runs
+
+    def __getitem__(self, run_name):
+        return self.runs[run_name]
+
+    def lookup(self, run_name):
+        """Parameters of a run, parsing the name if the run is not in the runs directory."""
+        name = run_name[:-4] if run_name.endswith(".inp") else run_name
+        if name in self.runs:
+            return self.runs[name]
+        return parse_run_name(name)
+
+    def _column(self, field):
+        if self._columns is None:
+            self._columns = {"name": np.array(list(self.runs), dtype=object)}
+            for key in PARAMETERS:
+                values = [params[key] for params in self.runs.values()]
+                self._columns[key] = np.array(values, dtype=object if key == "scheme" else float)
+        if field not in self._columns:
+            raise KeyError(f"Unknown run parameter '{field}'. Use one of {', '.join(PARAMETERS)}")
+        return self._columns[field]
+
+    def select(self, **query):
+        """
+        Runs matching every condition, as {run_name: params}.
+
+        Conditions are parameter=value for equality or parameter__op=value with op one of
+        gt, ge, lt, le, ne, in, e.g. select(mass=5, scheme='step', fov__gt=0.05).
+        """
+        mask = np.ones(len(self.runs), dtype=bool)
+        for key, value in query.items():
+            field, _, op = key.partition("__")
+            column = self._column(field)
+            if op == "":
+                mask &= _equal(column, value)
+            elif op == "in":
+                mask &= np.logical_or.reduce([_equal(column, v) for v in value]) if len(value) else False
+            elif op in _OPERATORS:
+                mask &= _OPERATORS[op](column, value)
+            else:
+                raise ValueError(f"Unknown operator '{op}' in '{key}'")
+
+        names = self._column("name")[mask] if len(self.runs) else []
+        return {name: self.runs[name] for name in names}
+
+    def run_dirs(self, **query):
+        """Directories of the runs matching a query (see select)."""
+        return [params["path"] for params in self.select(**query).values()]
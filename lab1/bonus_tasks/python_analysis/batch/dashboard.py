@@ -0,0 +1,327 @@
+"""
+dashboard.py - Watch batch runs without pgstar
+
+pgstar redraws its windows every pgstar_interval steps inside MESA, which slows the
+solver down, so batches run with pgstar_flag = .false. This dashboard follows the runs
+from the outside instead: every few seconds of wall-clock time it reads the rows
+appended to each history.data since the last look (see tail.py) and the profiles newly
+listed in profiles.index, and redraws one figure with
+
+  - the HR diagram of every run
+  - the convective and helium core masses against age
+  - the hydrogen and helium profile of the latest profile of the focus run
+  - a Text_Summary-like table of the latest model of each run
+
+The focus run is the one written to most recently unless --focus names one. Runs whose
+history has not changed for --active seconds are drawn faded. Nothing is redrawn when
+no file changed. In headless mode (MESA_HEADLESS=1, or no display) the figure is saved
+to --output on every change instead of shown, e.g. to watch from a browser or viewer.
+
+    python -m batch.dashboard                             # every run in ../runs
+    python -m batch.dashboard ../../../lab2/output_overshoot --interval 2
+    MESA_HEADLESS=1 python -m batch.dashboard --output plots/dashboard.png
+"""
+
+import os
+import glob
+import time
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from batch.cache import file_fingerprint
+from batch.loader import read_mesa_table
+from batch.profile_cube import read_profiles_index
+from batch.render import is_headless
+from batch.tail import HistoryTail
+
+# Shown in the summary table when the history has them, like pgstar's Text_Summary1
+TEXT_FIELDS = ("model_number", "star_age", "log_dt", "star_mass", "log_Teff", "log_L",
+               "center_h1", "center_he4", "mass_conv_core", "he_core_mass", "num_zones")
+
+HISTORY_COLUMNS = TEXT_FIELDS + ("log_R", "log_center_T", "log_center_Rho")
+
+PROFILE_COLUMNS = ("mass", "x_mass_fraction_H", "y_mass_fraction_He")
+
+# Runs listed in the summary table, and the width of their names there
+MAX_TABLE_RUNS = 20
+RUN_NAME_WIDTH = 40
+
+
+def logs_path(path):
+    """LOGS directory of a run directory, or the path itself if it is one (it may not exist yet)."""
+    path = os.path.normpath(path)
+    if os.path.basename(path) == "LOGS" or os.path.isfile(os.path.join(path, "history.data")):
+        return path
+    return os.path.join(path, "LOGS")
+
+
+def run_label(logs):
+    name = os.path.basename(os.path.dirname(os.path.abspath(logs)))
+    return name[len("inlist_"):] if name.startswith("inlist_") else name
+
+
+class ProfileTail:
+    """Follow profiles.index of a run and keep the latest profile that has been written."""
+
+    def __init__(self, logs, columns=PROFILE_COLUMNS):
+        self.logs = logs
+        self.columns = columns
+        self.fingerprint = None
+        self.profile_number = None
+        self.model_number = None
+        self.profile = None
+
+    def poll(self):
+        """Read the newest profile if profiles.index lists a new one. Returns True if it did."""
+        index_file = os.path.join(self.logs, "profiles.index")
+        fingerprint = file_fingerprint(index_file)
+        if fingerprint is None or fingerprint == self.fingerprint:
+            return False
+        try:
+            index = read_profiles_index(self.logs)
+        except (OSError, ValueError):
+            return False  # index being written, try again next time
+        if not len(index["profile_number"]):
+            return False
+        number = int(index["profile_number"][-1])
+        if number == self.profile_number:
+            self.fingerprint = fingerprint
+            return False
+        try:
+            profile = read_mesa_table(os.path.join(self.logs, f"profile{number}.data"), columns=self.columns)
+        except (OSError, ValueError):
+            return False
+        self.fingerprint = fingerprint
+        self.profile_number = number
+        self.model_number = int(index["model_number"][-1])
+        self.profile = profile
+        return True
+
+
+class Dashboard:
+    """One figure following any number of runs, updated in place."""
+
+    def __init__(self, logs_dirs, focus=None, active=600.0):
+        self.histories = {run_label(logs): HistoryTail(os.path.join(logs, "history.data"), HISTORY_COLUMNS)
+                          for logs in logs_dirs}
+        self.profiles = {run_label(logs): ProfileTail(logs) for logs in logs_dirs}
+        self.focus = focus
+        self.active = active
+        self.updated = {}
+
+        self.fig, axes = plt.subplots(2, 2, figsize=(15, 10))
+        (self.ax_hr, self.ax_core), (self.ax_profile, self.ax_text) = axes
+        self.ax_hr.set_xlabel(r"$\log(T_{\mathrm{eff}}/\mathrm{K})$")
+        self.ax_hr.set_ylabel(r"$\log(L/L_{\odot})$")
+        self.ax_hr.invert_xaxis()
+        self.ax_core.set_xlabel("Age [Myr]")
+        self.ax_core.set_ylabel(r"Core mass [$M_{\odot}$]")
+        self.ax_profile.set_xlabel(r"$m$ [$M_{\odot}$]")
+        self.ax_profile.set_ylabel("Mass fraction")
+        self.ax_profile.set_ylim(-0.02, 1.02)
+        self.ax_text.axis("off")
+        for ax in (self.ax_hr, self.ax_core, self.ax_profile):
+            ax.grid(alpha=0.3)
+        self.lines = {}
+        self.profile_lines = [self.ax_profile.plot([], [], color=color, label=label)[0]
+                              for color, label in (("tab:blue", "H"), ("tab:orange", "He"))]
+        self.ax_profile.legend(loc="center right")
+        self.text = self.ax_text.text(0, 1, "", va="top", family="monospace", fontsize=8,
+                                      transform=self.ax_text.transAxes)
+        self.ax_hr.set_title("HR diagram")
+        self.ax_core.set_title("Core mass: convective (solid), helium (dashed)")
+        self.ax_profile.set_title(" ", fontsize=9)
+        self.fig.tight_layout()
+
+    def add_runs(self, logs_dirs):
+        """Follow runs that appeared since the dashboard started."""
+        for logs in logs_dirs:
+            name = run_label(logs)
+            if name not in self.histories:
+                self.histories[name] = HistoryTail(os.path.join(logs, "history.data"), HISTORY_COLUMNS)
+                self.profiles[name] = ProfileTail(logs)
+
+    def poll(self):
+        """Read whatever the runs wrote since the last poll. Returns True if anything changed."""
+        changed = False
+        now = time.time()
+        for name, tail in self.histories.items():
+            if tail.poll():
+                self.updated[name] = now
+                changed = True
+        for profile in self.profiles.values():
+            changed |= profile.poll()
+        return changed
+
+    def focus_run(self):
+        if self.focus in self.histories:
+            return self.focus
+        return max(self.updated, key=self.updated.get) if self.updated else None
+
+    def _track(self, name):
+        if name not in self.lines:
+            color = plt.cm.tab10(len(self.lines) % 10)
+            self.lines[name] = (self.ax_hr.plot([], [], color=color, lw=1.5)[0],
+                                self.ax_core.plot([], [], color=color, lw=1.5)[0],
+                                self.ax_core.plot([], [], color=color, lw=1.0, ls="--")[0],
+                                self.ax_hr.plot([], [], "o", color=color, ms=5)[0])
+        return self.lines[name]
+
+    def draw(self):
+        """Update every artist from the data read so far."""
+        now = time.time()
+        focus = self.focus_run()
+        rows = []
+        for name, tail in sorted(self.histories.items()):
+            table = tail.table
+            if table is None or not len(table):
+                continue
+            hr, conv, he, last = self._track(name)
+            alpha = 1.0 if now - self.updated.get(name, 0) < self.active else 0.35
+            age = table.star_age / 1e6 if hasattr(table, "star_age") else np.arange(len(table))
+            if hasattr(table, "log_Teff") and hasattr(table, "log_L"):
+                hr.set_data(table.log_Teff, table.log_L)
+                last.set_data(table.log_Teff[-1:], table.log_L[-1:])
+            if hasattr(table, "mass_conv_core"):
+                conv.set_data(age, table.mass_conv_core)
+            if hasattr(table, "he_core_mass"):
+                he.set_data(age, table.he_core_mass)
+            for artist in (hr, conv, he, last):
+                artist.set_alpha(alpha)
+                artist.set_linewidth(2.5 if name == focus else 1.5)
+            rows.append((self.updated.get(name, 0), name, table.data[-1]))
+
+        for ax in (self.ax_hr, self.ax_core):
+            ax.relim()
+            ax.autoscale_view()
+        self.ax_hr.set_title(f"HR diagram ({len(rows)} runs)")
+
+        profile = self.profiles[focus] if focus else None
+        if profile is not None and profile.profile is not None:
+            p = profile.profile
+            for line, column in zip(self.profile_lines, PROFILE_COLUMNS[1:]):
+                if hasattr(p, column):
+                    line.set_data(p.mass, getattr(p, column))
+            self.ax_profile.set_xlim(0, np.max(p.mass) * 1.02)
+            self.ax_profile.set_title(f"{focus}: profile {profile.profile_number} (model {profile.model_number})",
+                                      fontsize=9)
+
+        self.text.set_text(summary_text(rows, focus))
+
+
+def summary_text(rows, focus=None):
+    """
+    Text_Summary-like block for the focus run (field = value), then the latest model,
+    X_c, Y_c and convective core mass of every run, most recently updated first.
+    """
+    if not rows:
+        return "Waiting for history files..."
+    rows = sorted(rows, key=lambda row: row[0], reverse=True)
+    lines = [f"Updated {time.strftime('%H:%M:%S')}", ""]
+    for _, name, last in rows:
+        if name == focus:
+            fields = [f for f in TEXT_FIELDS + HISTORY_COLUMNS[len(TEXT_FIELDS):] if f in last.dtype.names]
+            lines.append(focus)
+            cells = [f"{field:>15} = {format_value(field, last[field]):<12}" for field in fields]
+            lines += ["".join(cells[i:i + 2]) for i in range(0, len(cells), 2)]
+            lines.append("")
+
+    columns = [c for c in ("model_number", "star_age", "center_h1", "center_he4", "mass_conv_core")
+               if c in rows[0][2].dtype.names]
+    short = {"model_number": "model", "star_age": "age [Myr]", "center_h1": "X_c", "center_he4": "Y_c",
+             "mass_conv_core": "M_conv"}
+    # The focus run is marked in a column of its own, before the name
+    lines.append(f"  {'run':<{RUN_NAME_WIDTH}}" + "".join(f"{short[c]:>11}" for c in columns))
+    for _, name, last in rows[:MAX_TABLE_RUNS]:
+        marker = "*" if name == focus else " "
+        lines.append(f"{marker} {table_name(name):<{RUN_NAME_WIDTH}}" +
+                     "".join(f"{format_value(c, last[c]):>11}" for c in columns))
+    if len(rows) > MAX_TABLE_RUNS:
+        lines.append(f"  ... and {len(rows) - MAX_TABLE_RUNS} more")
+    return "\n".join(lines)
+
+
+def table_name(name, width=RUN_NAME_WIDTH):
+    """
+    Run name for the summary table: without the inlist_ prefix and cut at the end, so the
+    mass and metallicity at the front stay visible.
+    """
+    if name.startswith("inlist_"):
+        name = name[len("inlist_"):]
+    return name if len(name) <= width else name[:width - 3] + "..."
+
+
+def format_value(field, value):
+    if field in ("model_number", "num_zones"):
+        return f"{int(value)}"
+    if field == "star_age":
+        return f"{value / 1e6:.5g}"
+    return f"{value:.5g}" if abs(value) >= 1e-3 or value == 0 else f"{value:.3e}"
+
+
+def save_figure(fig, output):
+    """Save atomically, so a viewer never reads a half-written image."""
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    root, ext = os.path.splitext(output)
+    tmp = f"{root}.tmp{ext}"
+    fig.savefig(tmp, dpi=100)
+    os.replace(tmp, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live dashboard of running MESA models, instead of pgstar.")
+    parser.add_argument("paths", nargs="*", help="run or LOGS directories (default: every run in --runs)")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between updates")
+    parser.add_argument("--focus", help="run whose profile is shown (default: the latest updated)")
+    parser.add_argument("--active", type=float, default=600.0,
+                        help="runs not updated for this many seconds are faded")
+    parser.add_argument("--output", default="plots/dashboard.png", help="image saved on every update when headless")
+    parser.add_argument("--once", action="store_true", help="read everything once, save the figure and exit")
+    args = parser.parse_args()
+
+    def find_runs():
+        if args.paths:
+            return [logs_path(path) for path in args.paths]
+        return [logs_path(d) for d in sorted(glob.glob(os.path.join(args.runs, "inlist_M*"))) if os.path.isdir(d)]
+
+    headless = is_headless() or args.once
+    if not headless:
+        plt.ion()
+    dashboard = Dashboard(find_runs(), args.focus, args.active)
+    print(f"Following {len(dashboard.histories)} runs, updating every {args.interval:g} s (Ctrl-C to stop)")
+
+    next_update = time.monotonic()
+    try:
+        while True:
+            if not args.paths:
+                dashboard.add_runs(find_runs())
+            if dashboard.poll() or args.once:
+                dashboard.draw()
+                if headless:
+                    save_figure(dashboard.fig, args.output)
+                else:
+                    dashboard.fig.canvas.draw_idle()
+            if args.once:
+                print(f"Saved dashboard to {args.output}")
+                break
+
+            # Fixed cadence: the time spent reading and drawing counts towards the interval
+            next_update += args.interval
+            wait = max(next_update - time.monotonic(), 0.0)
+            if headless:
+                time.sleep(wait)
+            elif not plt.fignum_exists(dashboard.fig.number):
+                break
+            else:
+                plt.pause(max(wait, 0.01))
+            if wait == 0.0:
+                next_update = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
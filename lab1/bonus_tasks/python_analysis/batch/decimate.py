@@ -0,0 +1,163 @@
+"""
+decimate.py - Draw many evolutionary tracks quickly without changing how they look
+
+History files are written every step, so a grid of tracks easily holds millions of
+points, most of which land on the same pixels. Tracks are thinned with Largest
+Triangle Three Buckets (LTTB) in display coordinates, which keeps the points that
+shape the curve (turning points, hooks, loops) as they appear on the chosen scales,
+and drawn as one LineCollection per line style instead of one Line2D per run.
+
+LTTB walks each track bucket by bucket; all tracks are walked together on
+(n_tracks, n_points) NaN-padded arrays, so the cost is one pass over the buckets
+whatever the number of tracks.
+"""
+
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+from matplotlib.lines import Line2D
+
+# Points kept per figure, shared between its tracks
+POINT_BUDGET = 300_000
+
+# Never thin a track to fewer points than this
+MIN_TRACK_POINTS = 500
+
+
+def lttb_indices(xs, ys, n_out):
+    """
+    Indices of the points LTTB keeps from each track.
+
+    Parameters:
+    xs, ys (list): 1D arrays of each track's coordinates (display units, all finite)
+    n_out (int): Points to keep per track; shorter tracks are kept whole
+
+    Returns a list of sorted index arrays, one per track.
+    """
+    lengths = np.array([len(x) for x in xs], dtype=int)
+    result = [np.arange(n) for n in lengths]
+    thin = np.flatnonzero(lengths > max(n_out, 2))
+    if n_out < 3 or len(thin) == 0:
+        return result
+
+    n = lengths[thin]
+    x = np.full((len(thin), n.max()), np.nan)
+    y = np.full_like(x, np.nan)
+    for row, i in enumerate(thin):
+        x[row, :n[row]] = xs[i]
+        y[row, :n[row]] = ys[i]
+    rows = np.arange(len(thin))
+
+    # Prefix sums give the mean of any bucket in O(1)
+    cx = np.concatenate([np.zeros((len(thin), 1)), np.nancumsum(x, axis=1)], axis=1)
+    cy = np.concatenate([np.zeros((len(thin), 1)), np.nancumsum(y, axis=1)], axis=1)
+
+    # Bucket i holds points [edges[i], edges[i + 1]); the first and last points are always kept
+    every = (n - 2) / (n_out - 2)
+    edges = np.floor(np.arange(n_out - 1)[:, None] * every[None, :]).astype(int) + 1
+    edges[-1] = n - 1
+    width = int(np.max(np.diff(edges, axis=0)))
+
+    keep = np.empty((len(thin), n_out), dtype=int)
+    keep[:, 0] = 0
+    keep[:, -1] = n - 1
+    a = np.zeros(len(thin), dtype=int)
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i < n_out - 3:
+            after = edges[i + 2]
+            count = np.maximum(after - stop, 1)
+            avg_x = (cx[rows, after] - cx[rows, stop]) / count
+            avg_y = (cy[rows, after] - cy[rows, stop]) / count
+        else:
+            avg_x, avg_y = x[rows, n - 1], y[rows, n - 1]
+
+        candidates = np.minimum(start[:, None] + np.arange(width)[None, :], n[:, None] - 1)
+        px = np.take_along_axis(x, candidates, axis=1)
+        py = np.take_along_axis(y, candidates, axis=1)
+        # Twice the area of the triangle (last kept point, candidate, mean of the next bucket)
+        ref_x, ref_y = x[rows, a][:, None], y[rows, a][:, None]
+        area = np.abs((ref_x - avg_x[:, None]) * (py - ref_y) - (ref_x - px) * (avg_y[:, None] - ref_y))
+        area[candidates >= stop[:, None]] = -1.0
+        a = np.take_along_axis(candidates, np.argmax(area, axis=1)[:, None], axis=1)[:, 0]
+        keep[:, i + 1] = a
+
+    for row, i in enumerate(thin):
+        result[i] = keep[row]
+    return result
+
+
+def decimate_tracks(ax, tracks, budget=POINT_BUDGET, min_points=MIN_TRACK_POINTS):
+    """
+    Thin tracks in data coordinates to a figure-wide point budget.
+
+    Each track is a tuple (x, y, *other arrays); the other arrays (e.g. age) are thinned
+    with the same indices. The shape is judged in display space, so the axes scales must
+    be set; the limits do not matter, as rescaling either axis does not change which
+    points LTTB keeps. Points that cannot be shown (e.g. <= 0 on a log axis) are dropped.
+    Returns the thinned tracks.
+    """
+    if not tracks:
+        return []
+    # One transform for all points: the log scales dominate the cost, not the number of calls
+    splits = np.cumsum([len(track[0]) for track in tracks])[:-1]
+    points = np.column_stack([np.concatenate([track[0] for track in tracks]),
+                              np.concatenate([track[1] for track in tracks])])
+    with np.errstate(all="ignore"):
+        display = ax.transData.transform(points)
+    finite = []
+    displays = []
+    for track, d in zip(tracks, np.split(display, splits)):
+        ok = np.all(np.isfinite(d), axis=1)
+        finite.append([np.asarray(a)[ok] for a in track])
+        displays.append(d[ok])
+
+    n_out = max(min_points, budget // len(tracks))
+    indices = lttb_indices([d[:, 0] for d in displays], [d[:, 1] for d in displays], n_out)
+    return [tuple(a[i] for a in track) for track, i in zip(finite, indices)]
+
+
+def add_tracks(ax, tracks, styles, budget=POINT_BUDGET, min_points=MIN_TRACK_POINTS):
+    """
+    Draw tracks as one LineCollection per line style, thinned in display space.
+
+    Parameters:
+    ax: Axes whose scales are already set
+    tracks (list): (x, y, *other arrays) per track, in data coordinates
+    styles (list): Per track dict with color and optionally alpha, linestyle, linewidth
+
+    Returns the thinned tracks, e.g. for drawing markers along them.
+    """
+    # Set the limits from every point first, so display coordinates are final when thinning
+    for track in tracks:
+        if len(track[0]):
+            ax.update_datalim(np.column_stack(track[:2]))
+    ax.autoscale_view()
+
+    thinned = decimate_tracks(ax, tracks, budget, min_points)
+    for collection in line_collections([track[:2] for track in thinned], styles):
+        ax.add_collection(collection, autolim=False)
+
+    # Legends placed with loc="best" only avoid Line2D paths, so add the tracks as a hidden one
+    if thinned:
+        gaps = [np.append(np.asarray(track[0], dtype=float), np.nan) for track in thinned]
+        heights = [np.append(np.asarray(track[1], dtype=float), np.nan) for track in thinned]
+        ax.add_line(Line2D(np.concatenate(gaps), np.concatenate(heights), visible=False))
+    return thinned
+
+
+def line_collections(lines, styles, collection=LineCollection):
+    """
+    One collection per (linestyle, linewidth), each line keeping its own colour and alpha.
+
+    lines are (x, y) or (x, y, z) tuples; pass mpl_toolkits.mplot3d.art3d.Line3DCollection
+    as `collection` for 3D axes.
+    """
+    groups = {}
+    for line, style in zip(lines, styles):
+        key = (style.get("linestyle", "-"), style.get("linewidth", 2))
+        segments, colors = groups.setdefault(key, ([], []))
+        segments.append(np.column_stack(line))
+        colors.append(to_rgba(style["color"], style.get("alpha")))
+    return [collection(segments, colors=colors, linestyles=linestyle, linewidths=linewidth)
+            for (linestyle, linewidth), (segments, colors) in groups.items()]
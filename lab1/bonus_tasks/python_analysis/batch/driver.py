@@ -0,0 +1,184 @@
+"""
+driver.py - Produce every grid product from one pass over the run files
+
+hr_plot.py, conv_core_plot.py, composition_plot.py and 5_construct_output.py each find
+the runs and parse their history files again. The driver runs the same work as a small
+stage graph over one in-memory copy of the grid:
+
+  load     every history and final profile, once, with the union of the columns the
+           later stages read
+  derive   values at TAMS and the overshoot fit of every final profile (all profiles
+           fitted together)
+  summary  the summary CSV of 5_construct_output.py, from the derived values
+  plots    the grid figures, rendered in parallel from the loaded arrays (unchanged
+           figures are skipped, see figure_cache.py)
+
+Asking for a stage runs the stages it needs first. The time spent in each stage is
+reported at the end.
+
+    python -m batch.driver                   # every stage
+    python -m batch.driver summary           # load, derive, summary
+    python -m batch.driver plots --force
+"""
+
+import os
+import time
+import argparse
+import functools
+import importlib.util
+
+from batch.catalog import RunCatalog
+from batch.figure_cache import FigureCache
+from batch.loader import load_histories, load_final_profiles, report_errors
+from batch.overshoot import OVERSHOOT_COLUMNS, fit_overshoot, fit_values
+from batch.reduce import reduce_rows, track_points
+from batch.render import set_headless, grid_figures, grid_columns, grid_tracks, figure_jobs, render_figures
+
+SUMMARY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "batch_runs",
+                              "5_construct_output.py")
+
+
+@functools.lru_cache(maxsize=None)
+def summary_module():
+    """5_construct_output.py, imported from its file (its name is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location("construct_output", SUMMARY_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_stage(grid, options):
+    """Parse every history and final profile once, with the columns of all later stages."""
+    catalog = RunCatalog(options.runs)
+    grid["run_params"] = catalog.select()
+    run_dirs = [params["path"] for params in grid["run_params"].values()]
+
+    history_columns, profile_columns = grid_columns()
+    if "derive" in grid["stages"]:
+        history_columns |= set(summary_module().HISTORY_COLUMNS)
+        profile_columns |= set(OVERSHOOT_COLUMNS)
+
+    grid["histories"], errors = load_histories(run_dirs, columns=history_columns, workers=options.workers)
+    report_errors(errors, "history")
+    loaded = [grid["run_params"][name]["path"] for name in grid["histories"]]
+    grid["profiles"], errors = load_final_profiles(loaded, columns=profile_columns, workers=options.workers)
+    report_errors(errors, "final profile")
+    print(f"Loaded {len(grid['histories'])} histories and {len(grid['profiles'])} final profiles")
+
+
+def derive_stage(grid, options):
+    """Values at TAMS per run, with the overshoot measured from its final profile."""
+    construct = summary_module()
+    names = list(grid["profiles"])
+    fits = fit_overshoot([grid["profiles"][name] for name in names]) if names else {}
+    grid["fits"] = {name: fit_values(fits, i) for i, name in enumerate(names)}
+
+    grid["values"] = {}
+    for name, history in grid["histories"].items():
+        try:
+            grid["values"][name] = construct.run_values(history, grid["fits"].get(name))
+        except Exception as e:
+            print(f"Error processing {name}: {e}")
+
+
+def summary_stage(grid, options):
+    """Bring the summary CSV up to date from the derived values."""
+    n = summary_module().write_summary_csv(output_csv=options.summary, base_dir=options.runs,
+                                           timings_file=options.timings, binary=options.binary,
+                                           force=options.force, values=grid["values"])
+    print(f"Summary: {n} runs updated")
+
+
+def plots_stage(grid, options):
+    """Render the grid figures whose inputs changed, in parallel, from the loaded arrays."""
+    set_headless()
+    cache = FigureCache(options.plots, force=options.force)
+    figures = grid_figures(grid["run_params"], options.plots, cache)
+    if not figures:
+        print(f"Every figure in {options.plots} is up to date")
+        return
+    # The summary needs the full tables; the figures only the rows they draw
+    history_tracks, profile_tracks = grid_tracks()
+    n_points = track_points(len(grid["histories"]))
+    histories = {name: reduce_rows(table, history_tracks, n_points) for name, table in grid["histories"].items()}
+    profiles = {name: reduce_rows(table, profile_tracks, n_points) for name, table in grid["profiles"].items()}
+    jobs = figure_jobs(figures, histories, profiles, grid["run_params"], options.plots)
+    errors = render_figures(jobs, options.workers)
+    for name, error in errors.items():
+        print(f"Failed to render {name}: {error}")
+    for name in jobs:
+        if name not in errors:
+            cache.record(name, *figures[name])
+    print(f"Rendered {len(jobs) - len(errors)}/{len(jobs)} figures to {options.plots}")
+
+
+# name -> (stages it needs, function), in the order they run
+STAGES = {
+    "load": ((), load_stage),
+    "derive": (("load",), derive_stage),
+    "summary": (("derive",), summary_stage),
+    "plots": (("load",), plots_stage),
+}
+
+
+def stage_order(requested):
+    """The requested stages and everything they depend on, in running order."""
+    needed = set()
+
+    def need(stage):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage!r}, use one of {', '.join(STAGES)}")
+        if stage not in needed:
+            needed.add(stage)
+            for dependency in STAGES[stage][0]:
+                need(dependency)
+
+    for stage in requested:
+        need(stage)
+    return [stage for stage in STAGES if stage in needed]
+
+
+def run(requested, options):
+    """
+    Run the requested stages (and their dependencies) over one shared copy of the grid.
+
+    Returns (grid, timings): the dict the stages filled in (run_params, histories,
+    profiles, fits, values) and the seconds spent in each stage.
+    """
+    stages = stage_order(requested)
+    grid = {"stages": stages}
+    timings = {}
+    for stage in stages:
+        print(f"--- {stage} ---")
+        start = time.perf_counter()
+        STAGES[stage][1](grid, options)
+        timings[stage] = time.perf_counter() - start
+    return grid, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the grid once and produce the summary and figures.")
+    parser.add_argument("stages", nargs="*", default=list(STAGES), help=f"stages to run ({', '.join(STAGES)})")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--plots", default="plots", help="directory to save figures in")
+    parser.add_argument("--summary", default="../filled_MESA_Lab.csv", help="summary CSV to write")
+    parser.add_argument("--timings", default="../run_timings.csv", help="runtime CSV written by 3_run_batch")
+    parser.add_argument("--binary", choices=["npz", "parquet"], help="also write a typed summary table")
+    parser.add_argument("--workers", type=int, help="worker processes (default: every core)")
+    parser.add_argument("--force", action="store_true", help="rewrite the summary and redraw every figure")
+    args = parser.parse_args()
+
+    try:
+        stage_order(args.stages)
+    except ValueError as e:
+        parser.error(str(e))
+    _, timings = run(args.stages, args)
+
+    print(f"\n{'stage':<10} {'time [s]':>9}")
+    for stage, seconds in timings.items():
+        print(f"{stage:<10} {seconds:9.2f}")
+    print(f"{'total':<10} {sum(timings.values()):9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+eep.py - Equivalent evolutionary phase (EEP) resampling of a grid of tracks
+
+Each run is cut at its primary EEPs
+
+    PreMS   first model of the run
+    ZAMS    Lnuc/L reaches 0.99
+    IAMS    center_h1 = 0.3 (mid main sequence)
+    TAMS    center_h1 = 0.001
+
+and every segment between two primary EEPs is resampled onto a fixed number of
+points spaced evenly in arc length along (log_Teff, log_L, log10 age). Point k of
+every run then describes the same phase of evolution, so the whole grid is a set of
+dense (n_runs, n_eep) arrays and comparisons between runs are plain array arithmetic.
+
+    python -m batch.eep --output eep_tracks.npz
+"""
+
+import argparse
+
+import numpy as np
+
+from batch.catalog import RunCatalog
+from batch.loader import load_histories, report_errors
+from batch.phases import stack_runs, detect_phases, interp_rows, positions_at
+
+PRIMARY_EEPS = ("PreMS", "ZAMS", "IAMS", "TAMS")
+
+# Points per segment: PreMS->ZAMS, ZAMS->IAMS, IAMS->TAMS
+SEGMENT_POINTS = (100, 150, 150)
+
+EEP_COLUMNS = ("star_age", "log_Teff", "log_L", "center_h1", "mass_conv_core", "he_core_mass", "star_mass")
+
+
+def arc_length(arrays, weights=(1.0, 1.0, 1.0)):
+    """
+    Cumulative distance along each track in (log_Teff, log_L, log10 age).
+
+    Constant after the last row of each run, so it is non-decreasing across the padding.
+    """
+    log_age = np.log10(np.maximum(arrays["star_age"], 1e-10))
+    steps = np.zeros_like(log_age[:, 1:])
+    for weight, x in zip(weights, (arrays["log_Teff"], arrays["log_L"], log_age)):
+        steps += weight * np.diff(x, axis=1) ** 2
+    steps = np.sqrt(steps)
+    steps[~np.isfinite(steps)] = 0.0
+
+    s = np.zeros_like(log_age)
+    s[:, 1:] = np.cumsum(steps, axis=1)
+    return s
+
+
+def resample_eeps(runs_data, columns=EEP_COLUMNS, segment_points=SEGMENT_POINTS, mid_ms_h1=0.3,
+                  h1_limit=0.001, weights=(1.0, 1.0, 1.0)):
+    """
+    Resample every run onto a common EEP axis.
+
+    Returns a dict with
+        run_names   list of run names (rows of every array)
+        tracks      column -> (n_runs, n_eep) array, NaN for runs missing a primary EEP
+        primary     primary EEP name -> its index on the EEP axis
+        complete    (n_runs,) bool, True if the run reached every primary EEP
+    """
+    columns = list(columns)
+    phases = detect_phases(runs_data, h1_thresholds=(mid_ms_h1,), h1_limit=h1_limit, quantities=())
+    run_names, lengths, arrays = stack_runs(runs_data, set(columns) | {"star_age", "log_Teff", "log_L"})
+    n_eep = sum(segment_points) + 1
+
+    primary = {}
+    index = 0
+    for name, n_points in zip(PRIMARY_EEPS, segment_points + (0,)):
+        primary[name] = index
+        index += n_points
+
+    if not run_names:
+        return {"run_names": [], "tracks": {c: np.empty((0, n_eep)) for c in columns},
+                "primary": primary, "complete": np.zeros(0, dtype=bool)}
+
+    # Fractional row position of each primary EEP, (n_runs, 4)
+    def position(event):
+        found = event["index"] > 0
+        return np.where(found, event["index"] - 1 + event["frac"], np.nan)
+
+    bounds = np.column_stack([
+        np.zeros(len(run_names)),
+        position(phases["ZAMS"]),
+        position(phases[f"h1={mid_ms_h1:g}"]),
+        position(phases["TAMS"]),
+    ])
+    complete = np.all(np.isfinite(bounds), axis=1) & np.all(np.diff(bounds, axis=1) >= 0, axis=1)
+    bounds[~complete] = np.nan
+
+    # Evenly spaced arc lengths between consecutive primary EEPs
+    s = arc_length(arrays, weights)
+    s_bounds = interp_rows(s, bounds)
+    targets = []
+    for k, n_points in enumerate(segment_points):
+        t = np.linspace(0.0, 1.0, n_points, endpoint=False)[None, :]
+        targets.append(s_bounds[:, k:k + 1] + t * (s_bounds[:, k + 1:k + 2] - s_bounds[:, k:k + 1]))
+    targets.append(s_bounds[:, -1:])
+    targets = np.concatenate(targets, axis=1)
+
+    pos = positions_at(s, lengths, targets)
+    # Primary EEPs sit exactly on their interpolated positions, even across flat arc length
+    for k, name in enumerate(PRIMARY_EEPS):
+        pos[:, primary[name]] = bounds[:, k]
+
+    tracks = {column: interp_rows(arrays[column], pos) for column in columns}
+    if "star_age" in tracks:
+        # Age is interpolated in log, matching the metric the points were spaced in
+        tracks["star_age"] = 10 ** interp_rows(np.log10(np.maximum(arrays["star_age"], 1e-10)), pos)
+    return {"run_names": run_names, "tracks": tracks, "primary": primary, "complete": complete}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resample every batch run onto equivalent evolutionary phases.")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--output", default="eep_tracks.npz", help="where to write the EEP arrays")
+    args = parser.parse_args()
+
+    catalog = RunCatalog(args.runs)
+    runs_data, errors = load_histories(catalog.run_dirs(), columns=set(EEP_COLUMNS) | {"center_h1", "log_Lnuc"})
+    report_errors(errors, "history")
+
+    eeps = resample_eeps(runs_data)
+    np.savez(args.output, run_names=np.array(eeps["run_names"]), complete=eeps["complete"],
+             **{f"primary_{name}": index for name, index in eeps["primary"].items()},
+             **eeps["tracks"])
+    n_complete = int(eeps["complete"].sum())
+    print(f"Resampled {n_complete}/{len(eeps['run_names'])} runs onto "
+          f"{eeps['tracks']['star_age'].shape[1]} EEPs -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
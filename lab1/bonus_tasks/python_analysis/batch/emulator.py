@@ -0,0 +1,345 @@
+"""
+emulator.py - Gaussian-process emulator of the TAMS summary table
+
+Fits one Gaussian process per overshoot scheme and summary quantity to the rows of the
+summary CSV written by 5_construct_output.py, in the inputs (log10 M, log10 Z, fov, f0).
+Runs without overshooting are added to every scheme as fov = f0 = 0. Predictions come
+with a 1-sigma uncertainty and take well under a millisecond once the model is loaded.
+
+The fitted model is saved as an .npz file together with the fingerprint of the summary
+it was fitted to. When runs are added to the summary, the new rows are appended to the
+existing Cholesky factors instead of refitting from scratch; the kernel hyperparameters
+are searched again only once a scheme has grown by half since the last search.
+
+    python -m batch.emulator                     # fit or update the model
+    python -m batch.emulator --mass 7 --z 0.014 --scheme step --fov 0.15 --f0 0.005
+"""
+
+import os
+import csv
+import argparse
+
+import numpy as np
+from scipy.linalg import cholesky, solve_triangular
+
+from batch.cache import atomic_open, file_fingerprint
+
+# Summary quantity -> (CSV column, fitted in log10)
+TARGETS = {
+    "log_Teff": ("log_Teff [K]", False),
+    "log_L": ("log_L [Lsol]", False),
+    "core_mass": ("Core mass [Msol]", False),
+    "core_radius": ("Core radius [Rsol]", False),
+    "age_myr": ("Age [Myr]", True),
+    "runtime_seconds": ("Runtime [s]", True),
+}
+
+LENGTH_SCALES = (0.1, 0.2, 0.3, 0.5, 0.8, 1.2, 2.0)
+NOISE_LEVELS = (1e-6, 1e-4, 1e-2)
+
+# Search the hyperparameters again once a model has this many times the points it was tuned on
+RETUNE_GROWTH = 1.5
+
+_MODEL_FIELDS = ("keys", "x", "y", "x_min", "x_scale", "y_mean", "y_std", "chol", "alpha",
+                 "length", "noise", "n_tuned", "loo_rmse")
+
+
+def _scheme_name(text):
+    text = text.strip()
+    return "none" if text.lower() in ("no overshooting", "none", "no overshoot") else text
+
+
+def features(mass, z, fov, f0):
+    """Emulator inputs; mass and metallicity enter in log10."""
+    return np.column_stack([np.log10(mass), np.log10(z), fov, f0]).astype(float)
+
+
+def read_summary(summary_csv):
+    """
+    Rows of the summary CSV as arrays.
+
+    Returns a dict with "key" (one string per run), "mass", "metallicity", "scheme", "fov",
+    "f0", "status" and one float array per target in TARGETS (NaN where empty).
+    """
+    with open(summary_csv, "r", newline="") as f:
+        rows = [row for row in csv.DictReader(f) if row.get("initial mass  [Msol]")]
+
+    def column(field):
+        return np.array([float(row[field]) if row.get(field, "") != "" else np.nan for row in rows])
+
+    summary = {
+        "mass": column("initial mass  [Msol]"),
+        "metallicity": column("initial metallicity"),
+        "scheme": np.array([_scheme_name(row["overshoot scheme"]) for row in rows], dtype=object),
+        "fov": np.nan_to_num(column("overshoot parameter (f_ov)")),
+        "f0": np.nan_to_num(column("overshoot f0")),
+        "status": np.array([row.get("Status", "") for row in rows], dtype=object),
+    }
+    summary["key"] = np.array([f"M{m:g}_Z{z:g}_{s}_fov{fov:g}_f0{f0:g}" for m, z, s, fov, f0 in
+                               zip(summary["mass"], summary["metallicity"], summary["scheme"],
+                                   summary["fov"], summary["f0"])], dtype=object)
+    for target, (field, _) in TARGETS.items():
+        summary[target] = column(field)
+    return summary
+
+
+def _kernel(a, b, length):
+    d2 = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=-1)
+    return np.exp(-0.5 * d2 / length ** 2)
+
+
+def _factor(x, y, length, noise):
+    """Cholesky factor and weights of a GP with unit signal variance on standardised y."""
+    k = _kernel(x, x, length) + noise * np.eye(len(x))
+    chol = cholesky(k, lower=True)
+    alpha = solve_triangular(chol.T, solve_triangular(chol, y, lower=True), lower=False)
+    return chol, alpha
+
+
+def _loo(chol, alpha):
+    """Closed-form leave-one-out residuals and variances of a fitted GP."""
+    inv_chol = solve_triangular(chol, np.eye(len(chol)), lower=True)
+    inv_diag = (inv_chol ** 2).sum(axis=0)
+    return alpha / inv_diag, 1.0 / inv_diag
+
+
+def fit_gp(keys, x_raw, y_raw, lengths=LENGTH_SCALES, noises=NOISE_LEVELS):
+    """
+    Fit a GP, choosing the length scale and noise by leave-one-out predictive likelihood.
+
+    Inputs are scaled to [0, 1] over the training range and targets are standardised,
+    so one isotropic length scale serves every parameter.
+    """
+    x_min = x_raw.min(axis=0)
+    x_scale = np.where(np.ptp(x_raw, axis=0) > 0, np.ptp(x_raw, axis=0), 1.0)
+    y_mean = y_raw.mean()
+    y_std = y_raw.std() if y_raw.std() > 0 else 1.0
+    x = (x_raw - x_min) / x_scale
+    y = (y_raw - y_mean) / y_std
+
+    best = None
+    for length in lengths:
+        for noise in noises:
+            try:
+                chol, alpha = _factor(x, y, length, noise)
+            except np.linalg.LinAlgError:
+                continue
+            residual, variance = _loo(chol, alpha)
+            score = np.mean(0.5 * np.log(variance) + residual ** 2 / (2 * variance))
+            if best is None or score < best[0]:
+                best = (score, length, noise, chol, alpha, residual)
+
+    _, length, noise, chol, alpha, residual = best
+    return {"keys": np.array(keys, dtype=object), "x": x, "y": y, "x_min": x_min, "x_scale": x_scale,
+            "y_mean": y_mean, "y_std": y_std, "chol": chol, "alpha": alpha, "length": length,
+            "noise": noise, "n_tuned": len(x), "loo_rmse": float(np.sqrt(np.mean(residual ** 2)) * y_std)}
+
+
+def extend_gp(model, keys, x_raw, y_raw):
+    """
+    Add training points to a fitted GP by extending its Cholesky factor.
+
+    Scaling and hyperparameters are kept from the original fit, so the cost is
+    O(n^2 k) for k new points instead of O((n + k)^3) for a refit.
+    """
+    x_new = (x_raw - model["x_min"]) / model["x_scale"]
+    y_new = (y_raw - model["y_mean"]) / model["y_std"]
+    chol = model["chol"]
+
+    k12 = _kernel(model["x"], x_new, model["length"])
+    k22 = _kernel(x_new, x_new, model["length"]) + model["noise"] * np.eye(len(x_new))
+    l21 = solve_triangular(chol, k12, lower=True).T
+    l22 = cholesky(k22 - l21 @ l21.T, lower=True)
+
+    n, k = len(chol), len(x_new)
+    extended = np.zeros((n + k, n + k))
+    extended[:n, :n] = chol
+    extended[n:, :n] = l21
+    extended[n:, n:] = l22
+
+    x = np.vstack([model["x"], x_new])
+    y = np.concatenate([model["y"], y_new])
+    alpha = solve_triangular(extended.T, solve_triangular(extended, y, lower=True), lower=False)
+    residual, _ = _loo(extended, alpha)
+
+    model = dict(model)
+    model.update(keys=np.concatenate([model["keys"], np.array(keys, dtype=object)]), x=x, y=y,
+                 chol=extended, alpha=alpha, loo_rmse=float(np.sqrt(np.mean(residual ** 2)) * model["y_std"]))
+    return model
+
+
+def predict_gp(model, x_raw):
+    """Posterior mean and standard deviation of a fitted GP at raw inputs x_raw."""
+    x = (x_raw - model["x_min"]) / model["x_scale"]
+    k = _kernel(x, model["x"], model["length"])
+    mean = k @ model["alpha"]
+    v = solve_triangular(model["chol"], k.T, lower=True)
+    variance = np.maximum(1.0 + model["noise"] - (v ** 2).sum(axis=0), 0.0)
+    return model["y_mean"] + model["y_std"] * mean, model["y_std"] * np.sqrt(variance)
+
+
+def _training_set(summary, scheme, target):
+    """Keys, inputs and targets a model is fitted to, ordered by key."""
+    mask = np.isfinite(summary[target]) & ((summary["scheme"] == scheme) | (summary["scheme"] == "none"))
+    if target == "runtime_seconds":
+        mask &= summary["status"] == "completed"
+    y = summary[target][mask]
+    if TARGETS[target][1]:
+        mask[mask] = y > 0
+        y = np.log10(summary[target][mask])
+    x = features(summary["mass"][mask], summary["metallicity"][mask], summary["fov"][mask], summary["f0"][mask])
+    order = np.argsort(summary["key"][mask])
+    return summary["key"][mask][order], x[order], y[order]
+
+
+class Emulator:
+    """GP emulators of the summary quantities, one per overshoot scheme and quantity."""
+
+    def __init__(self, model_path="../emulator.npz"):
+        self.model_path = model_path
+        self.models = {}
+        self.fingerprint = None
+        if os.path.exists(model_path):
+            self.load()
+
+    def load(self):
+        with np.load(self.model_path, allow_pickle=True) as data:
+            self.fingerprint = data["fingerprint"].tolist()
+            self.models = {}
+            for name in data.files:
+                if name.count(":") != 2:
+                    continue
+                scheme, target, field = name.split(":")
+                value = data[name]
+                self.models.setdefault((scheme, target), {})[field] = value if value.ndim else value.item()
+
+    def save(self):
+        arrays = {"fingerprint": np.array(self.fingerprint, dtype=object)}
+        for (scheme, target), model in self.models.items():
+            for field in _MODEL_FIELDS:
+                arrays[f"{scheme}:{target}:{field}"] = np.asarray(model[field])
+        with atomic_open(self.model_path, "wb") as f:
+            np.savez(f, **arrays)
+
+    def update(self, summary_csv="../filled_MESA_Lab.csv", refit=False):
+        """
+        Bring the models in line with the summary CSV.
+
+        Models whose training rows only gained new runs are extended; models whose
+        existing rows changed, or that have grown past RETUNE_GROWTH, are refitted.
+        Returns the number of models that were extended or refitted.
+        """
+        fingerprint = file_fingerprint(summary_csv)
+        if fingerprint is None:
+            raise FileNotFoundError(f"Summary CSV not found: {summary_csv}")
+        if not refit and fingerprint == self.fingerprint:
+            return 0
+
+        summary = read_summary(summary_csv)
+        models = {}
+        n_changed = 0
+        for scheme in sorted(set(summary["scheme"])):
+            for target in TARGETS:
+                keys, x, y = _training_set(summary, scheme, target)
+                if len(keys) == 0:
+                    continue
+
+                old = None if refit else self.models.get((scheme, target))
+                if old is not None:
+                    old_y = dict(zip(old["keys"], old["y_mean"] + old["y_std"] * old["y"]))
+                    current = dict(zip(keys, y))
+                    kept = all(key in current and np.isclose(current[key], value) for key, value in old_y.items())
+                    if kept and len(current) == len(old_y):
+                        models[(scheme, target)] = old
+                        continue
+                    if kept and len(keys) < RETUNE_GROWTH * old["n_tuned"]:
+                        new = np.array([key not in old_y for key in keys])
+                        try:
+                            models[(scheme, target)] = extend_gp(old, keys[new], x[new], y[new])
+                            n_changed += 1
+                            continue
+                        except np.linalg.LinAlgError:
+                            pass
+                models[(scheme, target)] = fit_gp(keys, x, y)
+                n_changed += 1
+
+        n_changed += len(set(self.models) - set(models))
+        self.models = models
+        self.fingerprint = fingerprint
+        self.save()
+        return n_changed
+
+    def predict(self, mass, z, scheme, fov=0.0, f0=0.0):
+        """
+        Predicted summary quantities for one or more parameter combinations.
+
+        Returns {quantity: (value, sigma)} with arrays shaped like the broadcast inputs.
+        Age and runtime are emulated in log10; their sigma is propagated to linear units.
+        """
+        scheme = _scheme_name(scheme)
+        if scheme == "none":
+            fov, f0 = 0.0, 0.0
+        shape = np.broadcast(mass, z, fov, f0).shape
+        mass, z, fov, f0 = (np.broadcast_to(np.asarray(v, dtype=float), shape).ravel()
+                            for v in (mass, z, fov, f0))
+        x = features(mass, z, fov, f0)
+
+        result = {}
+        for target, (_, in_log) in TARGETS.items():
+            model = self.models.get((scheme, target))
+            if model is None:
+                continue
+            mean, sigma = predict_gp(model, x)
+            if in_log:
+                value = 10 ** mean
+                mean, sigma = value, value * np.log(10) * sigma
+            result[target] = (mean.reshape(shape), sigma.reshape(shape))
+        if not result:
+            raise KeyError(f"No emulator for overshoot scheme '{scheme}'. "
+                           f"Fitted schemes: {', '.join(sorted({s for s, _ in self.models}))}")
+        return result
+
+
+_emulators = {}
+
+
+def predict(mass, z, scheme, fov=0.0, f0=0.0, model_path="../emulator.npz"):
+    """Predict with the emulator saved at model_path, loading it once per process."""
+    if model_path not in _emulators:
+        _emulators[model_path] = Emulator(model_path)
+    return _emulators[model_path].predict(mass, z, scheme, fov, f0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit or query the emulator of the TAMS summary table.")
+    parser.add_argument("--summary", default="../filled_MESA_Lab.csv", help="summary CSV from 5_construct_output.py")
+    parser.add_argument("--model", default="../emulator.npz", help="where the fitted emulator is kept")
+    parser.add_argument("--refit", action="store_true", help="refit every model from scratch")
+    parser.add_argument("--mass", type=float, help="initial mass to predict for")
+    parser.add_argument("--z", type=float, help="initial metallicity to predict for")
+    parser.add_argument("--scheme", default="none", help="overshoot scheme (none, step, exponential)")
+    parser.add_argument("--fov", type=float, default=0.0)
+    parser.add_argument("--f0", type=float, default=0.0)
+    args = parser.parse_args()
+
+    emulator = Emulator(args.model)
+    n_changed = emulator.update(args.summary, refit=args.refit)
+    if n_changed:
+        print(f"Updated {n_changed} emulator models -> {args.model}")
+
+    if args.mass is None or args.z is None:
+        print(f"\n{'scheme':<14} {'quantity':<16} {'runs':>5} {'LOO rmse':>10} {'length':>7}")
+        for (scheme, target), model in sorted(emulator.models.items()):
+            unit = " dex" if TARGETS[target][1] else ""
+            print(f"{scheme:<14} {target:<16} {len(model['keys']):5d} "
+                  f"{model['loo_rmse']:10.4g}{unit} {model['length']:7.2f}")
+        return
+
+    prediction = emulator.predict(args.mass, args.z, args.scheme, args.fov, args.f0)
+    print(f"\nM={args.mass:g} Z={args.z:g} {args.scheme} fov={args.fov:g} f0={args.f0:g}")
+    for target, (value, sigma) in prediction.items():
+        print(f"{target:<16} {float(value):12.5g} +/- {float(sigma):.3g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+explorer.py - Browse the grid interactively in a web browser
+
+A small HTTP server on this machine serves one page that plots HR, core mass and
+composition tracks of any subset of runs, picked by parameter (e.g. step overshoot at
+Z=0.0014), and lets you zoom into them. Nothing is fetched from the internet: the page
+draws on a canvas with its own few lines of JavaScript.
+
+The page never receives whole tracks. For every panel it asks for the runs matching the
+filter and gets them back thinned with LTTB (see decimate.py) to a point budget shared
+between the runs, so the amount of data sent does not grow with the number of runs.
+Zooming asks again for the visible window only, at full budget, so detail comes back.
+
+Columns are read from each run once, kept in memory and cached beside the history file
+or final profile (see cache.py), so a restarted server starts from the cached arrays.
+
+    python -m batch.explorer                 # then open http://127.0.0.1:8050
+    python -m batch.explorer --runs ../runs --port 8051 --budget 200000
+"""
+
+import json
+import argparse
+import threading
+import traceback
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from batch.cache import column_cache_path, file_fingerprint, load_arrays, save_arrays
+from batch.catalog import RunCatalog, PARAMETERS
+from batch.decimate import lttb_indices
+from batch.loader import history_path, final_profile_path, load_tables, report_errors
+
+HISTORY_COLUMNS = ("star_age", "log_Teff", "log_L", "he_core_mass", "star_mass", "center_h1", "center_he4")
+PROFILE_COLUMNS = ("mass", "x_mass_fraction_H", "y_mass_fraction_He")
+
+# Quantities computed from the columns
+DERIVED = {
+    "log_age": lambda a: np.log10(np.where(a["star_age"] > 0, a["star_age"], np.nan)),
+    "core_mass_fraction": lambda a: a["he_core_mass"] / a["star_mass"],
+}
+
+PLOTS = {
+    "hr": {"source": "history", "x": "log_Teff", "y": "log_L", "invert_x": True,
+           "title": "HR diagram", "xlabel": "log Teff [K]", "ylabel": "log L [Lsun]"},
+    "core_mass": {"source": "history", "x": "log_age", "y": "he_core_mass",
+                  "title": "Helium core mass", "xlabel": "log age [yr]", "ylabel": "M_He core [Msun]"},
+    "core_mass_fraction": {"source": "history", "x": "log_age", "y": "core_mass_fraction",
+                           "title": "Core mass fraction", "xlabel": "log age [yr]", "ylabel": "M_He core / M"},
+    "center_h1": {"source": "history", "x": "log_age", "y": "center_h1",
+                  "title": "Central hydrogen", "xlabel": "log age [yr]", "ylabel": "X_c"},
+    "hydrogen_profile": {"source": "profile", "x": "mass", "y": "x_mass_fraction_H",
+                         "title": "Final hydrogen profile", "xlabel": "m [Msun]", "ylabel": "X"},
+}
+
+# Points sent per panel, shared between its tracks
+POINT_BUDGET = 100_000
+
+
+def thin_tracks(tracks, budget=POINT_BUDGET, window=None):
+    """
+    Thin (x, y) tracks with LTTB to a shared point budget.
+
+    Every track gets an equal share of the budget, so the total stays within it however
+    many runs are shown (down to the 3 points per track LTTB keeps, i.e. up to budget / 3
+    tracks). The tracks are scaled together to the unit square first, so the shapes are
+    judged as they look in one panel. With window=(x0, x1, y0, y1) only the points inside it
+    (and their neighbours, so lines still leave the panel) are kept. Returns lists of x
+    and y per track, with None where the kept points are not consecutive in the track.
+    """
+    kept = []
+    for x, y in tracks:
+        ok = np.isfinite(x) & np.isfinite(y)
+        if window is not None:
+            x0, x1, y0, y1 = window
+            inside = ok & (x >= min(x0, x1)) & (x <= max(x0, x1)) & (y >= min(y0, y1)) & (y <= max(y0, y1))
+            near = inside.copy()
+            near[1:] |= inside[:-1]
+            near[:-1] |= inside[1:]
+            ok &= near
+        kept.append(np.flatnonzero(ok))
+
+    if not tracks or not sum(len(k) for k in kept):
+        return [[] for _ in tracks], [[] for _ in tracks]
+    xs = [x[k] for (x, _), k in zip(tracks, kept)]
+    ys = [y[k] for (_, y), k in zip(tracks, kept)]
+    scaled = []
+    for values in (xs, ys):
+        low = min(v.min() for v in values if len(v))
+        span = (max(v.max() for v in values if len(v)) - low) or 1.0
+        scaled.append([(v - low) / span for v in values])
+
+    n_out = max(3, budget // len(tracks))
+    indices = lttb_indices(scaled[0], scaled[1], n_out)
+    xs, ys = [], []
+    for (x, y), k, i in zip(tracks, kept, indices):
+        rows = k[i]
+        x_out = np.round(x[rows], 6).tolist()
+        y_out = np.round(y[rows], 6).tolist()
+        # Break the line where the window cut points out, not where LTTB dropped them
+        segment = np.concatenate([[0], np.cumsum(np.diff(k) > 1)])[i]
+        for gap in reversed(np.flatnonzero(np.diff(segment)) + 1):
+            x_out.insert(gap, None)
+            y_out.insert(gap, None)
+        xs.append(x_out)
+        ys.append(y_out)
+    return xs, ys
+
+
+class GridData:
+    """Columns of every run, loaded on first use and cached in memory and beside the run files."""
+
+    def __init__(self, batch_runs_dir="../runs", workers=None):
+        self.catalog = RunCatalog(batch_runs_dir)
+        self.workers = workers
+        self.arrays = {"history": {}, "profile": {}}
+        self.lock = threading.Lock()
+
+    def source_file(self, run_name, source):
+        path = self.catalog[run_name]["path"]
+        return history_path(path) if source == "history" else final_profile_path(path)
+
+    def select(self, filters):
+        """Runs matching {parameter: [values]}; parameters without values are not filtered."""
+        return self.catalog.select(**{f"{name}__in": values for name, values in filters.items() if values})
+
+    def load(self, run_names, source):
+        """{run name: dict of column arrays} from `source` ("history" or "profile") of the runs."""
+        columns = HISTORY_COLUMNS if source == "history" else PROFILE_COLUMNS
+        with self.lock:
+            cached = self.arrays[source]
+            missing = {}
+            for name in run_names:
+                path = self.source_file(name, source)
+                fingerprint = file_fingerprint(path) if path else None
+                if fingerprint is None:
+                    continue
+                entry = cached.get(name)
+                if entry is not None and entry[0] == fingerprint:
+                    continue
+                arrays = load_arrays(column_cache_path(path, "explorer"), fingerprint)
+                if arrays is not None:
+                    cached[name] = (fingerprint, arrays)
+                else:
+                    missing[name] = (path, fingerprint)
+
+            if missing:
+                print(f"Reading {len(missing)} {source} files")
+                tables, errors = load_tables({name: path for name, (path, _) in missing.items()},
+                                             columns=columns, workers=self.workers)
+                report_errors(errors, source)
+                for name, table in tables.items():
+                    path, fingerprint = missing[name]
+                    arrays = {c: np.asarray(getattr(table, c), dtype=float) for c in columns if hasattr(table, c)}
+                    save_arrays(column_cache_path(path, "explorer"), fingerprint, arrays)
+                    cached[name] = (fingerprint, arrays)
+            return {name: cached[name][1] for name in run_names if name in cached}
+
+    def tracks(self, plot, filters, budget=POINT_BUDGET, window=None):
+        """The runs matching the filters as thinned tracks of one of PLOTS, ready to send as JSON."""
+        spec = PLOTS[plot]
+        selected = self.select(filters)
+        data = self.load(list(selected), spec["source"])
+
+        def values(arrays, name):
+            if name in DERIVED:
+                with np.errstate(all="ignore"):
+                    return DERIVED[name](arrays)
+            return arrays[name]
+
+        runs, tracks = [], []
+        for name, arrays in data.items():
+            try:
+                tracks.append((values(arrays, spec["x"]), values(arrays, spec["y"])))
+            except KeyError:
+                continue
+            params = selected[name]
+            runs.append({"name": name, **{key: params[key] for key in PARAMETERS}})
+        xs, ys = thin_tracks(tracks, budget, window=window)
+        return {"plot": plot, **spec, "runs": runs, "x": xs, "y": ys}
+
+    def parameters(self):
+        """Every value each run parameter takes in the grid."""
+        values = {key: sorted({params[key] for params in self.catalog.runs.values()}) for key in PARAMETERS}
+        return {"n_runs": len(self.catalog), "parameters": values,
+                "plots": {name: spec["title"] for name, spec in PLOTS.items()}}
+
+
+def parse_filters(query):
+    """{parameter: [values]} from a query string such as mass=2,5&scheme=step."""
+    filters = {}
+    for key in PARAMETERS:
+        if key in query:
+            values = [v for v in query[key][0].split(",") if v]
+            filters[key] = values if key == "scheme" else [float(v) for v in values]
+    return filters
+
+
+class ExplorerHandler(BaseHTTPRequestHandler):
+    """GET / for the page, /api/parameters and /api/tracks?plot=...&<filters> for data."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        grid = self.server.grid
+        try:
+            if url.path == "/":
+                self.send(PAGE.encode(), "text/html; charset=utf-8")
+            elif url.path == "/api/parameters":
+                self.send_json(grid.parameters())
+            elif url.path == "/api/tracks":
+                plot = query.get("plot", ["hr"])[0]
+                if plot not in PLOTS:
+                    raise ValueError(f"Unknown plot {plot!r}")
+                window = tuple(float(v) for v in query["window"][0].split(",")) if "window" in query else None
+                budget = min(int(query.get("points", [self.server.budget])[0]), self.server.budget)
+                self.send_json(grid.tracks(plot, parse_filters(query), budget, window))
+            else:
+                self.send_error(404)
+        except (ValueError, KeyError) as e:
+            self.send_error(400, str(e))
+        except Exception as e:
+            # Requests are not logged, so show what went wrong in the terminal
+            traceback.print_exc()
+            self.send_error(500, f"{type(e).__name__}: {e}")
+
+    def send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, obj):
+        self.send(json.dumps(obj, separators=(",", ":")).encode(), "application/json")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(batch_runs_dir="../runs", host="127.0.0.1", port=8050, budget=POINT_BUDGET, workers=None):
+    """Serve the explorer until Ctrl-C."""
+    server = ThreadingHTTPServer((host, port), ExplorerHandler)
+    server.grid = GridData(batch_runs_dir, workers)
+    server.budget = budget
+    print(f"Exploring {len(server.grid.catalog)} runs at http://{host}:{port} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>MESA grid explorer</title>
+<style>
+body { font-family: sans-serif; margin: 0; display: flex; height: 100vh; }
+#side { width: 230px; padding: 10px; overflow-y: auto; border-right: 1px solid #ccc; font-size: 13px; }
+#side h3 { margin: 10px 0 4px; font-size: 14px; }
+#panels { flex: 1; display: grid; grid-template-columns: 1fr 1fr; grid-auto-rows: 48vh; gap: 6px; padding: 6px; }
+canvas { width: 100%; height: 100%; border: 1px solid #ddd; cursor: crosshair; }
+#status { font-size: 12px; color: #333; margin-top: 10px; white-space: pre-wrap; }
+</style></head>
+<body>
+<div id="side"><div id="filters"></div><h3>Panels</h3><div id="plots"></div>
+<p><button id="apply">Show</button></p>
+<div>Drag to zoom, double-click to reset.</div><div id="status"></div></div>
+<div id="panels"></div>
+<script>
+const DASH = {none: [6, 4], exponential: [], step: [2, 3]};
+let info, panels = {};
+
+function checked(name) {
+  return [...document.querySelectorAll(`input[name="${name}"]:checked`)].map(e => e.value);
+}
+function filterQuery() {
+  return Object.keys(info.parameters).map(k => k + "=" + encodeURIComponent(checked(k).join(","))).join("&");
+}
+function colour(run) {
+  const masses = info.parameters.mass, i = masses.indexOf(run.mass);
+  return `hsl(${Math.round(300 * i / Math.max(masses.length - 1, 1))}, 80%, 40%)`;
+}
+function niceTicks(lo, hi, n) {
+  const step = Math.pow(10, Math.floor(Math.log10((hi - lo) / n || 1)));
+  const mult = [1, 2, 5, 10].find(m => (hi - lo) / (m * step) <= n) * step;
+  const ticks = [];
+  for (let t = Math.ceil(lo / mult) * mult; t <= hi; t += mult) ticks.push(+t.toPrecision(10));
+  return ticks;
+}
+
+class Panel {
+  constructor(plot) {
+    this.plot = plot; this.canvas = document.createElement("canvas");
+    document.getElementById("panels").appendChild(this.canvas);
+    this.ctx = this.canvas.getContext("2d"); this.data = null; this.zoom = null; this.drag = null;
+    this.canvas.onmousedown = e => { this.drag = [e.offsetX, e.offsetY, e.offsetX, e.offsetY]; };
+    this.canvas.onmousemove = e => this.move(e);
+    this.canvas.onmouseup = e => this.release(e);
+    this.canvas.ondblclick = () => { this.zoom = null; this.fetch(); };
+  }
+  async fetch() {
+    const w = this.zoom ? "&window=" + this.zoom.join(",") : "";
+    const response = await fetch(`/api/tracks?plot=${this.plot}&${filterQuery()}${w}`);
+    this.data = await response.json(); this.draw();
+  }
+  limits() {
+    if (this.zoom) return this.zoom;
+    let x0 = Infinity, x1 = -Infinity, y0 = Infinity, y1 = -Infinity;
+    for (let i = 0; i < this.data.x.length; i++)
+      for (let j = 0; j < this.data.x[i].length; j++) {
+        const x = this.data.x[i][j], y = this.data.y[i][j];
+        if (x === null) continue;
+        x0 = Math.min(x0, x); x1 = Math.max(x1, x); y0 = Math.min(y0, y); y1 = Math.max(y1, y);
+      }
+    if (!isFinite(x0)) return [0, 1, 0, 1];
+    const dx = (x1 - x0) * 0.03 || 1, dy = (y1 - y0) * 0.03 || 1;
+    return [x0 - dx, x1 + dx, y0 - dy, y1 + dy];
+  }
+  draw() {
+    const c = this.canvas, ctx = this.ctx, d = this.data;
+    c.width = c.clientWidth; c.height = c.clientHeight;
+    const m = {l: 60, r: 12, t: 24, b: 40}, W = c.width - m.l - m.r, H = c.height - m.t - m.b;
+    const [x0, x1, y0, y1] = this.lim = this.limits();
+    const flip = d.invert_x;
+    this.sx = x => m.l + W * (flip ? (x1 - x) : (x - x0)) / (x1 - x0);
+    this.sy = y => m.t + H * (y1 - y) / (y1 - y0);
+    this.ix = px => flip ? x1 - (px - m.l) / W * (x1 - x0) : x0 + (px - m.l) / W * (x1 - x0);
+    this.iy = py => y1 - (py - m.t) / H * (y1 - y0);
+    ctx.clearRect(0, 0, c.width, c.height);
+    ctx.font = "12px sans-serif"; ctx.fillStyle = "#000"; ctx.strokeStyle = "#ccc"; ctx.lineWidth = 1;
+    ctx.textAlign = "center";
+    for (const t of niceTicks(Math.min(x0, x1), Math.max(x0, x1), 6)) {
+      ctx.beginPath(); ctx.moveTo(this.sx(t), m.t); ctx.lineTo(this.sx(t), m.t + H); ctx.stroke();
+      ctx.fillText(t, this.sx(t), m.t + H + 14);
+    }
+    ctx.textAlign = "right";
+    for (const t of niceTicks(Math.min(y0, y1), Math.max(y0, y1), 6)) {
+      ctx.beginPath(); ctx.moveTo(m.l, this.sy(t)); ctx.lineTo(m.l + W, this.sy(t)); ctx.stroke();
+      ctx.fillText(t, m.l - 4, this.sy(t) + 4);
+    }
+    ctx.textAlign = "center";
+    ctx.fillText(`${d.title} (${d.runs.length} runs)`, m.l + W / 2, 15);
+    ctx.fillText(d.xlabel, m.l + W / 2, c.height - 6);
+    ctx.save(); ctx.translate(14, m.t + H / 2); ctx.rotate(-Math.PI / 2); ctx.fillText(d.ylabel, 0, 0); ctx.restore();
+    ctx.save(); ctx.beginPath(); ctx.rect(m.l, m.t, W, H); ctx.clip(); ctx.lineWidth = 1.5;
+    d.runs.forEach((run, i) => {
+      ctx.strokeStyle = colour(run); ctx.setLineDash(DASH[run.scheme] || []);
+      ctx.globalAlpha = run.scheme === "none" ? 1 : 0.3 + 0.7 * run.fov;
+      ctx.beginPath(); let pen = false;
+      for (let j = 0; j < d.x[i].length; j++) {
+        if (d.x[i][j] === null) { pen = false; continue; }
+        const px = this.sx(d.x[i][j]), py = this.sy(d.y[i][j]);
+        pen ? ctx.lineTo(px, py) : ctx.moveTo(px, py); pen = true;
+      }
+      ctx.stroke();
+    });
+    ctx.restore(); ctx.setLineDash([]); ctx.globalAlpha = 1;
+    ctx.strokeStyle = "#000"; ctx.strokeRect(m.l, m.t, W, H);
+  }
+  move(e) {
+    if (!this.data) return;
+    if (this.drag) {
+      this.drag[2] = e.offsetX; this.drag[3] = e.offsetY; this.draw();
+      const [a, b, cx, cy] = this.drag; this.ctx.strokeStyle = "#000";
+      this.ctx.strokeRect(Math.min(a, cx), Math.min(b, cy), Math.abs(cx - a), Math.abs(cy - b));
+      return;
+    }
+    let best = 100, run = null;
+    this.data.runs.forEach((r, i) => {
+      for (let j = 0; j < this.data.x[i].length; j++) {
+        if (this.data.x[i][j] === null) continue;
+        const dx = this.sx(this.data.x[i][j]) - e.offsetX, dy = this.sy(this.data.y[i][j]) - e.offsetY;
+        if (dx * dx + dy * dy < best) { best = dx * dx + dy * dy; run = r; }
+      }
+    });
+    document.getElementById("status").textContent = run ?
+      `${run.name}\\nM=${run.mass} Z=${run.metallicity}\\n${run.scheme} fov=${run.fov} f0=${run.f0}` : "";
+  }
+  release(e) {
+    const [a, b, cx, cy] = this.drag; this.drag = null;
+    if (Math.abs(cx - a) < 5 || Math.abs(cy - b) < 5) { this.draw(); return; }
+    this.zoom = [this.ix(Math.min(a, cx)), this.ix(Math.max(a, cx)), this.iy(Math.max(b, cy)), this.iy(Math.min(b, cy))];
+    if (this.data.invert_x) this.zoom = [this.zoom[1], this.zoom[0], this.zoom[2], this.zoom[3]];
+    this.fetch();
+  }
+}
+
+function show() {
+  document.getElementById("panels").innerHTML = ""; panels = {};
+  for (const plot of checked("plot")) { panels[plot] = new Panel(plot); panels[plot].fetch(); }
+}
+
+(async function () {
+  info = await (await fetch("/api/parameters")).json();
+  let html = `<b>${info.n_runs} runs</b>`;
+  for (const [key, values] of Object.entries(info.parameters)) {
+    html += `<h3>${key}</h3>` + values.map(v =>
+      `<label><input type="checkbox" name="${key}" value="${v}"> ${v}</label><br>`).join("");
+  }
+  document.getElementById("filters").innerHTML = html;
+  document.getElementById("plots").innerHTML = Object.entries(info.plots).map(([name, title], i) =>
+    `<label><input type="checkbox" name="plot" value="${name}" ${i < 4 ? "checked" : ""}> ${title}</label><br>`).join("");
+  document.getElementById("apply").onclick = show;
+  window.onresize = () => Object.values(panels).forEach(p => p.data && p.draw());
+  show();
+})();
+</script></body></html>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Explore the grid in a web browser.")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: this machine only)")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--budget", type=int, default=POINT_BUDGET, help="points sent per panel")
+    parser.add_argument("--workers", type=int, help="worker processes for reading run files")
+    args = parser.parse_args()
+    serve(args.runs, args.host, args.port, args.budget, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+figure_cache.py - Skip re-rendering figures whose inputs have not changed
+
+Each figure is keyed on the fingerprints of the data files it reads, the source of the
+function that draws it (plus an optional version string) and the parameters it is
+drawn with. The keys and the fingerprints of the files written are kept in a manifest
+in the plots directory; a figure is drawn again only when its key changes or one of
+its outputs has been removed or overwritten. Delete the manifest to redraw everything.
+
+    cache = FigureCache("plots")
+    cache.render("core_mass", ["plots/core_mass_vs_log_age.png"], history_files,
+                 plot_core_mass_evolution, (runs_data, run_params, "plots"), params=run_params)
+"""
+
+import os
+import time
+import json
+import hashlib
+import inspect
+
+from batch.cache import file_fingerprint, load_json, save_json
+from batch.loader import history_path, final_profile_path
+
+MANIFEST_NAME = "figure_manifest.json"
+
+
+def function_version(function, version=None):
+    """Short hash of a function's source code and an optional explicit version."""
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        source = f"{function.__module__}.{function.__qualname__}"
+    return hashlib.sha1(f"{source}\n{version}".encode()).hexdigest()[:12]
+
+
+def run_inputs(run_dirs, kind="history"):
+    """Data files a grid figure reads: the history files, or the final profiles, of the runs."""
+    if kind == "history":
+        return [history_path(d) for d in run_dirs]
+    return [path for path in (final_profile_path(d) for d in run_dirs) if path]
+
+
+def _plain(obj):
+    """Parameters as plain JSON values, so they compare equal after a round trip through the manifest."""
+    return json.loads(json.dumps(obj, sort_keys=True, default=str))
+
+
+class FigureCache:
+    """Manifest of rendered figures and the inputs they were rendered from."""
+
+    def __init__(self, plots_dir="plots", force=False):
+        self.plots_dir = plots_dir
+        self.manifest_path = os.path.join(plots_dir, MANIFEST_NAME)
+        self.force = force
+        self.entries = load_json(self.manifest_path, {})
+
+    def key(self, function, inputs, params=None, version=None):
+        """What a figure depends on: input fingerprints, function version and parameters."""
+        return {
+            # Not the module: a script run as __main__ must match the same function imported
+            "function": function.__qualname__,
+            "version": function_version(function, version),
+            "params": _plain(params),
+            "inputs": {path: file_fingerprint(path) for path in sorted(inputs)},
+        }
+
+    def is_current(self, name, outputs, key):
+        """True if `name` was rendered with this key and its outputs are untouched since."""
+        entry = self.entries.get(name)
+        if self.force or entry is None or entry["key"] != key:
+            return False
+        fingerprints = {path: file_fingerprint(path) for path in outputs}
+        return None not in fingerprints.values() and entry["outputs"] == fingerprints
+
+    def stale(self, figures):
+        """Names of the figures that need drawing, from a dict of name -> (outputs, key)."""
+        return [name for name, (outputs, key) in figures.items() if not self.is_current(name, outputs, key)]
+
+    def record(self, name, outputs, key):
+        """
+        Store the key and output fingerprints of a freshly rendered figure and save the manifest.
+
+        If any output was not written (e.g. an animation that failed), the entry is dropped
+        instead, so the figure is drawn again next time. Returns True if it was recorded.
+        """
+        fingerprints = {path: file_fingerprint(path) for path in outputs}
+        if all(fingerprint is not None for fingerprint in fingerprints.values()):
+            self.entries[name] = {
+                "key": key,
+                "outputs": fingerprints,
+                "rendered": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        elif self.entries.pop(name, None) is None:
+            return False
+        os.makedirs(self.plots_dir, exist_ok=True)
+        save_json(self.manifest_path, self.entries)
+        return name in self.entries
+
+    def render(self, name, outputs, inputs, function, args=(), params=None, version=None):
+        """
+        Call function(*args) unless the figure is up to date.
+
+        Parameters:
+        name (str): Manifest entry of the figure
+        outputs (list): Files the function writes
+        inputs (list): Data files the figure is drawn from
+        function: Plotting function
+        args (tuple): Arguments of the function
+        params: JSON-serialisable parameters that change the figure
+        version (str): Bump to force a redraw when something outside the function changed
+
+        Returns True if the figure was drawn. A function returning False (failure) is not recorded.
+        """
+        key = self.key(function, inputs, params, version)
+        if self.is_current(name, outputs, key):
+            print(f"{name} is up to date, skipping")
+            return False
+        if function(*args) is False:
+            return False
+        self.record(name, outputs, key)
+        return True
@@ -0,0 +1,208 @@
+"""
+frames.py - Review pgstar PNG frames: index, keyframes, contact sheets and movies
+
+With Grid1_file_flag set, pgstar writes one PNG per model to png/ (000280.png, ...),
+named after the model number. The frames of a run are indexed and joined to the
+history by model number, so every frame knows its age and central abundances.
+Instead of flipping through hundreds of frames, keyframes are picked where the run
+passes physical milestones (center_he4 falling below 0.9, 0.8, ...) and laid out on
+one contact sheet, or the frames are assembled into a movie.
+
+Frames are decoded and shrunk in worker processes and come back in order a few at a
+time (see animate.imap_ordered). Contact sheets, GIF and MP4 movies are written as the
+frames arrive, so memory holds the output and a handful of frames; a WebP movie keeps
+every shrunk frame until it is written, so use --step or another format for long runs.
+
+    python -m batch.frames ../../../lab2/output_overshoot --movie plots/overshoot.gif
+    python -m batch.frames                          # keyframe sheet of every lab2 output
+"""
+
+import os
+import re
+import argparse
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from batch.animate import imap_ordered, write_animation
+from batch.loader import LAB2_DIR, LAB2_OUTPUTS, read_mesa_table
+
+FRAME_PATTERN = re.compile(r"^(.*?)(\d+)\.png$")
+
+HISTORY_COLUMNS = ("model_number", "star_age", "center_h1", "center_he4")
+
+# Central helium fractions marking the progress of core helium burning
+HE4_MILESTONES = (0.95, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1, 0.05, 0.01)
+
+# Set in each worker by _init_reader
+_reader = {}
+
+
+def frame_dirs(path):
+    """(png directory, LOGS directory) of a run directory or of its png directory."""
+    path = os.path.normpath(path)
+    if os.path.basename(path) == "png":
+        return path, os.path.join(os.path.dirname(path), "LOGS")
+    return os.path.join(path, "png"), os.path.join(path, "LOGS")
+
+
+def index_frames(png_dir, prefix=None):
+    """
+    Frames in a pgstar png directory, sorted by model number.
+
+    Returns a dict with model_number (int array) and path (list). With several file
+    prefixes in one directory (e.g. two grids), pass the one to index.
+    """
+    frames = []
+    for name in os.listdir(png_dir):
+        match = FRAME_PATTERN.match(name)
+        if match and (prefix is None or match.group(1) == prefix):
+            frames.append((int(match.group(2)), os.path.join(png_dir, name)))
+    frames.sort()
+    return {"model_number": np.array([m for m, _ in frames], dtype=int), "path": [p for _, p in frames]}
+
+
+def join_history(frames, history_file, columns=HISTORY_COLUMNS):
+    """
+    History values at every frame's model number.
+
+    pgstar usually writes more often than the history, so values are interpolated
+    linearly in model number; frames outside the history get NaN.
+    """
+    table = read_mesa_table(history_file, columns=columns)
+    models = table.model_number.astype(float)
+    joined = {}
+    for column in columns:
+        if column != "model_number" and hasattr(table, column):
+            joined[column] = np.interp(frames["model_number"], models, getattr(table, column),
+                                       left=np.nan, right=np.nan)
+    return joined
+
+
+def keyframes(values, milestones=HE4_MILESTONES):
+    """
+    Frame indices where `values` first falls to or below each milestone, plus the
+    first and last frames. Milestones the run never reaches are skipped.
+    """
+    values = np.asarray(values, dtype=float)
+    picked = {0, len(values) - 1}
+    for milestone in milestones:
+        below = np.flatnonzero(values <= milestone)
+        if len(below):
+            picked.add(int(below[0]))
+    return sorted(picked)
+
+
+def _init_reader(width, palette_path, colors):
+    _reader.update(width=width, palette=None)
+    if colors:
+        _reader["palette"] = _shrink(palette_path).quantize(colors=colors, method=Image.Quantize.FASTOCTREE)
+
+
+def _shrink(path):
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        width = _reader["width"]
+        if width and image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS,
+                                 reducing_gap=2.0)
+        return image
+
+
+def _read_frame(path):
+    """Worker: one frame, decoded, shrunk and (for GIFs) mapped to the shared palette."""
+    image = _shrink(path)
+    if _reader["palette"] is not None:
+        image = image.quantize(palette=_reader["palette"], dither=Image.Dither.NONE)
+    return image
+
+
+def read_frames(paths, width=None, colors=0, workers=None):
+    """Yield the frames at `paths` in order, at most `width` pixels wide, decoded in parallel."""
+    if not paths:
+        return iter(())
+    return imap_ordered(_read_frame, paths, workers, _init_reader, (width, paths[0], colors))
+
+
+def contact_sheet(paths, labels, output, ncols=4, width=480, workers=None):
+    """Lay frames out on one labelled sheet, pasting each as it arrives. Returns the output path."""
+    nrows = int(np.ceil(len(paths) / ncols))
+    label_height = 18
+    sheet = None
+    for i, frame in enumerate(read_frames(paths, width, workers=workers)):
+        if sheet is None:
+            cell_w, cell_h = frame.width, frame.height + label_height
+            sheet = Image.new("RGB", (ncols * cell_w, nrows * cell_h), "white")
+            draw = ImageDraw.Draw(sheet)
+        x, y = (i % ncols) * cell_w, (i // ncols) * cell_h
+        sheet.paste(frame, (x, y + label_height))
+        draw.text((x + 4, y + 3), labels[i], fill="black")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    sheet.save(output)
+    return output
+
+
+def frame_label(frames, joined, i):
+    label = f"model {frames['model_number'][i]}"
+    if "center_he4" in joined and np.isfinite(joined["center_he4"][i]):
+        label += f"   He4_c = {joined['center_he4'][i]:.3f}"
+    if "star_age" in joined and np.isfinite(joined["star_age"][i]):
+        label += f"   age = {joined['star_age'][i] / 1e6:.2f} Myr"
+    return label
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Contact sheets and movies of pgstar PNG frames.")
+    parser.add_argument("paths", nargs="*", help="run or png directories (default: the lab2 outputs)")
+    parser.add_argument("--lab2", default=LAB2_DIR, help="lab2 directory")
+    parser.add_argument("--prefix", help="only frames with this file prefix")
+    parser.add_argument("--movie", metavar="FILE", help="assemble every --step-th frame into a .gif, .webp or .mp4")
+    parser.add_argument("--step", type=int, default=1, help="use every step-th frame in the movie")
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--colors", type=int, default=256, help="GIF palette size")
+    parser.add_argument("--every-frame", action="store_true", help="sheet of all frames instead of keyframes")
+    parser.add_argument("--ncols", type=int, default=4)
+    parser.add_argument("--width", type=int, default=480, help="width of each frame in pixels")
+    parser.add_argument("--plots", default="plots", help="directory for the contact sheets")
+    parser.add_argument("--workers", type=int, help="worker processes (default: every core)")
+    args = parser.parse_args()
+
+    paths = args.paths or [os.path.join(args.lab2, output) for output in LAB2_OUTPUTS]
+    for path in paths:
+        png_dir, logs = frame_dirs(path)
+        if not os.path.isdir(png_dir):
+            print(f"Skipping {path}: no png directory")
+            continue
+        frames = index_frames(png_dir, args.prefix)
+        if not len(frames["path"]):
+            print(f"Skipping {path}: no frames")
+            continue
+        history_file = os.path.join(logs, "history.data")
+        joined = join_history(frames, history_file) if os.path.exists(history_file) else {}
+        label = os.path.basename(os.path.dirname(os.path.abspath(png_dir)))
+        print(f"{label}: {len(frames['path'])} frames, models "
+              f"{frames['model_number'][0]}-{frames['model_number'][-1]}")
+
+        if args.movie:
+            output = args.movie if len(paths) == 1 else \
+                os.path.join(os.path.dirname(args.movie), f"{label}_{os.path.basename(args.movie)}")
+            selected = frames["path"][::args.step]
+            gif = output.lower().endswith(".gif")
+            n = write_animation(output, read_frames(selected, args.width, args.colors if gif else 0, args.workers),
+                                args.fps)
+            print(f"  wrote {n} frames to {output}")
+            continue
+
+        if args.every_frame or "center_he4" not in joined:
+            chosen = list(range(len(frames["path"])))
+        else:
+            chosen = keyframes(joined["center_he4"])
+        for i in chosen:
+            print(f"  {frame_label(frames, joined, i)}")
+        output = contact_sheet([frames["path"][i] for i in chosen], [frame_label(frames, joined, i) for i in chosen],
+                               os.path.join(args.plots, f"frames_{label}.png"), args.ncols, args.width, args.workers)
+        print(f"  saved contact sheet of {len(chosen)} frames to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+isochrones.py - Isochrones interpolated in mass from EEP-aligned tracks
+
+For one physics setting (Z, overshoot scheme, fov, f0) the tracks of the different
+initial masses are put on a common EEP axis (see eep.py). At a given age and EEP the
+initial mass is found by interpolating log10(age) against log10(mass) between the two
+neighbouring masses whose ages bracket it; every other quantity is interpolated with
+the same weights. All ages and EEPs are handled together, so the cost is one array
+operation per pair of neighbouring masses.
+
+    python -m batch.isochrones --z 0.014 --scheme step --fov 0.1 --f0 0.001 --ages 50 100 500
+"""
+
+import os
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from batch.catalog import RunCatalog
+from batch.loader import load_histories, report_errors
+from batch.eep import resample_eeps, EEP_COLUMNS
+
+ISOCHRONE_COLUMNS = ("log_Teff", "log_L", "mass_conv_core", "he_core_mass")
+
+
+def build_isochrones(tracks, masses, ages, columns=ISOCHRONE_COLUMNS):
+    """
+    Interpolate isochrones from EEP tracks of different initial masses.
+
+    Parameters:
+    tracks (dict): column -> (n_mass, n_eep) array, must include star_age
+    masses (array): initial mass of each track
+    ages (array): isochrone ages in years
+    columns (iterable): columns of tracks to interpolate
+
+    Returns a dict with "ages", "initial_mass" and one array per column, each of shape
+    (n_ages, n_eep). Points where no pair of neighbouring masses brackets the age are NaN.
+    """
+    order = np.argsort(masses)
+    log_mass = np.log10(np.asarray(masses, dtype=float)[order])
+    log_age = np.log10(tracks["star_age"][order])
+    values = {column: tracks[column][order] for column in columns if column in tracks}
+
+    target = np.log10(np.asarray(ages, dtype=float))[:, None]
+    n_eep = log_age.shape[1]
+    result = {"ages": np.asarray(ages, dtype=float),
+              "initial_mass": np.full((len(target), n_eep), np.nan)}
+    for column in values:
+        result[column] = np.full((len(target), n_eep), np.nan)
+
+    # Neighbouring masses, lowest first; the first pair that brackets the age wins.
+    # Pairs that do not bracket give out-of-range or inf weights, which are masked out.
+    with np.errstate(all="ignore"):
+        for k in range(len(log_mass) - 1):
+            a0 = log_age[k][None, :]
+            a1 = log_age[k + 1][None, :]
+            frac = (target - a0) / (a1 - a0)
+            bracketed = (frac >= 0.0) & (frac <= 1.0) & np.isnan(result["initial_mass"])
+
+            log_m = log_mass[k] + frac * (log_mass[k + 1] - log_mass[k])
+            result["initial_mass"] = np.where(bracketed, 10 ** log_m, result["initial_mass"])
+            for column, v in values.items():
+                interpolated = v[k][None, :] + frac * (v[k + 1] - v[k])[None, :]
+                result[column] = np.where(bracketed, interpolated, result[column])
+
+    return result
+
+
+def grid_isochrones(catalog, ages, metallicity, scheme, fov=0.0, f0=0.0, columns=ISOCHRONE_COLUMNS,
+                    workers=None):
+    """Load the runs of one physics setting from a RunCatalog and build isochrones from them."""
+    run_params = catalog.select(metallicity=metallicity, scheme=scheme, fov=fov, f0=f0)
+    runs_data, errors = load_histories([p["path"] for p in run_params.values()],
+                                       columns=set(EEP_COLUMNS) | set(columns) | {"center_h1", "log_Lnuc"},
+                                       workers=workers)
+    report_errors(errors, "history")
+
+    eeps = resample_eeps(runs_data, columns=set(columns) | {"star_age"})
+    keep = [i for i, name in enumerate(eeps["run_names"]) if eeps["complete"][i]]
+    if len(keep) < 2:
+        raise ValueError(f"Need at least two complete tracks for Z={metallicity}, {scheme}, "
+                         f"fov={fov}, f0={f0}; found {len(keep)}")
+
+    masses = np.array([run_params[eeps["run_names"][i]]["mass"] for i in keep])
+    tracks = {column: array[keep] for column, array in eeps["tracks"].items()}
+    return build_isochrones(tracks, masses, ages, columns)
+
+
+def plot_isochrones(isochrones, title="", plots_dir="plots"):
+    os.makedirs(plots_dir, exist_ok=True)
+    fig, ax = plt.subplots(figsize=(10, 8))
+    colors = plt.cm.viridis(np.linspace(0, 1, len(isochrones["ages"])))
+    for i, age in enumerate(isochrones["ages"]):
+        ax.plot(isochrones["log_Teff"][i], isochrones["log_L"][i], color=colors[i], linewidth=2,
+                label=f"{age / 1e6:g} Myr")
+    ax.invert_xaxis()
+    ax.set_xlabel(r"$\log(T_{\mathrm{eff}}/\mathrm{K})$", fontsize=14)
+    ax.set_ylabel(r"$\log(L/L_{\odot})$", fontsize=14)
+    ax.set_title(f"Isochrones {title}", fontsize=16)
+    ax.grid(alpha=0.3)
+    if len(isochrones["ages"]) <= 15:
+        ax.legend(fontsize=9)
+    plt.tight_layout()
+    path = os.path.join(plots_dir, "isochrones.png")
+    plt.savefig(path, dpi=300)
+    plt.close(fig)
+    print(f"Saved isochrone plot to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build isochrones from the mass grid of one physics setting.")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--z", type=float, required=True, help="initial metallicity")
+    parser.add_argument("--scheme", default="none", help="overshoot scheme (none, step, exponential)")
+    parser.add_argument("--fov", type=float, default=0.0)
+    parser.add_argument("--f0", type=float, default=0.0)
+    parser.add_argument("--ages", type=float, nargs="+", required=True, help="ages in Myr")
+    parser.add_argument("--output", default="isochrones.npz", help="where to write the isochrone arrays")
+    parser.add_argument("--plot", action="store_true", help="also plot the isochrones in the HR diagram")
+    args = parser.parse_args()
+
+    isochrones = grid_isochrones(RunCatalog(args.runs), np.array(args.ages) * 1e6,
+                                 args.z, args.scheme, args.fov, args.f0)
+    np.savez(args.output, **isochrones)
+    print(f"Saved {len(args.ages)} isochrones to {args.output}")
+    if args.plot:
+        plot_isochrones(isochrones, f"(Z={args.z}, {args.scheme}, fov={args.fov}, f0={args.f0})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+kippenhahn.py - Kippenhahn diagrams from the mixing_regions and burning_regions columns
+
+my_history_columns.list asks MESA for `mixing_regions 20` and `burning_regions 20`,
+which log each model's structure as consecutive regions from the centre outwards:
+mix_type_k / mix_qtop_k and burn_type_k / burn_qtop_k, with q = m / M_star at the top
+of region k. These are decoded into (model x region) arrays, cached beside the history
+file, and rasterised onto a (time, mass) grid with one searchsorted call, so a diagram
+is two images instead of thousands of patches.
+
+    python -m batch.kippenhahn ../../../lab2/output_overshoot/LOGS --x star_age
+    python -m batch.kippenhahn                      # every run in ../runs, one panel each
+"""
+
+import os
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import ListedColormap
+from matplotlib.patches import Patch
+
+from batch.cache import column_cache_path, file_fingerprint, load_arrays, save_arrays
+from batch.catalog import RunCatalog
+from batch.loader import history_path, read_mesa_header, read_mesa_table
+
+# Mixing types from MESA's const_def.f90; 0 is no mixing, -1 pads unused regions
+MIXING_TYPES = {
+    1: ("convective", "#1f77b4"),
+    2: ("overshoot", "#2ca02c"),
+    3: ("semiconvective", "#ff7f0e"),
+    4: ("thermohaline", "#9467bd"),
+    5: ("rotational", "#8c564b"),
+    6: ("Rayleigh-Taylor", "#e377c2"),
+    7: ("minimum", "#7f7f7f"),
+    8: ("anonymous", "#bcbd22"),
+    9: ("leftover convective", "#17becf"),
+}
+
+BURN_INVALID = -9999
+BASE_COLUMNS = ("model_number", "star_age", "star_mass")
+
+
+def history_file(path):
+    """History file for a run directory, a LOGS directory or a history file."""
+    if os.path.isfile(path):
+        return path
+    if os.path.isfile(os.path.join(path, "history.data")):
+        return os.path.join(path, "history.data")
+    return history_path(path)
+
+
+def region_columns(names, prefix):
+    """Type and top column names of the regions logged with a prefix ("mix" or "burn")."""
+    pairs = []
+    k = 1
+    while f"{prefix}_type_{k}" in names and f"{prefix}_qtop_{k}" in names:
+        pairs.append((f"{prefix}_type_{k}", f"{prefix}_qtop_{k}"))
+        k += 1
+    return pairs
+
+
+def decode_regions(table, pairs, invalid):
+    """
+    Region types and tops of every model as (n_models, n_regions) arrays.
+
+    Unused regions (type == invalid) get type 0 and top 1, so they cover nothing.
+    Region k extends from the top of region k-1 (0 for the first) to its own top.
+    """
+    types = np.column_stack([getattr(table, t) for t, _ in pairs])
+    tops = np.column_stack([getattr(table, q) for _, q in pairs])
+    unused = types == invalid
+    types = np.where(unused, 0, types).astype(np.int16)
+    tops = np.where(unused, 1.0, np.clip(tops, 0.0, 1.0))
+    # Merged regions can leave rounding-level inversions; the search needs non-decreasing tops
+    tops = np.maximum.accumulate(tops, axis=1).astype(np.float32)
+    return types, tops
+
+
+def load_kippenhahn(path, use_cache=True):
+    """
+    Decoded region arrays of one run, from the column cache when the history is unchanged.
+
+    Returns a dict with model_number, star_age, star_mass (n_models,) and mix_type,
+    mix_top, burn_type, burn_top (n_models, n_regions).
+    """
+    hist_file = history_file(path)
+    fingerprint = file_fingerprint(hist_file)
+    if fingerprint is None:
+        raise FileNotFoundError(f"No history file for {path}")
+    cache_path = column_cache_path(hist_file, "kippenhahn")
+    if use_cache:
+        cached = load_arrays(cache_path, fingerprint)
+        if cached is not None:
+            return cached
+
+    with open(hist_file, "r") as f:
+        _, names = read_mesa_header(f)
+    mix_pairs = region_columns(names, "mix")
+    burn_pairs = region_columns(names, "burn")
+    if not mix_pairs and not burn_pairs:
+        raise ValueError(f"{hist_file} has no mixing_regions or burning_regions columns")
+
+    columns = list(BASE_COLUMNS) + [c for pair in mix_pairs + burn_pairs for c in pair]
+    table = read_mesa_table(hist_file, columns=columns)
+    kipp = {name: getattr(table, name) for name in BASE_COLUMNS}
+    n_models = len(table)
+    for prefix, pairs, invalid in (("mix", mix_pairs, -1), ("burn", burn_pairs, BURN_INVALID)):
+        if pairs:
+            kipp[f"{prefix}_type"], kipp[f"{prefix}_top"] = decode_regions(table, pairs, invalid)
+        else:
+            kipp[f"{prefix}_type"] = np.zeros((n_models, 1), dtype=np.int16)
+            kipp[f"{prefix}_top"] = np.ones((n_models, 1), dtype=np.float32)
+
+    if use_cache:
+        save_arrays(cache_path, fingerprint, kipp)
+    return kipp
+
+
+def rasterise(types, tops, star_mass, mass_grid, fill=-1):
+    """
+    Region type at every (model, mass) point.
+
+    Each model's tops are shifted into their own interval [2i, 2i + 1] so a single
+    np.searchsorted finds the region of every grid point of every model. Points above
+    the stellar surface get `fill`.
+    """
+    n_models, n_regions = tops.shape
+    q = mass_grid[None, :] / star_mass[:, None]
+    outside = q > 1.0
+    offset = 2.0 * np.arange(n_models)[:, None]
+    flat = (tops.astype(float) + offset).ravel()
+    region = np.searchsorted(flat, (np.minimum(q, 1.0) + offset).ravel(), side="left")
+    region = region.reshape(q.shape) - n_regions * np.arange(n_models)[:, None]
+    region = np.clip(region, 0, n_regions - 1)
+    image = np.take_along_axis(types, region, axis=1)
+    return np.where(outside, fill, image)
+
+
+def time_axis(kipp, x="model_number", n_time=1000):
+    """
+    Evenly spaced values of the time coordinate and the model shown at each.
+
+    x is "model_number", "star_age" or "log_age_left" (log10 of the time left until the
+    last model, which spreads out the end of the run).
+    """
+    if x == "log_age_left":
+        age = np.asarray(kipp["star_age"], dtype=float)
+        steps = np.diff(age)
+        smallest = steps[steps > 0].min() if np.any(steps > 0) else 1.0
+        values = -np.log10(age[-1] - age + smallest)
+    else:
+        values = np.asarray(kipp[x], dtype=float)
+    n_time = min(n_time, len(values))
+    grid = np.linspace(values[0], values[-1], n_time)
+    rows = np.clip(np.searchsorted(values, grid, side="right") - 1, 0, len(values) - 1)
+    return grid, rows
+
+
+def legend_handles(mixing_types):
+    """Legend entries for the given mixing types and the burning colour ramp."""
+    handles = [Patch(color=MIXING_TYPES[t][1], alpha=0.6, label=MIXING_TYPES[t][0])
+               for t in sorted(mixing_types) if t in MIXING_TYPES]
+    handles.append(Patch(color=plt.cm.YlOrRd(0.6), label=r"burning, $\log\,\epsilon$"))
+    return handles
+
+
+def plot_kippenhahn(ax, kipp, x="model_number", n_time=1000, n_mass=500, m_max=None, legend=True):
+    """
+    Draw one Kippenhahn diagram: burning as a colour ramp, mixing regions on top.
+
+    Returns the set of mixing types that appear in the diagram.
+    """
+    grid, rows = time_axis(kipp, x, n_time)
+    star_mass = kipp["star_mass"][rows]
+    m_max = m_max or float(star_mass.max())
+    mass_grid = np.linspace(0.0, m_max, n_mass)
+    extent = (grid[0], grid[-1], 0.0, m_max)
+
+    burn = rasterise(kipp["burn_type"][rows], kipp["burn_top"][rows], star_mass, mass_grid, fill=0)
+    burn = np.ma.masked_less_equal(burn, 0)
+    ax.imshow(burn.T, origin="lower", aspect="auto", extent=extent, cmap="YlOrRd",
+              vmin=0, vmax=max(int(burn.max()) if burn.count() else 1, 1), interpolation="nearest")
+
+    mix = rasterise(kipp["mix_type"][rows], kipp["mix_top"][rows], star_mass, mass_grid, fill=0)
+    colors = ["none"] + [color for _, color in MIXING_TYPES.values()]
+    cmap = ListedColormap(colors)
+    mix = np.ma.masked_where((mix <= 0) | (mix > len(MIXING_TYPES)), mix)
+    ax.imshow(mix.T, origin="lower", aspect="auto", extent=extent, cmap=cmap, vmin=-0.5,
+              vmax=len(MIXING_TYPES) + 0.5, alpha=0.6, interpolation="nearest")
+
+    ax.plot(grid, star_mass, color="black", linewidth=1)
+    ax.set_xlim(grid[0], grid[-1])
+    ax.set_ylim(0.0, m_max * 1.02)
+    ax.set_xlabel({"model_number": "Model number", "star_age": "Age [yr]",
+                   "log_age_left": r"$-\log_{10}(t_{\mathrm{end}} - t)$ [yr]"}[x])
+    ax.set_ylabel(r"$m\ [M_\odot]$")
+
+    present = set(int(t) for t in np.unique(mix.compressed()))
+    if legend:
+        ax.legend(handles=legend_handles(present), loc="upper right", fontsize=8)
+    return present
+
+
+def plot_runs(paths, labels=None, x="model_number", output="plots/kippenhahn.png", ncols=4, use_cache=True):
+    """Kippenhahn diagrams of several runs as a panel, one subplot per run."""
+    if labels is None:
+        # LOGS directories and history files are named after the directory holding them
+        labels = [os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(history_file(p)))))
+                  for p in paths]
+    runs = []
+    for path, label in zip(paths, labels):
+        try:
+            runs.append((label, load_kippenhahn(path, use_cache)))
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+    if not runs:
+        print("No runs with region columns to plot")
+        return None
+
+    ncols = min(ncols, len(runs))
+    nrows = int(np.ceil(len(runs) / ncols))
+    fig, axes = plt.subplots(nrows, ncols, figsize=(5 * ncols, 4 * nrows), squeeze=False)
+    present = set()
+    for i, (label, kipp) in enumerate(runs):
+        ax = axes.flat[i]
+        present |= plot_kippenhahn(ax, kipp, x=x, legend=False)
+        ax.set_title(label, fontsize=9)
+    for ax in axes.flat[len(runs):]:
+        ax.set_visible(False)
+
+    # One legend for the whole panel, covering every mixing type that appears in any run
+    fig.legend(handles=legend_handles(present), loc="upper center", ncol=len(present) + 1, fontsize=9)
+    plt.tight_layout(rect=(0, 0, 1, 1 - 0.35 / (4 * nrows)))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    plt.savefig(output, dpi=200)
+    plt.close(fig)
+    print(f"Saved Kippenhahn diagram of {len(runs)} runs to {output}")
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kippenhahn diagrams from mixing and burning region columns.")
+    parser.add_argument("paths", nargs="*", help="run directories, LOGS directories or history files "
+                                                 "(default: every run in --runs)")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--x", default="model_number", choices=["model_number", "star_age", "log_age_left"])
+    parser.add_argument("--output", default="plots/kippenhahn.png")
+    parser.add_argument("--ncols", type=int, default=4)
+    parser.add_argument("--no-cache", action="store_true", help="decode the history again")
+    args = parser.parse_args()
+
+    paths = args.paths or RunCatalog(args.runs).run_dirs()
+    plot_runs(paths, x=args.x, output=args.output, ncols=args.ncols, use_cache=not args.no_cache)
+
+
+if __name__ == "__main__":
+    main()
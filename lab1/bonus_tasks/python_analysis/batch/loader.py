@@ -0,0 +1,305 @@
+"""
+loader.py - Parallel loading of MESA history and profile files into NumPy arrays
+
+Parsing the text output of MESA is CPU bound and every run is independent, so the
+files are fanned out over a process pool. Workers send back one compact structured
+array per file (plus the small header dict) rather than pickled mesa_reader objects.
+"""
+
+import io
+import os
+import glob
+import warnings
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# The lab2 single-star models, relative to python_analysis: one output directory per mixing setup
+LAB2_DIR = "../../../lab2"
+LAB2_OUTPUTS = ("output_no_overshoot", "output_overshoot", "output_overshoot_brunt")
+
+
+class MesaTable:
+    """
+    Columns of a MESA history or profile file.
+
+    Columns and header values are available as attributes, the same way as with
+    mesa_reader.MesaData, so `hasattr(data, 'log_Teff')` and `data.log_Teff` keep working.
+    """
+
+    def __init__(self, data, header=None, discarded_rows=0):
+        self.data = data
+        self.header = header if header is not None else {}
+        # Rows dropped because a restart wrote over them (see collapse_restarts)
+        self.discarded_rows = discarded_rows
+
+    def __getattr__(self, name):
+        # Guard dunder lookups so copying/pickling never recurses into __getattr__
+        if name.startswith("__"):
+            raise AttributeError(name)
+        data = self.__dict__.get("data")
+        if data is not None and name in data.dtype.names:
+            return data[name]
+        header = self.__dict__.get("header", {})
+        if name in header:
+            return header[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def bulk_names(self):
+        return self.data.dtype.names
+
+
+def _parse_header_value(token):
+    """Convert a header token to float where possible, stripping quotes from strings."""
+    if token.startswith('"'):
+        return token.strip('"')
+    try:
+        return float(token.replace("D", "E").replace("d", "e"))
+    except ValueError:
+        return token
+
+
+def read_mesa_header(f):
+    """
+    Read the six header lines of an open MESA file.
+
+    Returns the header dict and the list of column names. The file is left positioned
+    at the first data row.
+    """
+    f.readline()  # header column numbers
+    header_names = f.readline().split()
+    header_values = [_parse_header_value(v) for v in f.readline().split()]
+    f.readline()  # blank line
+    f.readline()  # column numbers
+    names = f.readline().split()
+    return dict(zip(header_names, header_values)), names
+
+
+def select_columns(names, columns=None, restarts=True):
+    """
+    Indices of the requested columns in a file's column names.
+
+    Names missing from the file are ignored. model_number is always kept when restart
+    collapsing is wanted, since it is needed to detect backtracking.
+    """
+    if columns is None:
+        return list(range(len(names)))
+    wanted = set(columns)
+    if restarts:
+        wanted.add("model_number")
+    return [i for i, name in enumerate(names) if name in wanted]
+
+
+def _parse_rows(f, usecols):
+    with warnings.catch_warnings():
+        # A run that has only just started may not have written any rows yet
+        warnings.simplefilter("ignore", UserWarning)
+        rows = np.loadtxt(f, usecols=usecols, ndmin=2)
+    if rows.size == 0:
+        rows = np.empty((0, len(usecols)))
+    return rows
+
+
+def rows_to_table(rows, names, header=None):
+    """Wrap a 2D float array of MESA rows as a MesaTable with one field per column."""
+    dtype = np.dtype([(name, np.float64) for name in names])
+    data = np.ascontiguousarray(rows, dtype=np.float64).view(dtype).reshape(-1)
+    return MesaTable(data, header)
+
+
+def collapse_restarts(table):
+    """
+    Keep only the last-written rows of a history that was appended to after a restart.
+
+    Resuming from a photo makes MESA write model numbers it had already written, so the
+    file backtracks. A row survives only if every row written after it has a larger
+    model number, which keeps the newest segment for each range of models. Returns a
+    new MesaTable whose discarded_rows counts the dropped rows, or the table itself if
+    model_number never backtracks.
+    """
+    if "model_number" not in table.data.dtype.names or len(table) < 2:
+        return table
+
+    model_number = table.data["model_number"]
+    if np.all(np.diff(model_number) > 0):
+        return table
+
+    # Smallest model number written at or after each row
+    later_min = np.minimum.accumulate(model_number[::-1])[::-1]
+    keep = np.ones(len(model_number), dtype=bool)
+    keep[:-1] = model_number[:-1] < later_min[1:]
+
+    n_discarded = len(keep) - np.count_nonzero(keep)
+    return MesaTable(table.data[keep], table.header, table.discarded_rows + n_discarded)
+
+
+def read_mesa_table(path, columns=None, restarts=True):
+    """
+    Read a MESA history or profile file.
+
+    Parameters:
+    path (str): Path to history.data or profileN.data
+    columns (iterable): Column names to keep. Names missing from the file are ignored.
+                        None keeps every column.
+    restarts (bool): Drop history rows superseded by a restart (see collapse_restarts)
+    """
+    with open(path, "r") as f:
+        header, names = read_mesa_header(f)
+        usecols = select_columns(names, columns, restarts)
+        rows = _parse_rows(f, usecols)
+
+    table = rows_to_table(rows, [names[i] for i in usecols], header)
+    return collapse_restarts(table) if restarts else table
+
+
+def read_last_rows(path, n_rows, columns=None, restarts=True, block_size=65536):
+    """
+    Read only the header and the last n_rows complete rows of a MESA file.
+
+    The file is read backwards from the end in blocks, so the cost does not depend on
+    how long the run was. Restart collapsing only looks at the rows that were read.
+    """
+    with open(path, "rb") as f:
+        header_text = b"".join(f.readline() for _ in range(6)).decode()
+        header, names = read_mesa_header(io.StringIO(header_text))
+        data_start = f.tell()
+
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        chunk = b""
+        # One extra newline: the last line may still be being written
+        while pos > data_start and chunk.count(b"\n") <= n_rows:
+            step = min(block_size, pos - data_start)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + chunk
+
+    # Drop a partial trailing line, then keep the last n_rows lines
+    chunk = chunk[:chunk.rfind(b"\n") + 1]
+    lines = chunk.splitlines()
+    if pos > data_start:
+        lines = lines[1:]  # first line may be cut off by the block boundary
+    lines = [line for line in lines[-n_rows:] if line.strip()]
+
+    usecols = select_columns(names, columns, restarts)
+    rows = _parse_rows(io.StringIO(b"\n".join(lines).decode()), usecols)
+    table = rows_to_table(rows, [names[i] for i in usecols], header)
+    return collapse_restarts(table) if restarts else table
+
+
+def history_path(run_dir):
+    """Path to the history file of a run directory."""
+    return os.path.join(run_dir, "LOGS", "history.data")
+
+
+def final_profile_path(run_dir):
+    """Path to the last profile written by a run, or None if there are no profiles."""
+    profile_files = sorted(glob.glob(os.path.join(run_dir, "LOGS", "profile*.data")),
+                           key=lambda x: int(os.path.basename(x)[7:-5]))
+    return profile_files[-1] if profile_files else None
+
+
+def _load_one(key, path, columns, reduce=None):
+    """Worker: parse one file (and reduce it), capturing any error instead of raising."""
+    try:
+        table = read_mesa_table(path, columns)
+        return key, reduce(table) if reduce is not None else table, None
+    except Exception as e:
+        return key, None, f"{type(e).__name__}: {e}"
+
+
+def iter_tables(paths, columns=None, workers=None, reduce=None):
+    """
+    Parse many MESA files in parallel, yielding (key, table, error) in the order of `paths`.
+
+    At most two files per worker are parsed ahead of the consumer, so however many files
+    there are, only a few parsed tables exist at a time. With reduce, each worker sends
+    back reduce(table) instead of the table (reduce must be picklable, e.g. a
+    functools.partial of a module-level function), so the full table never leaves it.
+    error is None for files that parsed, table is None for those that did not.
+    """
+    columns = list(columns) if columns is not None else None
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(paths)))
+
+    if workers == 1:
+        for key, path in paths.items():
+            yield _load_one(key, path, columns, reduce)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        items = iter(paths.items())
+        pending = deque(pool.submit(_load_one, key, path, columns, reduce)
+                        for key, path in islice(items, 2 * workers))
+        while pending:
+            result = pending.popleft().result()
+            for key, path in islice(items, 1):
+                pending.append(pool.submit(_load_one, key, path, columns, reduce))
+            yield result
+
+
+def load_tables(paths, columns=None, workers=None, reduce=None):
+    """
+    Parse many MESA files in parallel.
+
+    Parameters:
+    paths (dict): Maps any key (e.g. run name) to the file to parse
+    columns (iterable): Column names to keep, None for all
+    workers (int): Number of worker processes. None uses every core,
+                   1 parses in this process without a pool.
+    reduce: Applied to each table in the worker before it is sent back (see iter_tables)
+
+    Returns:
+    tables (dict): key -> MesaTable for every file that parsed
+    errors (dict): key -> error message for every file that failed
+    """
+    tables = {}
+    errors = {}
+    for key, table, error in iter_tables(paths, columns, workers, reduce):
+        if error is None:
+            tables[key] = table
+        else:
+            errors[key] = error
+
+    return tables, errors
+
+
+def load_histories(run_dirs, columns=None, workers=None, reduce=None):
+    """
+    Load history.data for each run directory in parallel.
+
+    Returns (runs_data, errors), both keyed by run name. Runs that have not written a
+    history file yet are skipped. reduce is applied in the workers (see iter_tables).
+    """
+    paths = {}
+    for run_dir in run_dirs:
+        path = history_path(run_dir)
+        if os.path.exists(path):
+            paths[os.path.basename(os.path.normpath(run_dir))] = path
+
+    return load_tables(paths, columns=columns, workers=workers, reduce=reduce)
+
+
+def load_final_profiles(run_dirs, columns=None, workers=None, reduce=None):
+    """Load the last profile of each run directory in parallel. Returns (profiles, errors)."""
+    paths = {}
+    for run_dir in run_dirs:
+        path = final_profile_path(run_dir)
+        if path is not None:
+            paths[os.path.basename(os.path.normpath(run_dir))] = path
+
+    return load_tables(paths, columns=columns, workers=workers, reduce=reduce)
+
+
+def report_errors(errors, what="file"):
+    """Print a short summary of load errors."""
+    for key, error in sorted(errors.items()):
+        print(f"Error loading {what} for {key}: {error}")
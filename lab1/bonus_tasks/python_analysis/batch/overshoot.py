@@ -0,0 +1,272 @@
+"""
+overshoot.py - Measure the overshoot MESA actually applied from the log_D_ovr profiles
+
+In the overshoot region above a convective core MESA sets
+
+    step         D = D0                                  for r0 < r < r0 + f Hp0
+    exponential  D = D0 exp(-2 (r - r0) / (f Hp0))
+
+where r0 lies f0 pressure scale heights inside the convective boundary, D0 is D_conv
+at r0 and Hp0 is the pressure scale height there. MESA marks every zone above r0 as
+overshoot, so log_D_ovr starts at r0 rather than at the convective boundary. For every
+profile the region where log_D_ovr is set is taken from the first overshoot zone
+outwards and ln D is fitted by least squares against distance in units of Hp0. Hp0 is
+taken the way MESA takes it, P / (rho g) at the boundary capped at r / alpha_MLT, with
+alpha_MLT read from the run's inlist (MESA's 2.0 if unset). r0 is taken halfway between
+the last convective zone and the first overshoot zone. The slope gives f for
+exponential overshoot, the extent from r0 gives f for step overshoot.
+
+f0 itself is not measured: the convective boundary lies inside the overshoot region,
+where D_conv is no longer written, and the profiles do not carry gradr and grada. f0
+only moves r0 and is smaller than a zone here (0.005 Hp0 for lab2), so the profiles
+cannot resolve it.
+
+All profiles of all runs are stacked into NaN-padded (n_profiles, n_zones) arrays and
+fitted together.
+
+    python -m batch.overshoot ../../../lab2/output_overshoot/LOGS
+    python -m batch.overshoot                       # final profile of every run in ../runs
+    python -m batch.overshoot --check               # recovers lab2's overshoot_f within 0.02?
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+from batch.catalog import RunCatalog, inlist_value
+from batch.loader import LAB2_DIR, LAB2_OUTPUTS, final_profile_path, load_tables, report_errors
+from batch.profile_cube import logs_dir, read_profiles_index
+
+OVERSHOOT_COLUMNS = ("logR", "logP", "logRho", "mass", "log_D_conv", "log_D_ovr")
+
+# cgs constants as in MESA, for the pressure scale height
+G = 6.67430e-8
+MSUN = 1.988409870698051e33
+RSUN = 6.957e10
+
+# MESA caps Hp0 at the radius of the convective core over alpha_MLT; MESA's default alpha,
+# used when the run's inlist does not set mixing_length_alpha
+MIXING_LENGTH_ALPHA = 2.0
+
+# MESA writes log_D = -99 where a coefficient is zero
+LOG_D_MIN = 0.0
+
+# ln D varying by less than this over the region means a step profile
+STEP_TOLERANCE = 0.05
+
+# Largest |fitted - configured f| accepted by check_lab2: both ends of the region are known to
+# within half a zone, and the lab2 zones there are at most 0.022 Hp0 wide
+CHECK_TOLERANCE = 0.02
+
+
+def stack_centre_out(profiles, columns):
+    """Columns of every profile as (n_profiles, max_zones) arrays ordered from the centre, NaN padded."""
+    lengths = np.array([len(p) for p in profiles], dtype=int)
+    arrays = {}
+    for column in columns:
+        stacked = np.full((len(profiles), lengths.max()), np.nan)
+        for i, profile in enumerate(profiles):
+            if hasattr(profile, column):
+                stacked[i, :lengths[i]] = getattr(profile, column)[::-1]
+        arrays[column] = stacked
+    return lengths, arrays
+
+
+def _at(a, index):
+    return np.take_along_axis(a, index[:, None], axis=1)[:, 0]
+
+
+def _line_fit(x, y, mask):
+    """Least-squares slope and intercept of y(x) over mask, per row; NaN with fewer than two points."""
+    n = mask.sum(axis=1)
+    x = np.where(mask, x, 0.0)
+    y = np.where(mask, y, 0.0)
+    sx, sy = x.sum(axis=1), y.sum(axis=1)
+    sxx, sxy = (x * x).sum(axis=1), (x * y).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = n * sxx - sx ** 2
+        slope = np.where((n >= 2) & (denominator > 0), (n * sxy - sx * sy) / denominator, np.nan)
+        intercept = (sy - slope * sx) / n
+    return slope, intercept
+
+
+def fit_overshoot(profiles, log_d_min=LOG_D_MIN, step_tolerance=STEP_TOLERANCE,
+                  mixing_length_alpha=MIXING_LENGTH_ALPHA):
+    """
+    Effective overshoot parameters of a list of profiles.
+
+    Returns a dict of (n_profiles,) arrays:
+        scheme        "step", "exponential" or "none" (no core overshoot region)
+        f_ov          fitted f
+        extent_hp     extent of the overshoot region from r0 in Hp0
+        extent_msun   extent of the overshoot region in mass
+        n_zones       zones in the overshoot region
+    """
+    lengths, a = stack_centre_out(profiles, OVERSHOOT_COLUMNS)
+    n_profiles, n_zones = a["logR"].shape
+    index = np.arange(n_zones)[None, :]
+    rows = np.arange(n_profiles)
+
+    r = 10 ** a["logR"]
+    ln_p = a["logP"] * np.log(10)
+    ln_d = a["log_D_ovr"] * np.log(10)
+    ovr = a["log_D_ovr"] > log_d_min
+    conv = a["log_D_conv"] > log_d_min
+
+    # Core overshoot starts at the first overshoot zone, directly above convective zones
+    start = np.argmax(ovr, axis=1)
+    found = ovr[rows, start] & (start > 0) & conv[rows, np.maximum(start - 1, 0)]
+    region = np.logical_and.accumulate(ovr | (index < start[:, None]), axis=1) & (index >= start[:, None])
+    region &= found[:, None]
+    last = np.where(found, n_zones - 1 - np.argmax(region[:, ::-1], axis=1), 0)
+
+    # Hp0 as MESA takes it at the boundary, between the last convective zone and the first
+    # overshoot zone: P / (rho g), capped at the core radius over alpha_MLT
+    # (limit_overshoot_Hp_using_size_of_convection_zone). Without logRho, -dr/dlnP
+    c = np.maximum(start - 1, 0)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        hp = 10 ** (a["logP"] - a["logRho"]) * (r * RSUN) ** 2 / (G * a["mass"] * MSUN) / RSUN
+        hp0 = np.minimum(0.5 * (_at(hp, c) + _at(hp, start)),
+                         0.5 * (_at(r, c) + _at(r, start)) / mixing_length_alpha)
+        hp0_fd = -(_at(r, start) - _at(r, c)) / (_at(ln_p, start) - _at(ln_p, c))
+    hp0 = np.where(np.isfinite(hp0), hp0, hp0_fd)
+    r_start = _at(r, start)
+    z = (r - r_start[:, None]) / hp0[:, None]
+
+    slope, _ = _line_fit(z, ln_d, region)
+    ln_d_ptp = np.nanmax(np.where(region, ln_d, np.nan), axis=1, initial=-np.inf) - \
+        np.nanmin(np.where(region, ln_d, np.nan), axis=1, initial=np.inf)
+    is_step = found & (ln_d_ptp < step_tolerance)
+    is_exponential = found & ~is_step & (slope < 0)
+
+    # r0 lies between the last convective zone and the first overshoot zone, and the region
+    # ends between the last overshoot zone and the next; both are taken halfway, so the
+    # extent is good to about one zone either way. (D_conv falls steeply towards the
+    # boundary, so extrapolating it outwards to meet D0 puts r0 too far out.)
+    z0 = 0.5 * _at(z, c)
+    z_last = _at(z, last)
+    z_next = _at(z, np.minimum(last + 1, lengths - 1))
+    extent_hp = np.where(found, 0.5 * (z_last + z_next) - z0, np.nan)
+    extent_msun = np.where(found, np.abs(_at(a["mass"], last) - _at(a["mass"], start)), np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f_ov = np.where(is_step, extent_hp, np.where(is_exponential, -2.0 / slope, np.nan))
+
+    scheme = np.where(is_step, "step", np.where(is_exponential, "exponential", "none")).astype(object)
+    return {"scheme": scheme, "f_ov": f_ov, "extent_hp": extent_hp,
+            "extent_msun": extent_msun, "n_zones": region.sum(axis=1)}
+
+
+def run_mixing_length_alpha(path):
+    """
+    alpha_MLT of a run or LOGS directory, from the inlist_project in the run directory or
+    the one above it (lab2 keeps its outputs in subdirectories), else MESA's default.
+    """
+    run_dir = os.path.dirname(os.path.abspath(logs_dir(path)))
+    for directory in (run_dir, os.path.dirname(run_dir)):
+        inlist = os.path.join(directory, "inlist_project")
+        if os.path.exists(inlist):
+            alpha = inlist_value(inlist, "mixing_length_alpha")
+            return MIXING_LENGTH_ALPHA if alpha is None else alpha
+    return MIXING_LENGTH_ALPHA
+
+
+def fit_runs(paths, all_profiles=True, workers=None):
+    """
+    Fit every profile (or only the final one) of several runs in one batched pass.
+
+    paths are run or LOGS directories. Returns {path: dict of per-profile arrays, with
+    model_number added}, in profile order.
+    """
+    files = {}
+    for path in paths:
+        logs = logs_dir(path)
+        if all_profiles and os.path.exists(os.path.join(logs, "profiles.index")):
+            for n in read_profiles_index(logs)["profile_number"]:
+                files[(path, int(n))] = os.path.join(logs, f"profile{n}.data")
+        else:
+            profile_file = final_profile_path(os.path.dirname(logs))
+            if profile_file:
+                files[(path, 0)] = profile_file
+
+    tables, errors = load_tables({k: v for k, v in files.items() if os.path.exists(v)},
+                                 columns=OVERSHOOT_COLUMNS, workers=workers)
+    report_errors(errors, "profile")
+    keys = [k for k in files if k in tables]
+    if not keys:
+        return {}
+
+    alpha = {path: run_mixing_length_alpha(path) for path in paths}
+    fits = fit_overshoot([tables[k] for k in keys], mixing_length_alpha=np.array([alpha[k[0]] for k in keys]))
+    results = {}
+    for path in paths:
+        selected = [i for i, k in enumerate(keys) if k[0] == path]
+        if selected:
+            results[path] = {name: values[selected] for name, values in fits.items()}
+            results[path]["model_number"] = np.array([tables[keys[i]].model_number for i in selected])
+    return results
+
+
+def fit_values(fits, index=-1):
+    """One profile's fit from the arrays of fit_overshoot (or fit_runs) as plain floats."""
+    return {"scheme_fit": str(fits["scheme"][index]),
+            **{name: float(fits[name][index]) for name in ("f_ov", "extent_hp", "extent_msun")}}
+
+
+def fit_final_profile(run_dir):
+    """Overshoot fit of a run's final profile as plain floats, or None without a profile."""
+    results = fit_runs([run_dir], all_profiles=False, workers=1)
+    if run_dir not in results:
+        return None
+    return fit_values(results[run_dir])
+
+
+def check_lab2(lab2_dir=LAB2_DIR, tolerance=CHECK_TOLERANCE):
+    """
+    Fit the step overshoot profiles of lab2's output_overshoot and compare them with the
+    overshoot_f(1) set in lab2's inlist_project. Returns True if every fit is within tolerance.
+    """
+    logs = os.path.join(lab2_dir, LAB2_OUTPUTS[1], "LOGS")
+    configured = inlist_value(os.path.join(lab2_dir, "inlist_project"), "overshoot_f(1)")
+    fits = fit_runs([logs], workers=1).get(logs)
+    if configured is None or fits is None or not np.any(fits["scheme"] == "step"):
+        print(f"Nothing to check: no overshoot_f(1) in {lab2_dir}/inlist_project or no step profiles in {logs}")
+        return False
+
+    step = fits["scheme"] == "step"
+    for model, f_ov in zip(fits["model_number"][step], fits["f_ov"][step]):
+        print(f"model {int(model):6d}: f_ov = {f_ov:.4f}, set {configured:.4f}, off by {f_ov - configured:+.4f}")
+    error = np.abs(fits["f_ov"][step] - configured)
+    passed = bool(np.all(error <= tolerance))
+    print(f"{'PASS' if passed else 'FAIL'}: largest error {error.max():.4f} (tolerance {tolerance})")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the overshoot diffusion profile of MESA profiles.")
+    parser.add_argument("paths", nargs="*", help="run or LOGS directories (default: every run in --runs)")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--final", action="store_true", help="only fit the final profile of each run")
+    parser.add_argument("--check", action="store_true",
+                        help="check that the fit recovers the overshoot_f set for lab2 (exits 1 if not)")
+    parser.add_argument("--lab2", default=LAB2_DIR, help="lab2 directory, for --check")
+    parser.add_argument("--tolerance", type=float, default=CHECK_TOLERANCE, help="largest error in f for --check")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_lab2(args.lab2, args.tolerance) else 1)
+
+    paths = args.paths or RunCatalog(args.runs).run_dirs()
+    results = fit_runs(paths, all_profiles=not args.final)
+    print(f"{'run':<45} {'model':>6} {'fit':<12} {'f_ov':>7} {'extent [Hp]':>11} {'extent [Msun]':>13}")
+    for path, fit in results.items():
+        label = os.path.basename(os.path.dirname(os.path.abspath(logs_dir(path))))
+        for i in range(len(fit["model_number"])):
+            print(f"{label:<45} {int(fit['model_number'][i]):6d} {fit['scheme'][i]:<12} {fit['f_ov'][i]:7.4f} "
+                  f"{fit['extent_hp'][i]:11.4f} {fit['extent_msun'][i]:13.4f}")
+
+
+if __name__ == "__main__":
+    main()
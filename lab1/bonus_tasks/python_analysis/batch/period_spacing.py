@@ -0,0 +1,178 @@
+"""
+period_spacing.py - Asymptotic g-mode period spacing of the lab2 core helium burning runs
+
+    Delta Pi_l = 2 pi^2 / sqrt(l (l + 1)) / integral(N / r dr)
+
+with the integral taken over the g-mode cavity (brunt_N2 > 0). Since N / r dr = N dln r,
+only logR and brunt_N2 are needed. Profiles of all runs are stacked centre-out into
+(n_profiles, n_zones) arrays and integrated together.
+
+MESA writes brunt_N2 only when it is switched on in the profile columns list (and
+calculate_Brunt_N2 is set, as lab2/inlist_extra does). enable_profile_columns() adds it
+to my_profile_columns.list:
+
+    python -m batch.period_spacing --enable-columns ../../../lab2/my_profile_columns.list
+    python -m batch.period_spacing                  # Delta Pi vs center_he4 for the three lab2 outputs
+"""
+
+import os
+import re
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from batch.loader import LAB2_DIR, LAB2_OUTPUTS, load_tables, report_errors
+from batch.overshoot import stack_centre_out
+from batch.profile_cube import logs_dir, read_profiles_index
+
+BRUNT_COLUMNS = ("brunt_N2",)
+
+
+def active_columns(list_file):
+    """Column names switched on in a MESA history or profile columns list."""
+    columns = []
+    with open(list_file, "r") as f:
+        for line in f:
+            text = line.split("!", 1)[0].strip()
+            if text:
+                columns.append(text.split()[0])
+    return columns
+
+
+def enable_profile_columns(list_file, columns=BRUNT_COLUMNS, output=None):
+    """
+    Switch columns on in a profile columns list.
+
+    Commented-out entries (e.g. '!brunt_N2 ! ...') are uncommented; columns the list does
+    not mention are appended. The list is written to `output` (default: in place) only if
+    something changed. Returns the active columns afterwards.
+    """
+    with open(list_file, "r") as f:
+        lines = f.readlines()
+    active = set(active_columns(list_file))
+
+    changed = False
+    for column in columns:
+        if column in active:
+            continue
+        pattern = re.compile(r"^(\s*)!\s*" + re.escape(column) + r"\b")
+        for i, line in enumerate(lines):
+            if pattern.match(line):
+                lines[i] = pattern.sub(r"\g<1>" + column, line, count=1)
+                break
+        else:
+            lines.append(f"   {column}\n")
+        changed = True
+
+    output = output or list_file
+    if changed or output != list_file:
+        with open(output, "w") as f:
+            f.writelines(lines)
+    return active_columns(output)
+
+
+def period_spacing(profiles, ell=1):
+    """
+    Asymptotic period spacing in seconds of each profile, NaN without brunt_N2.
+
+    The integrand N dln r is summed with the trapezoidal rule over zones with N2 > 0.
+    """
+    lengths, a = stack_centre_out(profiles, ("logR", "brunt_N2"))
+    ln_r = a["logR"] * np.log(10)
+    n = np.sqrt(np.clip(a["brunt_N2"], 0.0, None))
+    integrand = 0.5 * (n[:, 1:] + n[:, :-1]) * np.diff(ln_r, axis=1)
+    integral = np.nansum(integrand, axis=1)
+    has_brunt = np.any(np.isfinite(a["brunt_N2"]), axis=1) & (integral > 0)
+    with np.errstate(divide="ignore"):
+        return np.where(has_brunt, 2 * np.pi ** 2 / np.sqrt(ell * (ell + 1)) / integral, np.nan)
+
+
+def period_spacing_tracks(paths, ell=1, workers=None):
+    """
+    Delta Pi of every profile of several runs, in one batched pass.
+
+    paths are run or LOGS directories. Returns {path: {"model_number", "center_he4",
+    "star_age", "delta_pi"}} for runs whose profiles include brunt_N2.
+    """
+    files = {}
+    for path in paths:
+        logs = logs_dir(path)
+        if not os.path.exists(os.path.join(logs, "profiles.index")):
+            print(f"Skipping {path}: no profiles.index")
+            continue
+        for number in read_profiles_index(logs)["profile_number"]:
+            files[(path, int(number))] = os.path.join(logs, f"profile{number}.data")
+
+    tables, errors = load_tables(files, columns=("logR",) + BRUNT_COLUMNS, workers=workers)
+    report_errors(errors, "profile")
+    keys = [k for k in files if k in tables]
+    if not keys:
+        return {}
+
+    delta_pi = period_spacing([tables[k] for k in keys], ell)
+    tracks = {}
+    for path in paths:
+        selected = [i for i, k in enumerate(keys) if k[0] == path]
+        if not selected:
+            continue
+        if not np.any(np.isfinite(delta_pi[selected])):
+            print(f"Skipping {path}: profiles have no brunt_N2 column "
+                  f"(switch it on with --enable-columns and rerun MESA)")
+            continue
+        tracks[path] = {
+            "model_number": np.array([tables[keys[i]].model_number for i in selected]),
+            "center_he4": np.array([tables[keys[i]].center_he4 for i in selected]),
+            "star_age": np.array([tables[keys[i]].star_age for i in selected]),
+            "delta_pi": delta_pi[selected],
+        }
+    return tracks
+
+
+def plot_period_spacing(tracks, ell=1, plots_dir="plots"):
+    os.makedirs(plots_dir, exist_ok=True)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    for path, track in tracks.items():
+        label = os.path.basename(os.path.dirname(os.path.abspath(logs_dir(path))))
+        ax.plot(track["center_he4"], track["delta_pi"], "o-", linewidth=2, label=label)
+    ax.invert_xaxis()
+    ax.set_xlabel(r"Central $^4$He mass fraction", fontsize=14)
+    ax.set_ylabel(rf"$\Delta\Pi_{{{ell}}}$ [s]", fontsize=14)
+    ax.set_title("Asymptotic g-mode period spacing during core helium burning", fontsize=16)
+    ax.grid(alpha=0.3)
+    ax.legend()
+    plt.tight_layout()
+    path = os.path.join(plots_dir, "period_spacing.png")
+    plt.savefig(path, dpi=300)
+    plt.close(fig)
+    print(f"Saved period spacing plot to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asymptotic g-mode period spacing of the lab2 runs.")
+    parser.add_argument("paths", nargs="*", help="run or LOGS directories (default: the three lab2 outputs)")
+    parser.add_argument("--lab2", default=LAB2_DIR, help="lab2 directory")
+    parser.add_argument("--ell", type=int, default=1, help="spherical degree")
+    parser.add_argument("--enable-columns", metavar="LIST_FILE",
+                        help="switch brunt_N2 on in this profile columns list and exit")
+    parser.add_argument("--plot", action="store_true", help="plot Delta Pi against center_he4")
+    args = parser.parse_args()
+
+    if args.enable_columns:
+        columns = enable_profile_columns(args.enable_columns)
+        print(f"{args.enable_columns}: {len(columns)} active columns, including {', '.join(BRUNT_COLUMNS)}")
+        return
+
+    paths = args.paths or [os.path.join(args.lab2, output, "LOGS") for output in LAB2_OUTPUTS]
+    tracks = period_spacing_tracks(paths, args.ell)
+    for path, track in tracks.items():
+        print(f"\n{path}")
+        print(f"{'model':>6} {'center_he4':>11} {'Delta Pi [s]':>13}")
+        for model, he4, dp in zip(track["model_number"], track["center_he4"], track["delta_pi"]):
+            print(f"{int(model):6d} {he4:11.4f} {dp:13.2f}")
+    if tracks and args.plot:
+        plot_period_spacing(tracks, args.ell)
+
+
+if __name__ == "__main__":
+    main()
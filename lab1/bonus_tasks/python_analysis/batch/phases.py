@@ -0,0 +1,212 @@
+"""
+phases.py - Evolutionary phase detection for a whole grid of runs at once
+
+Histories are stacked into (n_runs, n_rows) arrays padded with NaN, and every event
+is located for all runs with array operations. An event is placed between the two
+rows that bracket it and quantities are linearly interpolated there, so the result
+does not jump with the timestep size the way picking the nearest row does.
+
+Events:
+    ZAMS        first time nuclear luminosity reaches zams_lnuc_frac of the total (Lnuc/L)
+    TAMS        first time center_h1 drops to h1_limit after ZAMS
+    h1=<value>  first time center_h1 drops to a user-defined value after ZAMS
+
+The same stacked arrays are resampled at fractional rows with positions_at and
+interp_rows, which eep.py, align.py and profile_cube.py share.
+
+    python -m batch.phases [--h1 0.5 0.3 0.1]
+"""
+
+import argparse
+
+import numpy as np
+
+from batch.catalog import RunCatalog
+from batch.loader import load_histories, report_errors
+
+QUANTITIES = ("star_age", "log_Teff", "log_L", "mass_conv_core", "he_core_mass")
+
+PHASE_COLUMNS = ("center_h1", "log_Lnuc") + QUANTITIES
+
+
+def stack_runs(runs_data, columns):
+    """
+    Stack one column of every run into a padded 2D array.
+
+    Returns (run_names, lengths, arrays) where arrays[column] has shape
+    (n_runs, max_rows) with NaN after the end of each run. Columns missing from a run
+    are all NaN for that run.
+    """
+    run_names = list(runs_data)
+    lengths = np.array([len(runs_data[name]) for name in run_names], dtype=int)
+    n_max = lengths.max() if len(lengths) else 0
+
+    arrays = {}
+    for column in columns:
+        stacked = np.full((len(run_names), n_max), np.nan)
+        for i, name in enumerate(run_names):
+            data = runs_data[name]
+            if hasattr(data, column):
+                stacked[i, :lengths[i]] = getattr(data, column)
+        arrays[column] = stacked
+    return run_names, lengths, arrays
+
+
+def first_crossing(x, threshold, direction="below", start=None):
+    """
+    First step where each row of x crosses a threshold.
+
+    Parameters:
+    x (array): (n_runs, n_rows), NaN padded
+    threshold (float or array): value to cross, per run if an array
+    direction (str): "below" for a falling quantity, "above" for a rising one
+    start (array): per-run row index before which crossings are ignored
+
+    Returns:
+    index (array): row after the crossing, -1 where there is none
+    frac (array): position of the crossing between rows index-1 and index, in [0, 1]
+    """
+    threshold = np.broadcast_to(np.asarray(threshold, dtype=float), (x.shape[0],))[:, None]
+    prev, curr = x[:, :-1], x[:, 1:]
+    if direction == "below":
+        crossed = (prev > threshold) & (curr <= threshold)
+    else:
+        crossed = (prev < threshold) & (curr >= threshold)
+
+    if start is not None:
+        rows = np.arange(1, x.shape[1])[None, :]
+        crossed &= rows >= np.asarray(start)[:, None]
+
+    found = crossed.any(axis=1)
+    index = np.where(found, crossed.argmax(axis=1) + 1, -1)
+
+    # Linear position of the threshold between the bracketing rows
+    safe = np.where(found, index, 1)[:, None]
+    x0 = np.take_along_axis(x, safe - 1, axis=1)[:, 0]
+    x1 = np.take_along_axis(x, safe, axis=1)[:, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frac = np.where(x1 != x0, (threshold[:, 0] - x0) / (x1 - x0), 1.0)
+    frac = np.where(found, np.clip(frac, 0.0, 1.0), np.nan)
+    return index, frac
+
+
+def interpolate_at(arrays, index, frac, quantities):
+    """Values of each quantity interpolated at (index - 1 + frac); NaN where index is -1."""
+    found = index > 0
+    safe = np.where(found, index, 1)[:, None]
+    values = {}
+    for quantity in quantities:
+        q = arrays[quantity]
+        q0 = np.take_along_axis(q, safe - 1, axis=1)[:, 0]
+        q1 = np.take_along_axis(q, safe, axis=1)[:, 0]
+        values[quantity] = np.where(found, q0 + frac * (q1 - q0), np.nan)
+    return values
+
+
+def interp_rows(q, pos):
+    """
+    Values of q (n_runs, n_rows) at fractional row positions pos (n_runs, k).
+
+    Position 3.25 is a quarter of the way from row 3 to row 4. NaN positions give NaN.
+    """
+    n_rows = q.shape[1]
+    valid = np.isfinite(pos)
+    pos = np.where(valid, pos, 0.0)
+    j = np.clip(np.floor(pos).astype(int), 0, max(n_rows - 2, 0))
+    f = pos - j
+    q0 = np.take_along_axis(q, j, axis=1)
+    q1 = np.take_along_axis(q, np.minimum(j + 1, n_rows - 1), axis=1)
+    return np.where(valid, q0 + f * (q1 - q0), np.nan)
+
+
+def positions_at(x, lengths, targets):
+    """
+    Fractional row positions where x reaches each target, for interp_rows.
+
+    x is (n_runs, n_rows) non-decreasing per run (arc length, phase, m/M, ...), targets
+    is (n_runs, k). All runs are searched with a single np.searchsorted by offsetting
+    each run into its own range.
+    """
+    n_runs, n_rows = x.shape
+    offset = (np.nanmax(x) + 1.0) * np.arange(n_runs)[:, None]
+    flat = (x + offset).ravel()
+    j = np.searchsorted(flat, (targets + offset).ravel(), side="right").reshape(targets.shape) - 1
+    j -= np.arange(n_runs)[:, None] * n_rows
+
+    # Stay within the rows each run actually has
+    j = np.clip(j, 0, np.maximum(lengths - 2, 0)[:, None])
+    x0 = np.take_along_axis(x, j, axis=1)
+    x1 = np.take_along_axis(x, j + 1, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = np.where(x1 > x0, (targets - x0) / (x1 - x0), 0.0)
+    pos = j + np.clip(f, 0.0, 1.0)
+    return np.where(np.isfinite(targets), pos, np.nan)
+
+
+def detect_phases(runs_data, h1_thresholds=(), h1_limit=0.001, zams_lnuc_frac=0.99,
+                  quantities=QUANTITIES):
+    """
+    Locate ZAMS, TAMS and center_h1 thresholds in every run in one pass.
+
+    Parameters:
+    runs_data (dict): run name -> history (MesaTable or mesa_reader.MesaData)
+    h1_thresholds (iterable): extra center_h1 values to locate on the main sequence
+    h1_limit (float): center_h1 defining TAMS, as in the xa_central_lower_limit stop
+    zams_lnuc_frac (float): Lnuc/L at which the star is considered on the ZAMS
+    quantities (iterable): columns to interpolate at each event
+
+    Returns a dict with "run_names" and, for each event name, a dict holding "index",
+    "frac" and one (n_runs,) array per quantity (NaN where the event was not reached).
+    """
+    quantities = list(quantities)
+    run_names, lengths, arrays = stack_runs(runs_data, set(quantities) | {"center_h1", "log_Lnuc", "log_L"})
+    result = {"run_names": run_names}
+    if not run_names:
+        return result
+
+    def event(index, frac):
+        values = interpolate_at(arrays, index, frac, quantities)
+        values["index"] = index
+        values["frac"] = frac
+        return values
+
+    # ZAMS: log(Lnuc) - log(L) rises through log(zams_lnuc_frac)
+    lnuc_ratio = arrays["log_Lnuc"] - arrays["log_L"]
+    zams_index, zams_frac = first_crossing(lnuc_ratio, np.log10(zams_lnuc_frac), direction="above")
+    result["ZAMS"] = event(zams_index, zams_frac)
+
+    # Main-sequence events are only searched for after ZAMS (or from the start without one)
+    start = np.maximum(zams_index, 1)
+    tams_index, tams_frac = first_crossing(arrays["center_h1"], h1_limit, start=start)
+    result["TAMS"] = event(tams_index, tams_frac)
+
+    for h1 in h1_thresholds:
+        index, frac = first_crossing(arrays["center_h1"], h1, start=start)
+        result[f"h1={h1:g}"] = event(index, frac)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interpolated ZAMS/TAMS properties of every batch run.")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--h1", type=float, nargs="*", default=[], help="extra center_h1 values to locate")
+    args = parser.parse_args()
+
+    catalog = RunCatalog(args.runs)
+    runs_data, errors = load_histories(catalog.run_dirs(), columns=PHASE_COLUMNS)
+    report_errors(errors, "history")
+
+    phases = detect_phases(runs_data, h1_thresholds=args.h1)
+    events = [key for key in phases if key != "run_names"]
+    for event in events:
+        print(f"\n{event}")
+        print(f"{'run':<50} {'age [Myr]':>12} {'log_Teff':>9} {'log_L':>8} {'M_conv_core':>12}")
+        values = phases[event]
+        for i, run_name in enumerate(phases["run_names"]):
+            print(f"{run_name:<50} {values['star_age'][i] / 1e6:12.3f} {values['log_Teff'][i]:9.4f} "
+                  f"{values['log_L'][i]:8.4f} {values['mass_conv_core'][i]:12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+planner.py - Propose the next batch runs where the emulator learns the most
+
+Candidates are a dense grid spanned by the runs already in the summary (integer
+masses, the metallicities, schemes and f0 values in use, and finely spaced fov).
+Each candidate is scored by the emulator's uncertainty of a target quantity per
+predicted second of runtime, or with --criterion gradient by how fast the predicted
+TAMS age changes with fov there. Runs are picked one at a time; after each pick the
+point is added to the emulator with its predicted value, which shrinks the uncertainty
+around it so the next pick goes somewhere else.
+
+The proposals are written in the CSV layout read by 1_make_batch.py:
+
+    python -m batch.planner -k 8 --output next_runs.csv
+    cd ../batch_runs && python 1_make_batch.py ../python_analysis/next_runs.csv
+"""
+
+import csv
+import argparse
+
+import numpy as np
+
+from batch.emulator import Emulator, TARGETS, read_summary, extend_gp, predict_gp, features
+
+BATCH_HEADER = ["YOUR NAME", "initial mass  [Msol]", "initial metallicity", "overshoot scheme",
+                "overshoot parameter (f_ov)", "overshoot f0"]
+
+
+def candidate_grid(summary, n_fov=31, masses=None, metallicities=None):
+    """
+    Parameter points around the existing runs that have not been run yet.
+
+    Masses are whole numbers because 1_make_batch.py names runs after int(mass).
+    Returns a dict of arrays: mass, metallicity, scheme, fov, f0.
+    """
+    if masses is None:
+        masses = np.arange(np.floor(summary["mass"].min()), np.ceil(summary["mass"].max()) + 1)
+    if metallicities is None:
+        metallicities = np.unique(summary["metallicity"])
+
+    done = set(summary["key"])
+    points = {"mass": [], "metallicity": [], "scheme": [], "fov": [], "f0": []}
+
+    def add(mass, z, scheme, fov, f0):
+        key = f"M{mass:g}_Z{z:g}_{scheme}_fov{fov:g}_f0{f0:g}"
+        if key not in done:
+            for name, value in zip(points, (mass, z, scheme, fov, f0)):
+                points[name].append(value)
+
+    for scheme in sorted(set(summary["scheme"])):
+        in_scheme = summary["scheme"] == scheme
+        if scheme == "none":
+            fovs, f0s = [0.0], [0.0]
+        else:
+            fovs = np.round(np.linspace(summary["fov"][in_scheme].min(), summary["fov"][in_scheme].max(), n_fov), 3)
+            f0s = np.unique(summary["f0"][in_scheme])
+        for mass in masses:
+            for z in metallicities:
+                for fov in fovs:
+                    for f0 in f0s:
+                        add(float(mass), float(z), scheme, float(fov), float(f0))
+
+    return {name: np.array(values, dtype=object if name == "scheme" else float)
+            for name, values in points.items()}
+
+
+def _score(models, candidates, index, target, criterion, runtime_weight):
+    """Acquisition score of candidates[index] for one scheme, and the target sigma."""
+    scheme = candidates["scheme"][index[0]]
+    x = features(candidates["mass"][index], candidates["metallicity"][index],
+                 candidates["fov"][index], candidates["f0"][index])
+    _, sigma = predict_gp(models[(scheme, target)], x)
+    score = sigma.copy()
+
+    if criterion == "gradient":
+        # Change of log10 age per unit fov, by central differences on the emulator mean
+        step = 0.005
+        age_model = models[(scheme, "age_myr")]
+        up, down = x.copy(), x.copy()
+        up[:, 2] += step
+        down[:, 2] -= step
+        slope = (predict_gp(age_model, up)[0] - predict_gp(age_model, down)[0]) / (2 * step)
+        score *= np.abs(slope)
+
+    runtime_model = models.get((scheme, "runtime_seconds"))
+    runtime = 10 ** predict_gp(runtime_model, x)[0] if runtime_model is not None else np.ones(len(index))
+    return score / runtime ** runtime_weight, sigma, runtime
+
+
+def plan_runs(emulator, summary, n_runs, target="core_mass", criterion="uncertainty", runtime_weight=1.0,
+              tolerance=0.0, n_fov=31, masses=None, metallicities=None):
+    """
+    Greedily choose up to n_runs new parameter points.
+
+    Stops early once the largest remaining uncertainty of the target is below tolerance.
+    Returns a list of dicts with the parameters, the score, the target sigma before the
+    run and the predicted runtime in seconds.
+    """
+    if target not in TARGETS:
+        raise KeyError(f"Unknown target '{target}'. Use one of {', '.join(TARGETS)}")
+    candidates = candidate_grid(summary, n_fov, masses, metallicities)
+    models = dict(emulator.models)
+
+    schemes = [s for s in sorted(set(candidates["scheme"])) if (s, target) in models]
+    if criterion == "gradient":
+        # Runs without overshooting have no fov to take a gradient in, and the gradient
+        # needs an age model
+        schemes = [s for s in schemes if s != "none" and (s, "age_myr") in models]
+    available = np.ones(len(candidates["mass"]), dtype=bool)
+    chosen = []
+    for _ in range(n_runs):
+        best = None
+        for scheme in schemes:
+            index = np.flatnonzero(available & (candidates["scheme"] == scheme))
+            if len(index) == 0:
+                continue
+            score, sigma, runtime = _score(models, candidates, index, target, criterion, runtime_weight)
+            i = np.argmax(score)
+            if sigma.max() >= tolerance and (best is None or score[i] > best[0]):
+                best = (score[i], index[i], sigma[i], runtime[i])
+        if best is None:
+            break
+
+        score, i, sigma, runtime = best
+        scheme = candidates["scheme"][i]
+        chosen.append({name: candidates[name][i] for name in candidates})
+        chosen[-1].update(score=score, sigma=sigma, runtime=runtime)
+        available[i] = False
+
+        # Pretend the run came back with the predicted value; the posterior variance does
+        # not depend on the value, so this is exact for the uncertainty of the next pick
+        x = features([candidates["mass"][i]], [candidates["metallicity"][i]],
+                     [candidates["fov"][i]], [candidates["f0"][i]])
+        key = np.array([f"planned_{len(chosen)}"], dtype=object)
+        for (model_scheme, model_target), model in list(models.items()):
+            if model_scheme == scheme or (scheme == "none" and model_scheme != "none"):
+                mean, _ = predict_gp(model, x)
+                models[(model_scheme, model_target)] = extend_gp(model, key, x, mean)
+
+    return chosen
+
+
+def write_batch_csv(runs, path):
+    """Write planned runs in the CSV layout read by 1_make_batch.py."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(BATCH_HEADER)
+        for run in runs:
+            scheme = "no overshooting" if run["scheme"] == "none" else run["scheme"]
+            writer.writerow(["", f"{run['mass']:g}", f"{run['metallicity']:g}", scheme,
+                             f"{run['fov']:g}", f"{run['f0']:g}"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propose the next batch runs from the emulator's uncertainty.")
+    parser.add_argument("-k", "--runs", type=int, default=8, help="number of runs to propose")
+    parser.add_argument("--summary", default="../filled_MESA_Lab.csv", help="summary CSV from 5_construct_output.py")
+    parser.add_argument("--model", default="../emulator.npz", help="where the fitted emulator is kept")
+    parser.add_argument("--target", default="core_mass", choices=list(TARGETS), help="quantity to learn")
+    parser.add_argument("--criterion", default="uncertainty", choices=["uncertainty", "gradient"])
+    parser.add_argument("--runtime-weight", type=float, default=1.0,
+                        help="divide scores by predicted runtime to this power (0 ignores runtime)")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="stop once the target uncertainty is below this everywhere")
+    parser.add_argument("--masses", type=float, nargs="+", help="candidate masses (default: whole masses in range)")
+    parser.add_argument("--z", type=float, nargs="+", help="candidate metallicities (default: those already run)")
+    parser.add_argument("--n-fov", type=int, default=31, help="fov values between the smallest and largest run")
+    parser.add_argument("--output", default="next_runs.csv", help="CSV for 1_make_batch.py")
+    args = parser.parse_args()
+
+    emulator = Emulator(args.model)
+    emulator.update(args.summary)
+    summary = read_summary(args.summary)
+
+    runs = plan_runs(emulator, summary, args.runs, args.target, args.criterion, args.runtime_weight,
+                     args.tolerance, args.n_fov, args.masses, args.z)
+    if not runs:
+        print(f"No new runs needed: {args.target} uncertainty is below {args.tolerance:g} everywhere")
+        return
+
+    print(f"{'mass':>6} {'Z':>8} {'scheme':<12} {'fov':>7} {'f0':>7} {'sigma':>10} {'runtime [s]':>12}")
+    for run in runs:
+        print(f"{run['mass']:6g} {run['metallicity']:8g} {run['scheme']:<12} {run['fov']:7g} {run['f0']:7g} "
+              f"{run['sigma']:10.4g} {run['runtime']:12.0f}")
+    print(f"Predicted total runtime: {sum(run['runtime'] for run in runs) / 3600:.2f} h")
+
+    write_batch_csv(runs, args.output)
+    print(f"Wrote {len(runs)} runs to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,41 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-import mesa_reader as mr
-import glob
 
-def parse_run_parameters(run_dirs):
-    run_params = {}
+from batch.catalog import RunCatalog
+from batch.decimate import add_tracks
+from batch.figure_cache import FigureCache, run_inputs
+from batch.loader import report_errors
+from batch.reduce import reduced_histories
+from batch.render import show
+
+HISTORY_COLUMNS = ["star_age", "he_core_mass", "star_mass"]
+# Rows kept from each history: those that shape either log-log plot
+TRACKS = [("log_age", "log_core_mass_fraction"), ("log_age", "log_he_core_mass")]
+CORE_MASS_FRACTION_PLOT = "core_mass_fraction_vs_log_age.png"
+CORE_MASS_PLOT = "core_mass_vs_log_age.png"
+
+def load_mesa_data(run_dirs, run_params, workers=None):
+    run_dirs = [d for d in run_dirs if os.path.basename(d) in run_params]
+    runs_data, errors = reduced_histories(run_dirs, HISTORY_COLUMNS, TRACKS, workers=workers)
+    report_errors(errors, "history")
+    print(f"Loaded {len(runs_data)} runs")
 
-    for run_dir in run_dirs:
-        run_name = os.path.basename(run_dir)
-        if not run_name.startswith("inlist_M"):
-            continue
-
-        name_parts = run_name[7:]
-        parts = name_parts.split("_")
-
-        mass = float(parts[0][1:])
-        z = float(parts[1][1:])
-
-        if "noovs" in run_name:
-            scheme = "none"
-            fov = 0.0
-            f0 = 0.0
-        else:
-            scheme = parts[2]
-            fov = float(parts[3][3:]) if len(parts) > 3 and parts[3].startswith("fov") else 0.0
-            f0 = float(parts[4][2:]) if len(parts) > 4 and parts[4].startswith("f0") else 0.0
-
-        run_params[run_name] = {
-            "mass": mass,
-            "metallicity": z,
-            "scheme": scheme,
-            "fov": fov,
-            "f0": f0
-        }
-
-    return run_params
-
-def load_mesa_data(run_dirs, run_params):
-    runs_data = {}
-    for run_dir in run_dirs:
-        run_name = os.path.basename(run_dir)
-        if run_name not in run_params:
-            continue
+    return runs_data
 
-        history_path = os.path.join(run_dir, "LOGS", "history.data")
-        if os.path.exists(history_path):
-            h = mr.MesaData(history_path)
-            runs_data[run_name] = h
-            print(f"Loaded: {run_name}")
+def draw_tracks(ax, tracks, styles, n_markers=8):
+    """Thinned tracks as line collections, with n_markers markers along each track in one scatter per marker."""
+    markers = {}
+    for (x, y), style in zip(tracks, styles):
+        markevery = max(1, len(x) // n_markers)
+        points = markers.setdefault(style["marker"], ([], [], []))
+        points[0].append(x[::markevery])
+        points[1].append(y[::markevery])
+        points[2].extend([style["color"]] * len(x[::markevery]))
 
-    return runs_data
+    add_tracks(ax, tracks, styles)
+    for marker, (x, y, colors) in markers.items():
+        ax.scatter(np.concatenate(x), np.concatenate(y), c=colors, marker=marker, s=36)
 
 def plot_core_mass_fraction_evolution(runs_data, run_params, plots_dir="plots"):
     os.makedirs(plots_dir, exist_ok=True)
@@ -60,6 +45,7 @@ def plot_core_mass_fraction_evolution(runs_data, run_params, plots_dir="plots"):
     fov_linestyles = {0.01: "-", 0.02: "-", 0.03: "--", 0.04: "--", 0.10: ":", 0.20: ":", 0.30: "-.", 0.40: "-."}
     mass_markers = {2.0: "o", 5.0: "s", 15.0: "^", 30.0: "d"}
 
+    tracks, styles = [], []
     for run, data in runs_data.items():
         params = run_params[run]
         if not (hasattr(data, 'star_age') and hasattr(data, 'he_core_mass') and hasattr(data, 'star_mass')):
@@ -75,12 +61,12 @@ def plot_core_mass_fraction_evolution(runs_data, run_params, plots_dir="plots"):
         color = scheme_colors.get(params["scheme"], "gray")
         linestyle = fov_linestyles[min(fov_linestyles, key=lambda k: abs(k - params["fov"]))] if params["scheme"] != "none" else "-"
         marker = mass_markers[min(mass_markers, key=lambda k: abs(k - params["mass"]))]
-        markevery = max(1, len(age) // 8)
-
-        ax.plot(age, cmf, color=color, linestyle=linestyle, linewidth=2, marker=marker, markevery=markevery, markersize=6)
+        tracks.append((age, cmf))
+        styles.append({"color": color, "linestyle": linestyle, "linewidth": 2, "marker": marker})
 
     ax.set_xscale('log')
     ax.set_yscale('log')
+    draw_tracks(ax, tracks, styles)
     ax.set_xlim(1, None)
     ax.set_xlabel("Age (Myr)", fontsize=14)
     ax.set_ylabel("Core Mass Fraction (%)", fontsize=14)
@@ -91,8 +77,8 @@ def plot_core_mass_fraction_evolution(runs_data, run_params, plots_dir="plots"):
             bbox=dict(facecolor='white', alpha=0.7, boxstyle='round'))
 
     plt.tight_layout()
-    plt.savefig(f"{plots_dir}/core_mass_fraction_vs_log_age.png", dpi=300)
-    plt.show()
+    plt.savefig(os.path.join(plots_dir, CORE_MASS_FRACTION_PLOT), dpi=300)
+    show()
     print("Saved core mass fraction plot.")
     return fig
 
@@ -104,6 +90,7 @@ def plot_core_mass_evolution(runs_data, run_params, plots_dir="plots"):
     fov_linestyles = {0.01: "-", 0.02: "-", 0.03: "--", 0.04: "--", 0.10: ":", 0.20: ":", 0.30: "-.", 0.40: "-."}
     mass_markers = {2.0: "o", 5.0: "s", 15.0: "^", 30.0: "d"}
 
+    tracks, styles = [], []
     for run, data in runs_data.items():
         params = run_params[run]
         if not (hasattr(data, 'star_age') and hasattr(data, 'he_core_mass')):
@@ -117,12 +104,12 @@ def plot_core_mass_evolution(runs_data, run_params, plots_dir="plots"):
         color = scheme_colors.get(params["scheme"], "gray")
         linestyle = fov_linestyles[min(fov_linestyles, key=lambda k: abs(k - params["fov"]))] if params["scheme"] != "none" else "-"
         marker = mass_markers[min(mass_markers, key=lambda k: abs(k - params["mass"]))]
-        markevery = max(1, len(age) // 8)
-
-        ax.plot(age, core_mass, color=color, linestyle=linestyle, linewidth=2, marker=marker, markevery=markevery, markersize=6)
+        tracks.append((age, core_mass))
+        styles.append({"color": color, "linestyle": linestyle, "linewidth": 2, "marker": marker})
 
     ax.set_xscale('log')
     ax.set_yscale('log')
+    draw_tracks(ax, tracks, styles)
     ax.set_xlim(1, None)
     ax.set_xlabel("Age (Myr)", fontsize=14)
     ax.set_ylabel("Core Mass ($M_\odot$)", fontsize=14)
@@ -133,19 +120,35 @@ def plot_core_mass_evolution(runs_data, run_params, plots_dir="plots"):
             bbox=dict(facecolor='white', alpha=0.7, boxstyle='round'))
 
     plt.tight_layout()
-    plt.savefig(f"{plots_dir}/core_mass_vs_log_age.png", dpi=300)
-    plt.show()
+    plt.savefig(os.path.join(plots_dir, CORE_MASS_PLOT), dpi=300)
+    show()
     print("Saved core mass plot.")
     return fig
 
 def main():
     batch_runs_dir = "../runs"
     plots_dir = "plots"
-    run_dirs = [d for d in glob.glob(os.path.join(batch_runs_dir, "*")) if os.path.isdir(d)]
-    run_params = parse_run_parameters(run_dirs)
+    catalog = RunCatalog(batch_runs_dir)
+    run_params = catalog.select()
+    run_dirs = catalog.run_dirs()
+
+    cache = FigureCache(plots_dir)
+    inputs = run_inputs(run_dirs)
+    figures = {
+        "core_mass_fraction": (plot_core_mass_fraction_evolution, CORE_MASS_FRACTION_PLOT),
+        "core_mass": (plot_core_mass_evolution, CORE_MASS_PLOT),
+    }
+    keys = {name: ([os.path.join(plots_dir, output)], cache.key(function, inputs, run_params))
+            for name, (function, output) in figures.items()}
+    stale = cache.stale(keys)
+    if not stale:
+        print("Core mass plots are up to date, skipping")
+        return
+
     runs_data = load_mesa_data(run_dirs, run_params)
-    plot_core_mass_fraction_evolution(runs_data, run_params, plots_dir)
-    plot_core_mass_evolution(runs_data, run_params, plots_dir)
+    for name in stale:
+        figures[name][0](runs_data, run_params, plots_dir)
+        cache.record(name, *keys[name])
     print("Done.")
 
 if __name__ == "__main__":
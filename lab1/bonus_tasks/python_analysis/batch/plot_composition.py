@@ -1,12 +1,24 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-import mesa_reader as mr
-import glob
 from matplotlib.cm import ScalarMappable
 from matplotlib.colors import Normalize
 
-def create_minimal_plots(batch_runs_dir = "../runs", plots_dir = "../plots"):
+from batch.catalog import RunCatalog
+from batch.figure_cache import FigureCache, run_inputs
+from batch.loader import report_errors
+from batch.reduce import reduced_histories, reduced_final_profiles, track_points
+from batch.render import show
+
+HISTORY_COLUMNS = ["star_age", "he_core_mass", "star_mass"]
+PROFILE_COLUMNS = ["mass", "x_mass_fraction_H"]
+# Rows kept from each history and final profile: those that shape the plotted curves
+HISTORY_TRACKS = [("log_age", "core_mass_fraction")]
+PROFILE_TRACKS = [("mass_fraction", "x_mass_fraction_H")]
+CORE_EVOLUTION_PLOT = "core_evolution_all_models.png"
+HYDROGEN_PROFILE_PLOT = "hydrogen_profiles_all_models.png"
+
+def create_minimal_plots(batch_runs_dir = "../runs", plots_dir = "../plots", workers = None):
     """
     Create minimal number of comprehensive plots showing all models together.
     Only creates two plots: core evolution and final hydrogen profiles.
@@ -14,79 +26,47 @@ def create_minimal_plots(batch_runs_dir = "../runs", plots_dir = "../plots"):
 
     os.makedirs(plots_dir, exist_ok=True)
     
-    # Find all run directories
-    run_dirs = [d for d in glob.glob(os.path.join(batch_runs_dir, "*")) if os.path.isdir(d)]
-    
-    # Parse run parameters
-    run_params = {}
-    for run_dir in run_dirs:
-        run_name = os.path.basename(run_dir)
-        if not run_name.startswith("inlist_M"):
-            continue
+    # Find all runs and their parameters
+    run_params = RunCatalog(batch_runs_dir).select()
+    run_dirs = [params["path"] for params in run_params.values()]
 
-        parts = run_name[7:].split("_")
-        if len(parts) < 2:
-            continue
-            
-        mass = float(parts[0][1:])  # Remove 'M' prefix
-        z = float(parts[1][1:])     # Remove 'Z' prefix
-        
-        # Determine overshooting scheme
-        if "noovs" in run_name:
-            scheme = "none"
-            fov = 0.0
-            f0 = 0.0
-        else:
-            scheme = parts[2] if len(parts) > 2 else "unknown"
-            fov = float(parts[3][3:]) if len(parts) > 3 and parts[3].startswith("fov") else 0.0
-            f0 = float(parts[4][2:]) if len(parts) > 4 and parts[4].startswith("f0") else 0.0
-        
-        run_params[run_name] = {
-            "mass": mass,
-            "metallicity": z,
-            "scheme": scheme,
-            "fov": fov,
-            "f0": f0,
-            "path": run_dir
-        }
-    
-    # Load data for all models
+    # Only draw the plots whose runs, parameters or plotting code changed
+    cache = FigureCache(plots_dir)
+    figures = {
+        "core_evolution": (create_unified_core_evolution_plot, CORE_EVOLUTION_PLOT, run_inputs(run_dirs)),
+        "hydrogen_profiles": (create_unified_hydrogen_profile_plot, HYDROGEN_PROFILE_PLOT,
+                              run_inputs(run_dirs, "profile")),
+    }
+    keys = {name: ([os.path.join(plots_dir, output)], cache.key(function, inputs, run_params))
+            for name, (function, output, inputs) in figures.items()}
+    stale = cache.stale(keys)
+    if not stale:
+        print("Composition plots are up to date, skipping")
+        return
+
+    # Stream the runs through parallel workers, keeping only the rows that are drawn
     print("Loading data from all models...")
+    n_points = track_points(len(run_dirs))
+    histories, errors = reduced_histories(run_dirs, HISTORY_COLUMNS, HISTORY_TRACKS, n_points, workers)
+    report_errors(errors, "data")
+    run_dirs = [params["path"] for run_name, params in run_params.items() if run_name in histories]
+    profiles, errors = reduced_final_profiles(run_dirs, PROFILE_COLUMNS, PROFILE_TRACKS, n_points, workers)
+    report_errors(errors, "final profile")
+
     model_data = {}
-    for run_name, params in run_params.items():
-        logs_dir = os.path.join(params["path"], "LOGS")
-        history_path = os.path.join(logs_dir, "history.data")
-        
-        if not os.path.exists(history_path):
-            continue
-            
-        try:
-            history = mr.MesaData(history_path)
-            model_data[run_name] = {
-                "history": history,
-                "params": params,
-                "profiles": {}
-            }
-            
-            # Load final profile
-            profile_files = sorted(glob.glob(os.path.join(logs_dir, "profile*.data")), 
-                                  key=lambda x: int(os.path.basename(x)[7:-5]))
-            
-            if profile_files:
-                try:
-                    profile = mr.MesaData(profile_files[-1])
-                    model_data[run_name]["profiles"]["final"] = profile
-                except Exception as e:
-                    print(f"Error loading final profile for {run_name}: {e}")
-                        
-        except Exception as e:
-            print(f"Error loading data for {run_name}: {e}")
+    for run_name, history in histories.items():
+        model_data[run_name] = {
+            "history": history,
+            "params": run_params[run_name],
+            "profiles": {"final": profiles[run_name]} if run_name in profiles else {}
+        }
     
     print(f"Loaded data for {len(model_data)} models")
     
     # Create the two main plots
-    create_unified_core_evolution_plot(model_data, plots_dir)
-    create_unified_hydrogen_profile_plot(model_data, plots_dir)
+    for name in stale:
+        figures[name][0](model_data, plots_dir)
+        cache.record(name, *keys[name])
     
     print("All plots complete!")
 
@@ -179,8 +159,8 @@ def create_unified_core_evolution_plot(model_data, plots_dir):
     plt.legend(loc='upper left', fontsize=10, ncol=2)
     
     plt.tight_layout()
-    plt.savefig(os.path.join(plots_dir, "core_evolution_all_models.png"), dpi=300)
-    plt.show()
+    plt.savefig(os.path.join(plots_dir, CORE_EVOLUTION_PLOT), dpi=300)
+    show()
     plt.close()
     
     print("Core evolution plot saved.")
@@ -273,8 +253,8 @@ def create_unified_hydrogen_profile_plot(model_data, plots_dir):
     plt.legend(loc='upper left', fontsize=10, ncol=2)
     
     plt.tight_layout()
-    plt.savefig(os.path.join(plots_dir, "hydrogen_profiles_all_models.png"), dpi=300)
-    plt.show()
+    plt.savefig(os.path.join(plots_dir, HYDROGEN_PROFILE_PLOT), dpi=300)
+    show()
     plt.close()
     
     print("Hydrogen profile plot saved.")
@@ -1,59 +1,30 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import mesa_reader as mr
-import glob
-
-def parse_run_parameters(run_dirs):
-    run_params = {}
-
-    for run_dir in run_dirs:
-        run_name = os.path.basename(run_dir)
-        if not run_name.startswith("inlist_M"):
-            continue
-
-        name_parts = run_name[7:]
-        parts = name_parts.split("_")
-
-        mass = float(parts[0][1:])
-        z = float(parts[1][1:])
-
-        if "noovs" in run_name:
-            scheme = "none"
-            fov = 0.0
-            f0 = 0.0
-        else:
-            scheme = parts[2]
-            fov = float(parts[3][3:]) if len(parts) > 3 and parts[3].startswith("fov") else 0.0
-            f0 = float(parts[4][2:]) if len(parts) > 4 and parts[4].startswith("f0") else 0.0
-
-        run_params[run_name] = {
-            "mass": mass,
-            "metallicity": z,
-            "scheme": scheme,
-            "fov": fov,
-            "f0": f0
-        }
-
-    return run_params
-
-def load_mesa_data(run_dirs, run_params):
-    runs_data = {}
-
-    for run_dir in run_dirs:
-        run_name = os.path.basename(run_dir)
-        if run_name not in run_params:
-            continue
-
-        history_path = os.path.join(run_dir, "LOGS", "history.data")
-        if os.path.exists(history_path):
-            h = mr.MesaData(history_path)
-            runs_data[run_name] = h
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+from batch.animate import rotation_views, save_animation
+from batch.catalog import RunCatalog
+from batch.decimate import add_tracks, line_collections
+from batch.figure_cache import FigureCache, run_inputs
+from batch.loader import report_errors
+from batch.reduce import reduced_histories
+from batch.render import show
+
+HISTORY_COLUMNS = ["log_Teff", "log_L", "star_age"]
+# Rows kept from each history: those that shape the track on the HR diagram
+TRACKS = [("log_Teff", "log_L")]
+OUTPUTS = ["all_hr_diagrams.png", "all_hr_diagrams_3d.png", "hr_diagram_3d_rotation.gif"]
+
+def load_mesa_data(run_dirs, run_params, workers=None):
+    run_dirs = [d for d in run_dirs if os.path.basename(d) in run_params]
+    runs_data, errors = reduced_histories(run_dirs, HISTORY_COLUMNS, TRACKS, workers=workers)
+    report_errors(errors, "history")
 
     return runs_data
 
-def plot_all_hr_diagrams(runs_data, run_params, plots_dir="plots"):
+def plot_all_hr_diagrams(runs_data, run_params, plots_dir="plots", frame_step=1):
+    """HR diagrams of every run; the GIF keeps every frame_step-th degree of the turn at the same speed."""
     os.makedirs(plots_dir, exist_ok=True)
     plt.figure(figsize=(16, 12))
 
@@ -62,9 +33,11 @@ def plot_all_hr_diagrams(runs_data, run_params, plots_dir="plots"):
     mass_color_map = {mass: mass_colors[i] for i, mass in enumerate(masses)}
     scheme_markers = {'none': 'o', 'exponential': '^', 'step': 's'}
 
+    # Tracks are thinned in display space and drawn as one collection per line style
+    tracks, styles, track_runs = [], [], []
     for run, data in runs_data.items():
         params = run_params[run]
-        if not (hasattr(data, 'log_Teff') and hasattr(data, 'log_L')):
+        if not (hasattr(data, 'log_Teff') and hasattr(data, 'log_L') and hasattr(data, 'star_age')):
             continue
 
         base_color = mass_color_map[params["mass"]]
@@ -77,16 +50,11 @@ def plot_all_hr_diagrams(runs_data, run_params, plots_dir="plots"):
         else:
             linestyle = ':'
 
-        label = f"M={params['mass']}M☉, Z={params['metallicity']}, "
-        label += "No Overshooting" if params["scheme"] == "none" else f"{params['scheme']}, fov={params['fov']:.3f}"
+        tracks.append((data.log_Teff, data.log_L, data.star_age / 1e6))
+        styles.append({"color": base_color, "alpha": fov_alpha, "linestyle": linestyle, "linewidth": 2})
+        track_runs.append(run)
 
-        plt.plot(data.log_Teff, data.log_L,
-                 linestyle=linestyle,
-                 color=base_color,
-                 alpha=fov_alpha,
-                 linewidth=2,
-                 #label=label
-                 )
+    tracks = add_tracks(plt.gca(), tracks, styles)
 
     plt.xlabel(r"$\log(T_{\mathrm{eff}}/\mathrm{K})$", fontsize=14)
     plt.ylabel(r"$\log(L/L_{\odot})$", fontsize=14)
@@ -107,34 +75,44 @@ def plot_all_hr_diagrams(runs_data, run_params, plots_dir="plots"):
         plt.legend(fontsize=10, loc='best')
 
     plt.tight_layout()
-    plt.savefig(f"{plots_dir}/all_hr_diagrams.png", dpi=300, bbox_inches='tight')
-    plt.show()
+    plt.savefig(os.path.join(plots_dir, OUTPUTS[0]), dpi=300, bbox_inches='tight')
+    show()
 
-    fig = plt.figure(figsize=(18, 14))
-    ax = fig.add_subplot(111, projection='3d')
-
-    for run, data in runs_data.items():
-        params = run_params[run]
-        if not (hasattr(data, 'log_Teff') and hasattr(data, 'log_L') and hasattr(data, 'star_age')):
-            continue
+    # The same thinned tracks; age varies smoothly between the points kept for the HR plane
+    colors = [mass_color_map[run_params[run]["mass"]] for run in track_runs]
+    hr_3d_scene(tracks, colors, legend=len(runs_data) <= 10)
+    plt.savefig(os.path.join(plots_dir, OUTPUTS[1]), dpi=300, bbox_inches='tight')
+    show()
 
-        base_color = mass_color_map[params["mass"]]
-        age_myr = data.star_age / 1e6
+    try:
+        print("Trying to make GIF...")
+        # Full rotation, frame_step degrees per frame, bobbing up and down; frames drawn in
+        # parallel and written as they arrive
+        n_frames = save_animation(os.path.join(plots_dir, OUTPUTS[2]), hr_3d_scene, (tracks, colors),
+                                  rotation_views(360, step=frame_step), fps=20 / frame_step)
+        print(f"... GIF made! ({n_frames} frames)")
+    except Exception as e:
+        print("\033[1;31m" + "="*60)
+        print("   \033[91mFAILED TO MAKE GIF\033[0m".center(60))
+        print(f"   \033[90m{type(e).__name__}: {e}\033[0m")
+        print("   \033[90mMaybe you don't have\033[0m \033[1;36m'pillow'\033[0m \033[90minstalled...\033[0m".center(60))
+        print("\033[1;31m" + "="*60 + "\033[0m")
 
-        label = f"M={params['mass']}M☉, "
-        label += "No Overshooting" if params["scheme"] == "none" else f"{params['scheme']}, fov={params['fov']:.3f}"
 
-        ax.plot(data.log_Teff, data.log_L, age_myr,
-                color=base_color,
-                linewidth=2,
-                alpha=0.8,
-                #label=label
-                )
+def hr_3d_scene(tracks, colors, legend=False):
+    """3D HR diagram with age of (log_Teff, log_L, age_myr) tracks; returns (fig, ax)."""
+    fig = plt.figure(figsize=(18, 14))
+    ax = fig.add_subplot(111, projection='3d')
 
-        ax.scatter(data.log_Teff[0], data.log_L[0], age_myr[0],
-                  color=base_color, marker='o', s=50, alpha=0.8)
-        ax.scatter(data.log_Teff[-1], data.log_L[-1], age_myr[-1],
-                  color=base_color, marker='s', s=50, alpha=0.8)
+    for collection in line_collections(tracks, [{"color": c, "alpha": 0.8} for c in colors],
+                                       collection=Line3DCollection):
+        ax.add_collection3d(collection)
+    if tracks:
+        ax.auto_scale_xyz(np.concatenate([t[0] for t in tracks]), np.concatenate([t[1] for t in tracks]),
+                          np.concatenate([t[2] for t in tracks]))
+        for marker, end in (('o', 0), ('s', -1)):
+            ax.scatter([t[0][end] for t in tracks], [t[1][end] for t in tracks], [t[2][end] for t in tracks],
+                       color=colors, marker=marker, s=50, alpha=0.8, depthshade=False)
 
     ax.set_xlabel(r"$\log(T_{\mathrm{eff}}/\mathrm{K})$", fontsize=14)
     ax.set_ylabel(r"$\log(L/L_{\odot})$", fontsize=14)
@@ -143,49 +121,31 @@ def plot_all_hr_diagrams(runs_data, run_params, plots_dir="plots"):
     ax.invert_xaxis()
     ax.view_init(elev=30, azim=-60)
 
-    if len(runs_data) <= 10:
+    if legend:
         ax.legend(fontsize=9, loc='best')
 
     plt.tight_layout()
-    plt.savefig(f"{plots_dir}/all_hr_diagrams_3d.png", dpi=300, bbox_inches='tight')
-    plt.show()
-
-
-
-    try:
-        print("Trying to make GIF...")
-        from matplotlib import animation
-
-        # Animate the 3D plot (full rotation + bobbing)
-        def update_view(frame):
-            azim = (frame % 360)
-            elev = 30 + 30 * np.sin(np.radians(frame)*2)  # bob up and down
-            ax.view_init(elev=elev, azim=azim)
-            return fig,
-
-        # Save animation as GIF
-        frames = 360  # 1 degree per frame = smooth full rotation
-        anim = animation.FuncAnimation(fig, update_view, frames=frames, interval=50, blit=False)
-        gif_path = os.path.join(plots_dir, "hr_diagram_3d_rotation.gif")
-        anim.save(gif_path, writer='pillow', fps=20)
-        print("... GIF made!")
-    except:
-        print("\033[1;31m" + "="*60)
-        print("   \033[91mFAILED TO MAKE GIF\033[0m".center(60))
-        print("   \033[90mMaybe you don't have\033[0m \033[1;36m'pillow'\033[0m \033[90minstalled...\033[0m".center(60))
-        print("\033[1;31m" + "="*60 + "\033[0m")
-
-
+    return fig, ax
 
 
 def main():
     batch_runs_dir = "../runs"
     plots_dir = "plots"
-    run_dirs = [d for d in glob.glob(os.path.join(batch_runs_dir, "*")) if os.path.isdir(d)]
-    print(run_dirs)
-    run_params = parse_run_parameters(run_dirs)
+    catalog = RunCatalog(batch_runs_dir)
+    run_params = catalog.select()
+    run_dirs = catalog.run_dirs()
+
+    cache = FigureCache(plots_dir)
+    outputs = [os.path.join(plots_dir, name) for name in OUTPUTS]
+    key = cache.key(plot_all_hr_diagrams, run_inputs(run_dirs), run_params)
+    if cache.is_current("hr_diagrams", outputs, key):
+        print("HR diagrams are up to date, skipping")
+        return
+
     runs_data = load_mesa_data(run_dirs, run_params)
     plot_all_hr_diagrams(runs_data, run_params, plots_dir)
+    if not cache.record("hr_diagrams", outputs, key):
+        print("Not every HR diagram was written; they will be drawn again next time")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,207 @@
+"""
+profile_cube.py - Every profile of a run on a common m/M grid
+
+create_unified_hydrogen_profile_plot() only looks at the last profile of each run.
+This stacks all profiles listed in profiles.index into (n_profiles, n_mass) arrays of
+hydrogen fraction, log_D_mix and mixing_type on a fixed m/M grid, so the evolution of
+the interior can be shown and measured as one image per quantity. The grid positions
+are found once per profile and shared by every column. The cube is cached as float32
+in the column cache next to profiles.index and rebuilt only when a profile changes.
+
+    python -m batch.profile_cube ../../../lab2/output_overshoot/LOGS --plot
+    python -m batch.profile_cube                    # chemical-gradient zone of every run
+"""
+
+import os
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from batch.cache import column_cache_path, file_fingerprint, load_arrays, save_arrays
+from batch.catalog import RunCatalog
+from batch.loader import load_tables, report_errors
+from batch.phases import interp_rows, positions_at
+
+CUBE_COLUMNS = ("x_mass_fraction_H", "log_D_mix", "mixing_type")
+
+# Columns that are labels rather than quantities take the value of the nearest zone
+CATEGORICAL_COLUMNS = ("mixing_type",)
+
+
+def logs_dir(path):
+    """LOGS directory of a run directory, or the path itself if it is a LOGS directory."""
+    if os.path.isfile(os.path.join(path, "profiles.index")):
+        return path
+    return os.path.join(path, "LOGS")
+
+
+def read_profiles_index(logs):
+    """
+    Model number, priority and profile number of every profile in profiles.index.
+
+    Returns a dict of int arrays sorted by model number.
+    """
+    rows = np.loadtxt(os.path.join(logs, "profiles.index"), skiprows=1, dtype=int, ndmin=2)
+    order = np.argsort(rows[:, 0], kind="stable")
+    return {"model_number": rows[order, 0], "priority": rows[order, 1], "profile_number": rows[order, 2]}
+
+
+def stack_profiles(profiles, columns, n_mass=400):
+    """
+    Interpolate profiles onto a common m/M grid.
+
+    Profiles are stored surface first; they are flipped to increase in m/M, padded to a
+    common length by repeating the surface zone, and the grid positions of all profiles
+    are found with one searchsorted. Every column is then interpolated at those positions.
+    Returns (q_grid, {column: (n_profiles, n_mass) array}).
+    """
+    q_grid = np.linspace(0.0, 1.0, n_mass)
+    lengths = np.array([len(p) for p in profiles], dtype=int)
+    n_zones = lengths.max()
+
+    q = np.empty((len(profiles), n_zones))
+    values = {column: np.full((len(profiles), n_zones), np.nan) for column in columns}
+    for i, profile in enumerate(profiles):
+        n = lengths[i]
+        q[i, :n] = profile.mass[::-1] / profile.star_mass
+        q[i, n:] = q[i, n - 1]
+        for column in columns:
+            if hasattr(profile, column):
+                values[column][i, :n] = getattr(profile, column)[::-1]
+                values[column][i, n:] = values[column][i, n - 1]
+
+    # The centre zone's outer edge is above m = 0; hold its value down to the centre
+    targets = np.broadcast_to(q_grid, (len(profiles), n_mass))
+    pos = positions_at(q, lengths, np.maximum(targets, q[:, :1]))
+    cube = {}
+    for column in columns:
+        if column in CATEGORICAL_COLUMNS:
+            cube[column] = interp_rows(values[column], np.round(pos))
+        else:
+            cube[column] = interp_rows(values[column], pos)
+    return q_grid, cube
+
+
+def build_cube(path, columns=CUBE_COLUMNS, n_mass=400, workers=None, use_cache=True):
+    """
+    All profiles of one run on a common m/M grid, from the column cache when unchanged.
+
+    Returns a dict with q (n_mass,), model_number, star_age, star_mass (n_profiles,) and
+    one float32 (n_profiles, n_mass) array per column.
+    """
+    logs = logs_dir(path)
+    index_file = os.path.join(logs, "profiles.index")
+    index = read_profiles_index(logs)
+    paths = {int(n): os.path.join(logs, f"profile{n}.data") for n in index["profile_number"]}
+    fingerprint = [file_fingerprint(index_file)] + [file_fingerprint(p) for p in paths.values()] + [list(columns)]
+
+    cache_path = column_cache_path(index_file, f"cube{n_mass}")
+    if use_cache:
+        cached = load_arrays(cache_path, fingerprint)
+        if cached is not None:
+            return cached
+
+    tables, errors = load_tables(paths, columns=list(columns) + ["mass"], workers=workers)
+    report_errors(errors, "profile")
+    numbers = [int(n) for n in index["profile_number"] if int(n) in tables]
+    if not numbers:
+        raise ValueError(f"No readable profiles in {logs}")
+    profiles = [tables[n] for n in numbers]
+
+    q_grid, values = stack_profiles(profiles, columns, n_mass)
+    cube = {
+        "q": q_grid.astype(np.float32),
+        "profile_number": np.array(numbers),
+        "model_number": np.array([p.model_number for p in profiles], dtype=int),
+        "star_age": np.array([p.star_age for p in profiles]),
+        "star_mass": np.array([p.star_mass for p in profiles]),
+    }
+    for column, array in values.items():
+        cube[column] = array.astype(np.float32)
+
+    if use_cache:
+        save_arrays(cache_path, fingerprint, cube)
+    return cube
+
+
+def gradient_zone(cube, tolerance=0.01):
+    """
+    Extent of the hydrogen gradient left above the receding convective core.
+
+    The zone runs from where X first rises above the central value by `tolerance` of the
+    centre-to-envelope contrast to where it first comes within `tolerance` of the envelope
+    value, taken as the median over the outer fifth in mass so that a single odd surface
+    zone does not move it. Returns (q_bottom, q_top, width in Msun) per profile, NaN
+    without a gradient.
+    """
+    x = cube["x_mass_fraction_H"]
+    q = cube["q"]
+    x_centre = x[:, :1]
+    x_surface = np.median(x[:, q >= 0.8], axis=1, keepdims=True)
+    contrast = x_surface - x_centre
+    has_gradient = contrast[:, 0] > tolerance
+
+    above = x > x_centre + tolerance * contrast
+    near_surface = x >= x_surface - tolerance * contrast
+    q_bottom = np.where(has_gradient, q[np.argmax(above, axis=1)], np.nan)
+    q_top = np.where(has_gradient, q[np.argmax(near_surface, axis=1)], np.nan)
+    return q_bottom, q_top, (q_top - q_bottom) * cube["star_mass"]
+
+
+def plot_cube(cube, column="x_mass_fraction_H", title="", output="plots/profile_cube.png"):
+    """Image of one cube column against profile model number and m/M, with the gradient zone."""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    n_profiles = len(cube["model_number"])
+    extent = (-0.5, n_profiles - 0.5, float(cube["q"][0]), float(cube["q"][-1]))
+    image = ax.imshow(cube[column].T, origin="lower", aspect="auto", extent=extent,
+                      cmap="viridis", interpolation="nearest")
+    fig.colorbar(image, ax=ax, label=column)
+
+    if "x_mass_fraction_H" in cube:
+        q_bottom, q_top, _ = gradient_zone(cube)
+        ax.plot(np.arange(n_profiles), q_bottom, "w--", linewidth=1.5, label="gradient zone")
+        ax.plot(np.arange(n_profiles), q_top, "w--", linewidth=1.5)
+        ax.legend(loc="upper right")
+
+    step = max(1, n_profiles // 10)
+    ax.set_xticks(np.arange(0, n_profiles, step))
+    ax.set_xticklabels(cube["model_number"][::step])
+    ax.set_xlabel("Model number")
+    ax.set_ylabel(r"$m/M_{\rm star}$")
+    ax.set_title(title)
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    plt.savefig(output, dpi=200)
+    plt.close(fig)
+    print(f"Saved {column} cube plot to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stack every profile of a run onto a common m/M grid.")
+    parser.add_argument("paths", nargs="*", help="run or LOGS directories (default: every run in --runs)")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--n-mass", type=int, default=400, help="points in the m/M grid")
+    parser.add_argument("--plot", action="store_true", help="plot each cube to plots/")
+    parser.add_argument("--column", default="x_mass_fraction_H", choices=list(CUBE_COLUMNS))
+    parser.add_argument("--no-cache", action="store_true", help="re-read every profile")
+    args = parser.parse_args()
+
+    paths = args.paths or RunCatalog(args.runs).run_dirs()
+    print(f"{'run':<50} {'profiles':>8} {'q_bottom':>9} {'q_top':>7} {'width [Msun]':>13}")
+    for path in paths:
+        label = os.path.basename(os.path.dirname(os.path.abspath(logs_dir(path))))
+        try:
+            cube = build_cube(path, n_mass=args.n_mass, use_cache=not args.no_cache)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+
+        q_bottom, q_top, width = gradient_zone(cube)
+        print(f"{label:<50} {len(cube['model_number']):8d} {q_bottom[-1]:9.4f} {q_top[-1]:7.4f} {width[-1]:13.4f}")
+        if args.plot:
+            plot_cube(cube, args.column, label, os.path.join("plots", f"profile_cube_{label}.png"))
+
+
+if __name__ == "__main__":
+    main()
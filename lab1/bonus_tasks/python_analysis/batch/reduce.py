@@ -0,0 +1,87 @@
+"""
+reduce.py - Stream the grid through the plotters, keeping only the rows they draw
+
+A grid figure only needs a few hundred points per run, but loading whole histories
+and profiles first holds every row of every run at once, so memory grows with the size
+of the grid. Here files are parsed one at a time in worker processes (see
+loader.iter_tables) and each worker immediately reduces its table to the rows LTTB keeps
+for the tracks the figure draws (see decimate.py). Only those rows come back, so the
+full tables are released as soon as they are reduced.
+
+A track is an (x, y) pair of columns or of the quantities in AXES, in the coordinates
+the figure plots them in (e.g. log age for a log axis). LTTB does not depend on the
+scale of either axis, so the kept rows are those add_tracks would keep when drawing.
+The rows kept for all tracks of a table are merged, and every requested column of
+those rows is kept, so plotting code reads the reduced tables as it reads full ones.
+
+The number of points per run follows the figure-wide budget of decimate.py, so the
+memory the reduced grid takes stays about the same from tens to thousands of runs.
+"""
+
+from functools import partial
+
+import numpy as np
+
+from batch.decimate import POINT_BUDGET, MIN_TRACK_POINTS, lttb_indices
+from batch.loader import MesaTable, load_histories, load_final_profiles
+
+# Plotted quantities computed from the columns
+AXES = {
+    "log_age": lambda t: np.log10(t.star_age),
+    "log_he_core_mass": lambda t: np.log10(t.he_core_mass),
+    "core_mass_fraction": lambda t: t.he_core_mass / t.star_mass,
+    "log_core_mass_fraction": lambda t: np.log10(t.he_core_mass / t.star_mass),
+    "mass_fraction": lambda t: t.mass / t.star_mass,
+}
+
+
+def track_points(n_runs, budget=POINT_BUDGET, min_points=MIN_TRACK_POINTS):
+    """Points kept per run when a figure shows n_runs runs."""
+    return max(min_points, budget // max(n_runs, 1))
+
+
+def axis_values(table, name):
+    """Column `name` of a table, or the quantity of that name in AXES."""
+    with np.errstate(all="ignore"):
+        return AXES[name](table) if name in AXES else getattr(table, name)
+
+
+def reduce_rows(table, tracks, n_points):
+    """
+    The rows of a table that LTTB keeps for any of its tracks, as a new MesaTable.
+
+    Rows where a track is not finite (e.g. zero age on a log axis) are dropped. Tracks
+    whose columns are missing are skipped; a table with none of them is returned whole.
+    """
+    keep = []
+    for x_name, y_name in tracks:
+        try:
+            x, y = axis_values(table, x_name), axis_values(table, y_name)
+        except AttributeError:
+            continue
+        rows = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        keep.append(rows[lttb_indices([x[rows]], [y[rows]], n_points)[0]])
+    if not keep:
+        return table
+    rows = np.unique(np.concatenate(keep))
+    return MesaTable(table.data[rows], table.header, table.discarded_rows)
+
+
+def reduced_histories(run_dirs, columns, tracks, n_points=None, workers=None):
+    """
+    Histories of the runs reduced to the rows of `tracks`, like load_histories.
+
+    n_points defaults to the share of the figure budget of one of the runs.
+    """
+    if n_points is None:
+        n_points = track_points(len(run_dirs))
+    return load_histories(run_dirs, columns=columns, workers=workers,
+                          reduce=partial(reduce_rows, tracks=tuple(tracks), n_points=n_points))
+
+
+def reduced_final_profiles(run_dirs, columns, tracks, n_points=None, workers=None):
+    """Final profiles of the runs reduced to the rows of `tracks`, like load_final_profiles."""
+    if n_points is None:
+        n_points = track_points(len(run_dirs))
+    return load_final_profiles(run_dirs, columns=columns, workers=workers,
+                               reduce=partial(reduce_rows, tracks=tuple(tracks), n_points=n_points))
@@ -0,0 +1,240 @@
+"""
+render.py - Headless, parallel rendering of the batch figures
+
+In headless mode figures are drawn with the Agg backend and show() never blocks, so
+the plotting scripts run unattended on a compute node. Headless mode is on when
+MESA_HEADLESS=1 is set, when set_headless() has been called, or when matplotlib has
+already fallen back to Agg because there is no display.
+
+render_figures() draws independent figures in a process pool. Each job receives only
+the columns it plots, so little more than the arrays themselves is sent to the workers.
+Figures whose runs and plotting code are unchanged since the last render are skipped
+(see figure_cache.py).
+
+    python -m batch.render                 # every changed grid figure, one process per figure
+    python -m batch.render --force         # redraw all of them
+    MESA_HEADLESS=1 python -m batch.plot_hr
+"""
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import matplotlib.pyplot as plt
+from numpy.lib import recfunctions
+
+from batch.catalog import RunCatalog
+from batch.figure_cache import FigureCache, run_inputs
+from batch.loader import MesaTable, report_errors
+from batch.reduce import reduced_histories, reduced_final_profiles, track_points
+
+HEADLESS_ENV = "MESA_HEADLESS"
+
+
+def is_headless():
+    """True if figures should only be saved, never shown."""
+    value = os.environ.get(HEADLESS_ENV)
+    if value is not None:
+        return value.strip().lower() not in ("", "0", "false", "no")
+    return matplotlib.get_backend().lower() == "agg"
+
+
+def set_headless(enabled=True):
+    """Switch headless mode on (Agg backend, show() does nothing) or off for this process."""
+    os.environ[HEADLESS_ENV] = "1" if enabled else "0"
+    if enabled:
+        plt.switch_backend("Agg")
+
+
+# With MESA_HEADLESS set, use Agg from import on, so no figure ever opens the display
+if os.environ.get(HEADLESS_ENV) is not None and is_headless():
+    matplotlib.use("Agg")
+
+
+def show():
+    """plt.show() unless in headless mode."""
+    if not is_headless():
+        plt.show()
+
+
+def slim_tables(tables, columns):
+    """Copies of MesaTables holding only the given columns (and their header values)."""
+    slim = {}
+    for name, table in tables.items():
+        present = [c for c in columns if c in table.data.dtype.names]
+        data = recfunctions.repack_fields(table.data[present])
+        slim[name] = MesaTable(data, table.header, table.discarded_rows)
+    return slim
+
+
+def _render_one(name, function, args):
+    """Worker: draw one figure, capturing any error instead of raising."""
+    try:
+        function(*args)
+        return name, None
+    except Exception as e:
+        return name, f"{type(e).__name__}: {e}"
+    finally:
+        plt.close("all")
+
+
+def render_figures(jobs, workers=None):
+    """
+    Draw independent figures concurrently in headless mode.
+
+    Parameters:
+    jobs (dict): name -> (function, args); functions must be importable module-level functions
+    workers (int): Number of worker processes. None uses every core,
+                   1 draws in this process without a pool.
+
+    Returns a dict of name -> error message for every job that failed.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+
+    if workers == 1:
+        set_headless()
+        results = [_render_one(name, function, args) for name, (function, args) in jobs.items()]
+    else:
+        names = list(jobs)
+        with ProcessPoolExecutor(max_workers=workers, initializer=set_headless) as pool:
+            results = list(pool.map(_render_one, names, [jobs[n][0] for n in names],
+                                    [jobs[n][1] for n in names]))
+
+    return {name: error for name, error in results if error is not None}
+
+
+def grid_figures(run_params, plots_dir="plots", cache=None):
+    """
+    The grid figures, as a dict of name -> (outputs, cache key).
+
+    With a FigureCache only the figures whose inputs or code changed are returned.
+    """
+    from batch import plot_hr, plot_ccore_mass, plot_composition
+
+    run_dirs = [params["path"] for params in run_params.values()]
+    histories_in, profiles_in = run_inputs(run_dirs), run_inputs(run_dirs, "profile")
+
+    def figure(function, outputs, inputs):
+        outputs = [os.path.join(plots_dir, output) for output in outputs]
+        return outputs, cache.key(function, inputs, run_params) if cache else None
+
+    figures = {
+        "hr_diagrams": figure(plot_hr.plot_all_hr_diagrams, plot_hr.OUTPUTS, histories_in),
+        "core_mass_fraction": figure(plot_ccore_mass.plot_core_mass_fraction_evolution,
+                                     [plot_ccore_mass.CORE_MASS_FRACTION_PLOT], histories_in),
+        "core_mass": figure(plot_ccore_mass.plot_core_mass_evolution, [plot_ccore_mass.CORE_MASS_PLOT], histories_in),
+        "core_evolution": figure(plot_composition.create_unified_core_evolution_plot,
+                                 [plot_composition.CORE_EVOLUTION_PLOT], histories_in),
+        "hydrogen_profiles": figure(plot_composition.create_unified_hydrogen_profile_plot,
+                                    [plot_composition.HYDROGEN_PROFILE_PLOT], profiles_in),
+    }
+    if cache:
+        figures = {name: figures[name] for name in cache.stale(figures)}
+    return figures
+
+
+def grid_columns():
+    """(history columns, final profile columns) the grid figures read."""
+    from batch import plot_hr, plot_ccore_mass, plot_composition
+
+    history = set(plot_hr.HISTORY_COLUMNS) | set(plot_ccore_mass.HISTORY_COLUMNS) | \
+        set(plot_composition.HISTORY_COLUMNS)
+    return history, set(plot_composition.PROFILE_COLUMNS)
+
+
+def grid_tracks():
+    """(history tracks, final profile tracks) the grid figures draw, see reduce.py."""
+    from batch import plot_hr, plot_ccore_mass, plot_composition
+
+    history = plot_hr.TRACKS + plot_ccore_mass.TRACKS + plot_composition.HISTORY_TRACKS
+    return history, plot_composition.PROFILE_TRACKS
+
+
+def figure_jobs(names, histories, profiles, run_params, plots_dir="plots"):
+    """
+    Render jobs of the named grid figures from histories and final profiles already loaded.
+
+    histories and profiles are keyed by run name and may hold more columns than needed;
+    every job is sent only the columns it plots.
+    """
+    from batch import plot_hr, plot_ccore_mass, plot_composition
+
+    run_params = {name: params for name, params in run_params.items() if name in histories}
+    hr = slim_tables(histories, plot_hr.HISTORY_COLUMNS)
+    core = slim_tables(histories, plot_ccore_mass.HISTORY_COLUMNS)
+    final = slim_tables(profiles, plot_composition.PROFILE_COLUMNS)
+    core_data = {name: {"history": core[name], "params": params, "profiles": {}}
+                 for name, params in run_params.items()}
+    profile_data = {name: {"history": None, "params": params,
+                           "profiles": {"final": final[name]} if name in final else {}}
+                    for name, params in run_params.items()}
+
+    os.makedirs(plots_dir, exist_ok=True)
+    jobs = {
+        "hr_diagrams": (plot_hr.plot_all_hr_diagrams, (hr, run_params, plots_dir)),
+        "core_mass_fraction": (plot_ccore_mass.plot_core_mass_fraction_evolution, (core, run_params, plots_dir)),
+        "core_mass": (plot_ccore_mass.plot_core_mass_evolution, (core, run_params, plots_dir)),
+        "core_evolution": (plot_composition.create_unified_core_evolution_plot, (core_data, plots_dir)),
+        "hydrogen_profiles": (plot_composition.create_unified_hydrogen_profile_plot, (profile_data, plots_dir)),
+    }
+    return {name: jobs[name] for name in names}
+
+
+def grid_figure_jobs(batch_runs_dir="../runs", plots_dir="plots", workers=None, cache=None):
+    """
+    Load the batch once and build the render jobs of every grid figure.
+
+    With a FigureCache only figures whose inputs changed get a job, and only the data
+    they need is loaded. Runs are streamed through the loader workers and reduced to the
+    rows the figures draw, so memory stays flat as the grid grows. Returns (jobs, figures) where figures maps each job to the
+    (outputs, key) to record once it has rendered.
+    """
+    run_params = RunCatalog(batch_runs_dir).select()
+    figures = grid_figures(run_params, plots_dir, cache)
+    if not figures:
+        return {}, {}
+
+    run_dirs = [params["path"] for params in run_params.values()]
+    history_columns, profile_columns = grid_columns()
+    history_tracks, profile_tracks = grid_tracks()
+    n_points = track_points(len(run_dirs))
+    histories, errors = reduced_histories(run_dirs, history_columns, history_tracks, n_points, workers)
+    report_errors(errors, "history")
+    profiles = {}
+    if "hydrogen_profiles" in figures:
+        profiles, errors = reduced_final_profiles([params["path"] for name, params in run_params.items()
+                                                   if name in histories],
+                                                  profile_columns, profile_tracks, n_points, workers)
+        report_errors(errors, "final profile")
+
+    return figure_jobs(figures, histories, profiles, run_params, plots_dir), figures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every batch figure headless, in parallel.")
+    parser.add_argument("--runs", default="../runs", help="directory holding the batch runs")
+    parser.add_argument("--plots", default="plots", help="directory to save figures in")
+    parser.add_argument("--workers", type=int, help="worker processes (default: every core)")
+    parser.add_argument("--force", action="store_true", help="redraw figures even if their inputs are unchanged")
+    args = parser.parse_args()
+
+    set_headless()
+    cache = FigureCache(args.plots, force=args.force)
+    jobs, figures = grid_figure_jobs(args.runs, args.plots, args.workers, cache)
+    if not jobs:
+        print(f"Every figure in {args.plots} is up to date")
+        return
+    errors = render_figures(jobs, args.workers)
+    for name, error in errors.items():
+        print(f"Failed to render {name}: {error}")
+    for name in jobs:
+        if name not in errors:
+            cache.record(name, *figures[name])
+    print(f"Rendered {len(jobs) - len(errors)}/{len(jobs)} figures to {args.plots}")
+
+
+if __name__ == "__main__":
+    main()
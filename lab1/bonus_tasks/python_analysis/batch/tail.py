@@ -0,0 +1,169 @@
+"""
+tail.py - Incremental reader for the history.data of a run that is still going
+
+HistoryTail remembers how far into the file it has read and only parses rows that
+were appended since the last poll. Rows are kept in a buffer that doubles in size
+when full, so appending is amortised O(1) per row. If MESA truncates or rewrites the
+file (e.g. on a restart) the reader notices and starts again from the top. Rows that
+a restart appended over already-written model numbers are collapsed in `table`.
+
+    python -m batch.tail ../runs        # print progress of every run until Ctrl-C
+"""
+
+import os
+import io
+import sys
+import glob
+import time
+import warnings
+
+import numpy as np
+
+from batch.loader import read_mesa_header, rows_to_table, collapse_restarts, select_columns
+
+
+class HistoryTail:
+    """Follow one history.data file, parsing only newly appended rows on each poll."""
+
+    def __init__(self, path, columns=None, initial_capacity=1024):
+        self.path = path
+        self.columns = list(columns) if columns is not None else None
+        self.initial_capacity = initial_capacity
+        self.reset()
+
+    def reset(self):
+        """Forget everything read so far."""
+        self.header = None
+        self.names = None
+        self.usecols = None
+        self.offset = 0
+        self.n_rows = 0
+        self.buffer = None
+        self._inode = None
+        self._last_line_start = None
+        self._last_line = None
+
+    def _file_replaced(self, f, st):
+        """True if the file was truncated, replaced or rewritten under us."""
+        if self._inode is not None and st.st_ino != self._inode:
+            return True
+        if st.st_size < self.offset:
+            return True
+        if self._last_line is not None:
+            f.seek(self._last_line_start)
+            if f.read(len(self._last_line)) != self._last_line:
+                return True
+        return False
+
+    def _read_header(self, f):
+        header_lines = [f.readline() for _ in range(6)]
+        if not header_lines[-1].endswith(b"\n"):
+            return False  # header not completely written yet
+
+        header, names = read_mesa_header(io.StringIO(b"".join(header_lines).decode()))
+        self.usecols = select_columns(names, self.columns)
+        self.header = header
+        self.names = [names[i] for i in self.usecols]
+        self.buffer = np.empty((self.initial_capacity, len(self.names)))
+        self.offset = f.tell()
+        return True
+
+    def _append(self, rows):
+        needed = self.n_rows + len(rows)
+        if needed > len(self.buffer):
+            capacity = max(needed, 2 * len(self.buffer))
+            grown = np.empty((capacity, self.buffer.shape[1]))
+            grown[:self.n_rows] = self.buffer[:self.n_rows]
+            self.buffer = grown
+        self.buffer[self.n_rows:needed] = rows
+        self.n_rows = needed
+
+    def poll(self):
+        """
+        Parse any rows appended since the last call.
+
+        Returns the number of new rows. A missing file or an incomplete trailing line is
+        not an error; they are picked up on a later poll.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return 0
+
+        with f:
+            st = os.fstat(f.fileno())
+            if self.header is not None and self._file_replaced(f, st):
+                self.reset()
+            self._inode = st.st_ino
+
+            if self.header is None:
+                f.seek(0)
+                if not self._read_header(f):
+                    return 0
+
+            f.seek(self.offset)
+            chunk = f.read()
+
+        # Only parse complete lines; a partially written row is left for next time
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            return 0
+        chunk = chunk[:end]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            rows = np.loadtxt(io.StringIO(chunk.decode()), usecols=self.usecols, ndmin=2)
+
+        last_start = chunk.rfind(b"\n", 0, end - 1) + 1
+        self._last_line_start = self.offset + last_start
+        self._last_line = chunk[last_start:]
+        self.offset += end
+
+        if rows.size:
+            self._append(rows)
+        return len(rows)
+
+    @property
+    def table(self):
+        """
+        Rows read so far as a MesaTable, or None before the header is read.
+
+        This is a view of the buffer unless a restart made model_number backtrack, in
+        which case the superseded rows are dropped from a copy.
+        """
+        if self.header is None:
+            return None
+        return collapse_restarts(rows_to_table(self.buffer[:self.n_rows], self.names, self.header))
+
+
+def tail_runs(run_dirs, columns=None):
+    """Create a HistoryTail for each run directory, keyed by run name."""
+    return {os.path.basename(os.path.normpath(d)): HistoryTail(os.path.join(d, "LOGS", "history.data"), columns)
+            for d in run_dirs}
+
+
+def main():
+    batch_runs_dir = sys.argv[1] if len(sys.argv) > 1 else "../runs"
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    columns = ["model_number", "star_age", "center_h1", "log_Teff", "log_L"]
+
+    tails = {}
+    try:
+        while True:
+            for run_dir in glob.glob(os.path.join(batch_runs_dir, "*")):
+                if os.path.isdir(run_dir) and os.path.basename(run_dir) not in tails:
+                    tails.update(tail_runs([run_dir], columns))
+
+            for run_name, tail in sorted(tails.items()):
+                if tail.poll() == 0:
+                    continue
+                last = tail.table.data[-1]
+                print(f"{run_name}: model {int(last['model_number'])}, "
+                      f"age {last['star_age'] / 1e6:.3f} Myr, center_h1 {last['center_h1']:.4f}")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
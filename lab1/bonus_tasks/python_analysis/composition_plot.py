@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 import mesa_reader as mr
 import glob
 
+from batch.figure_cache import FigureCache
+from batch.render import show
+
 def plot_single_composition_profiles(logs_path="LOGS"):
     """Create composition profile plots for a single MESA run"""
     
@@ -58,7 +61,7 @@ def plot_single_composition_profiles(logs_path="LOGS"):
             plt.tight_layout()
             plt.savefig("plots/composition_profile.png", dpi=300)
             print(f"Saved composition profile to plots/composition_profile.png")
-            plt.show()
+            show()
         
         # Create the mixing plot
         plt.figure(figsize=(10, 8))
@@ -76,7 +79,7 @@ def plot_single_composition_profiles(logs_path="LOGS"):
             plt.tight_layout()
             plt.savefig("plots/mixing_profile.png", dpi=300)
             print(f"Saved mixing profile to plots/mixing_profile.png")
-            plt.show()
+            show()
             
         return True
         
@@ -89,7 +92,9 @@ def main():
         # If not, try to use the batch runs if available
     if os.path.isdir("../../LOGS"):
         print("Found LOGS directory in current folder. Creating composition plots for single run.")
-        plot_single_composition_profiles("../../LOGS")
+        FigureCache("plots").render("single_composition", ["plots/composition_profile.png", "plots/mixing_profile.png"],
+                                    sorted(glob.glob("../../LOGS/profile*.data")),
+                                    plot_single_composition_profiles, ("../../LOGS",))
 
     if os.path.isdir("../runs"):
         print("Using batch runs directory structure.")
@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 import mesa_reader as mr
 import glob
 
+from batch.figure_cache import FigureCache
+from batch.render import show
+
 def plot_single_core_mass_evolution(logs_path="LOGS"):
     """Create core mass evolution plots for a single MESA run"""
     
@@ -60,7 +63,7 @@ def plot_single_core_mass_evolution(logs_path="LOGS"):
         plt.tight_layout()
         plt.savefig("plots/core_mass_evolution.png", dpi=300)
         print(f"Saved core mass evolution plot to plots/core_mass_evolution.png")
-        plt.show()
+        show()
         
         # Also make a fractional core mass plot if we have star mass info
         if hasattr(data, 'star_mass'):
@@ -82,7 +85,7 @@ def plot_single_core_mass_evolution(logs_path="LOGS"):
             plt.tight_layout()
             plt.savefig("plots/core_mass_fraction.png", dpi=300)
             print(f"Saved core mass fraction plot to plots/core_mass_fraction.png")
-            plt.show()
+            show()
             
         return True
         
@@ -94,7 +97,8 @@ def main():
     # First, check if we're in a directory with a single MESA run
     if os.path.isdir("../../LOGS"):
         print("Found LOGS directory in current folder. Creating core mass plots for single run.")
-        plot_single_core_mass_evolution("../../LOGS")
+        FigureCache("plots").render("single_core_mass", ["plots/core_mass_evolution.png", "plots/core_mass_fraction.png"],
+                                    ["../../LOGS/history.data"], plot_single_core_mass_evolution, ("../../LOGS",))
     
     # If not, try to use the batch runs if available
     if os.path.isdir("../runs"):
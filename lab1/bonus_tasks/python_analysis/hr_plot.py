@@ -7,6 +7,9 @@ from mpl_toolkits.mplot3d import Axes3D
 import mesa_reader as mr
 import glob
 
+from batch.figure_cache import FigureCache
+from batch.render import show
+
 def plot_single_hr_diagram(logs_path="LOGS"):
     """Create HR diagram for a single MESA run with evolutionary phase information"""
     
@@ -94,7 +97,7 @@ def plot_single_hr_diagram(logs_path="LOGS"):
         plt.tight_layout()
         plt.savefig("plots/hr_diagram.png", dpi=300)
         print(f"Saved HR diagram to plots/hr_diagram.png")
-        plt.show()
+        show()
         
         # Make a 3D age plot if age info exists
         if hasattr(data, 'star_age') and hasattr(data, 'log_Teff') and hasattr(data, 'log_L'):
@@ -144,7 +147,7 @@ def plot_single_hr_diagram(logs_path="LOGS"):
             
             plt.savefig("plots/hr_diagram_3d.png", dpi=300)
             print(f"Saved 3D HR diagram to plots/hr_diagram_3d.png")
-            plt.show()
+            show()
             
         return True
         
@@ -158,7 +161,8 @@ def main():
     # First, check if we're in a directory with a single MESA run
     if os.path.isdir("../../LOGS"):
         print("Found LOGS directory in ../../LOGS folder. Creating HR diagram for single run.")
-        plot_single_hr_diagram("../../LOGS")
+        FigureCache("plots").render("single_hr_diagram", ["plots/hr_diagram.png", "plots/hr_diagram_3d.png"],
+                                    ["../../LOGS/history.data"], plot_single_hr_diagram, ("../../LOGS",))
 
     if os.path.isdir("../runs"):
         print("Using batch runs directory structure.")
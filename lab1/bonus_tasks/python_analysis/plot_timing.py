@@ -9,37 +9,30 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import os
 
+from batch.catalog import RunCatalog
+from batch.render import show
+
 # Load timing data
 df_timing = pd.read_csv("../run_timings.csv")
 plots_dir = "plots"
+os.makedirs(plots_dir, exist_ok=True)
 
-# Extract parameters from filenames
+# Look up run parameters in the run catalogue (falls back to parsing the inlist name)
+catalog = RunCatalog("../runs")
 data = []
 for _, row in df_timing.iterrows():
-    filename = row['inlist_name']
-    parts = filename.replace('inlist_M', '').split('_')
-    
-    mass = float(parts[0])
-    metallicity = float(parts[1][1:])  # Remove 'Z'
-    
-    if 'noovs' in filename:
-        scheme = 'none'
-        fov = 0.0
-        f0 = 0.0
-    else:
-        scheme = parts[2]
-        fov = float(parts[3][3:])  # Remove 'fov'
-        f0 = float(parts[4][2:])  # Remove 'f0'
-    
-    runtime = row['runtime_seconds']
+    params = catalog.lookup(row['inlist_name'])
+    if params is None:
+        print(f"Skipping {row['inlist_name']}: not a batch run name")
+        continue
     
     data.append({
-        'mass': mass,
-        'metallicity': metallicity,
-        'scheme': scheme,
-        'fov': fov,
-        'f0': f0,
-        'runtime_seconds': runtime
+        'mass': params['mass'],
+        'metallicity': params['metallicity'],
+        'scheme': params['scheme'],
+        'fov': params['fov'],
+        'f0': params['f0'],
+        'runtime_seconds': row['runtime_seconds']
     })
 
 # Create DataFrame
@@ -70,8 +63,8 @@ ax.set_xlabel('Mass (M☉)')
 ax.set_ylabel('Overshooting Parameter (fov)')
 ax.set_zlabel('Runtime (seconds)')
 ax.legend()
-plt.show()
 plt.savefig(plots_dir + "/runtime_3d_plot.png", dpi=300)
+show()
 
 # 2D Plot with color showing runtime
 plt.figure(figsize=(12, 8))
@@ -94,6 +87,6 @@ plt.colorbar(scatter, label='Runtime (seconds)')
 plt.xlabel('Mass (M☉)')
 plt.ylabel('Metallicity (Z)')
 plt.legend()
-plt.show()
 plt.savefig(plots_dir + "/runtime_2d_plot.png", dpi=300)
+show()
 